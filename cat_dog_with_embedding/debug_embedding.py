@@ -12,8 +12,8 @@ import numpy as np
 
 # Test embedding generation
 service = FaceEmbeddingService()
-print(f"Model loaded: {service.model is not None}")
-print(f"Model name: {service.model}")
+print(f"Model loaded: {service.model_pool is not None}")
+print(f"Model pool: {service.model_pool.stats()}")
 
 # Create a dummy face crop
 dummy_face = np.ones((100, 100, 3), dtype=np.uint8) * 128  # Gray image
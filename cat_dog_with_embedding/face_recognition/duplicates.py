@@ -0,0 +1,116 @@
+import logging
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+
+from .snapshot import EmbeddingSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+# Field grouping the rows of one registration; pairs within a group are not duplicates
+OWNER_FIELDS = {
+    'face_embedding': 'pet_id',
+    'face_vector': 'project_id',
+    'face_project': None,
+}
+
+
+def count_tiles(rows: int, tile_size: int) -> int:
+    """Get the number of tiles covering the upper triangle of a rows x rows similarity matrix"""
+    blocks = -(-rows // tile_size)
+    return blocks * (blocks + 1) // 2
+
+
+def iter_tiles(rows: int, tile_size: int, start: int = 0) -> Iterator[Tuple[int, int]]:
+    """
+    Yield the (block a, block b) tiles of the upper triangle, a <= b, in a fixed order
+    
+    Args:
+        rows: Number of rows
+        tile_size: Rows per block
+        start: Number of tiles to skip (the checkpoint of a resumed job)
+    """
+    blocks = -(-rows // tile_size)
+    number = 0
+    for a in range(blocks):
+        if number + blocks - a <= start:
+            number += blocks - a
+            continue
+        for b in range(a, blocks):
+            if number >= start:
+                yield a, b
+            number += 1
+
+
+_snapshots: Dict[str, EmbeddingSnapshot] = {}
+
+
+def open_scan_snapshot(path: str) -> EmbeddingSnapshot:
+    """Open a job's snapshot once per process; the memory map is shared through the page cache"""
+    snapshot = _snapshots.get(path)
+    if snapshot is None:
+        snapshot = _snapshots[path] = EmbeddingSnapshot(path)
+    return snapshot
+
+
+def init_scan_worker():
+    """Keep each tile worker's BLAS single-threaded, the parallelism comes from the processes"""
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(1)
+
+
+def scan_tile(path: str, tile_size: int, threshold: float, tile: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find the row pairs of one tile whose cosine similarity reaches the threshold
+    
+    Only the pairs above the threshold leave the tile, so the memory per
+    worker stays at one tile_size x tile_size block. Pairs of different
+    known pet types are never duplicates and are masked out.
+    
+    Args:
+        path: Snapshot file of the job
+        tile_size: Rows per block
+        threshold: Minimum cosine similarity
+        tile: (block a, block b) with a <= b
+        
+    Returns:
+        Row numbers a, row numbers b (a < b) and similarities of the pairs
+    """
+    snapshot = open_scan_snapshot(path)
+    a_start, b_start = tile[0] * tile_size, tile[1] * tile_size
+    a_end, b_end = min(a_start + tile_size, snapshot.count), min(b_start + tile_size, snapshot.count)
+    
+    # Rows are ordered by pet type, so whole tiles of one cat and one dog block can be skipped
+    a_types = snapshot.pet_types[a_start:a_end]
+    b_types = snapshot.pet_types[b_start:b_end]
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+    if a_types[0] == a_types[-1] != 0 and b_types[0] == b_types[-1] != 0 and a_types[0] != b_types[0]:
+        return empty
+    
+    scores = np.asarray(snapshot.vectors[a_start:a_end]) @ np.asarray(snapshot.vectors[b_start:b_end]).T
+    mask = scores >= threshold
+    if tile[0] == tile[1]:
+        # Diagonal tile: each pair once, and not a row with itself
+        mask &= np.triu(np.ones(mask.shape, dtype=bool), k=1)
+    mask &= (a_types[:, None] == b_types[None, :]) | (a_types[:, None] == 0) | (b_types[None, :] == 0)
+    
+    rows_a, rows_b = np.nonzero(mask)
+    if not len(rows_a):
+        return empty
+    return rows_a + a_start, rows_b + b_start, scores[rows_a, rows_b].astype(np.float32)
+
+
+def scan_tile_task(args) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Pool.imap entry point for scan_tile"""
+    return scan_tile(*args)
+
+
+def snapshot_ids(path: str, rows: np.ndarray) -> list:
+    """Get the object ids of some rows of a job's snapshot"""
+    snapshot = open_scan_snapshot(path)
+    return [object_id.decode() for object_id in snapshot.ids[rows].tolist()]
+
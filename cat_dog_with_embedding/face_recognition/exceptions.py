@@ -0,0 +1,29 @@
+import logging
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import exception_handler as drf_exception_handler
+
+from .model_pool import PoolTimeout
+
+logger = logging.getLogger(__name__)
+
+
+def exception_handler(exc, context):
+    """
+    DRF exception handler that answers 503 when no model replica was free
+    
+    Views let PoolTimeout through their generic error handling, so every
+    endpoint that runs a model tells the client to retry instead of failing.
+    """
+    if isinstance(exc, PoolTimeout):
+        logger.warning(f"{context['view'].__class__.__name__} timed out waiting for a model: {exc}")
+        response = Response({
+            'error': 'The service is busy',
+            'message': 'Please try again in a moment'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = str(settings.MODEL_POOL['RETRY_AFTER'])
+        return response
+    
+    return drf_exception_handler(exc, context)
@@ -0,0 +1,350 @@
+import os
+import json
+import heapq
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class HNSWIndex:
+    """
+    Hierarchical Navigable Small World graph for approximate cosine search
+    
+    Pure NumPy implementation of Malkov & Yashunin's HNSW. Vectors are stored
+    L2-normalized, so the distance is 1 - dot product. Deletes are soft: the
+    node keeps routing searches but is never returned, until the graph is
+    rebuilt.
+    
+    The first nodes can be the rows of a shared matrix (add_base), e.g. a
+    memory-mapped snapshot: their vectors are read from it rather than
+    copied, and only the vectors of nodes added later are held privately.
+    
+    Args:
+        dimension: Vector dimension
+        m: Links per node on the upper layers (2 * m on layer 0)
+        ef_construction: Candidate list size while inserting
+        ef_search: Default candidate list size while searching
+        seed: Seed for the level generator
+    """
+    
+    def __init__(self, dimension: int, m: int = 16, ef_construction: int = 200,
+                 ef_search: int = 64, seed: int = 0):
+        self.dimension = dimension
+        self.m = m
+        self.m0 = 2 * m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_mult = 1 / np.log(max(m, 2))
+        self._rng = np.random.default_rng(seed)
+        
+        self._base: Optional[np.ndarray] = None
+        self._base_count = 0
+        self.base_version = None
+        self._vectors = np.zeros((0, dimension), dtype=np.float32)  # Nodes after the base
+        self._deleted = np.zeros(0, dtype=bool)
+        self._ids: List[str] = []
+        self._nodes: Dict[str, int] = {}
+        self._links: List[List[List[int]]] = []
+        self._count = 0
+        
+        self.entry_point = -1
+        self.max_level = -1
+        
+        # Change log position the graph reflects, maintained by the owner
+        self.last_seq = 0
+    
+    def __len__(self):
+        return len(self._nodes)
+    
+    def __contains__(self, object_id: str):
+        return object_id in self._nodes
+    
+    @property
+    def deleted_ratio(self) -> float:
+        return (self._count - len(self._nodes)) / self._count if self._count else 0.0
+    
+    def vector_of(self, node: int) -> np.ndarray:
+        if node < self._base_count:
+            return np.asarray(self._base[node], dtype=np.float32)
+        return self._vectors[node - self._base_count]
+    
+    def vectors_of(self, nodes: List[int]) -> np.ndarray:
+        nodes = np.asarray(nodes, dtype=np.int64)
+        if not self._base_count:
+            return self._vectors[nodes]
+        in_base = nodes < self._base_count
+        if in_base.all():
+            return np.asarray(self._base[nodes], dtype=np.float32)
+        vectors = np.empty((len(nodes), self.dimension), dtype=np.float32)
+        vectors[in_base] = self._base[nodes[in_base]]
+        vectors[~in_base] = self._vectors[nodes[~in_base] - self._base_count]
+        return vectors
+    
+    def _distances(self, query: np.ndarray, nodes: List[int]) -> np.ndarray:
+        return 1.0 - self.vectors_of(nodes) @ query
+    
+    def _search_layer(self, query: np.ndarray, entry_points: List[int], ef: int, level: int) -> List[Tuple[float, int]]:
+        """Greedy beam search on one layer, returning up to ef (distance, node) pairs, closest first"""
+        visited = set(entry_points)
+        distances = self._distances(query, entry_points).tolist()
+        candidates = list(zip(distances, entry_points))
+        heapq.heapify(candidates)
+        results = [(-distance, node) for distance, node in candidates]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+        
+        while candidates:
+            distance, node = heapq.heappop(candidates)
+            if distance > -results[0][0] and len(results) >= ef:
+                break
+            
+            neighbors = [n for n in self._links[node][level] if n not in visited]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+            
+            for neighbor, neighbor_distance in zip(neighbors, self._distances(query, neighbors).tolist()):
+                if len(results) < ef or neighbor_distance < -results[0][0]:
+                    heapq.heappush(candidates, (neighbor_distance, neighbor))
+                    heapq.heappush(results, (-neighbor_distance, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        
+        return sorted((-distance, node) for distance, node in results)
+    
+    def _select_neighbors(self, candidates: List[Tuple[float, int]], m: int) -> List[int]:
+        """
+        Pick up to m links from (distance, node) candidates sorted closest first
+        
+        Uses the paper's heuristic: a candidate is skipped when it is closer to
+        an already selected neighbour than to the new node, which keeps links
+        spread across clusters. Skipped candidates fill any remaining slots.
+        """
+        selected = []
+        skipped = []
+        for distance, node in candidates:
+            if len(selected) >= m:
+                break
+            if selected and (1.0 - self.vectors_of(selected) @ self.vector_of(node) < distance).any():
+                skipped.append(node)
+                continue
+            selected.append(node)
+        
+        return selected + skipped[:m - len(selected)]
+    
+    def _new_node(self, object_id: str) -> int:
+        """Allocate the next node for an object"""
+        node = self._count
+        if node >= len(self._deleted):
+            deleted = np.zeros(max(1024, 2 * len(self._deleted)), dtype=bool)
+            deleted[:self._count] = self._deleted[:self._count]
+            self._deleted = deleted
+        if node >= self._base_count and node - self._base_count >= len(self._vectors):
+            vectors = np.zeros((max(1024, 2 * len(self._vectors)), self.dimension), dtype=np.float32)
+            vectors[:len(self._vectors)] = self._vectors
+            self._vectors = vectors
+        
+        self._ids.append(object_id)
+        self._nodes[object_id] = node
+        self._count += 1
+        return node
+    
+    def add_base(self, vectors: np.ndarray, object_ids: List[str], version=None):
+        """
+        Insert the rows of a shared matrix, in order, as the first nodes of an empty graph
+        
+        The graph keeps reading the vectors from the matrix. save() stores
+        `version` instead of them, and a loaded graph needs attach_base() with
+        the same matrix before it is used.
+        
+        Args:
+            vectors: (n, dimension) L2-normalized rows, e.g. a snapshot memory map
+            object_ids: Id of each row
+            version: Identifies the matrix, checked by whoever attaches it later
+        """
+        if self._count:
+            raise ValueError('Base rows must be added to an empty graph')
+        
+        self.dimension = vectors.shape[1]
+        self._base = vectors
+        self._base_count = len(object_ids)
+        self.base_version = version
+        self._vectors = np.zeros((0, self.dimension), dtype=np.float32)
+        
+        for object_id in object_ids:
+            node = self._new_node(object_id)
+            self._link(node, self.vector_of(node))
+    
+    def attach_base(self, vectors: np.ndarray):
+        """Give a loaded graph the shared matrix it was built over"""
+        if len(vectors) < self._base_count or (self._base_count and vectors.shape[1] != self.dimension):
+            raise ValueError(f"Base matrix {vectors.shape} does not match the graph's {self._base_count} base rows")
+        self._base = vectors
+    
+    def add(self, object_id: str, vector: np.ndarray):
+        """Insert a vector, replacing any previous vector with the same id"""
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        
+        existing = self._nodes.get(object_id)
+        if existing is not None:
+            if np.allclose(self.vector_of(existing), vector):
+                return
+            self.remove(object_id)
+        
+        if not self._count and vector.shape[0] != self.dimension:
+            # Created empty before the dimension was known
+            self.dimension = vector.shape[0]
+            self._vectors = np.zeros((0, self.dimension), dtype=np.float32)
+        
+        node = self._new_node(object_id)
+        self._vectors[node - self._base_count] = vector
+        self._link(node, vector)
+    
+    def _link(self, node: int, vector: np.ndarray):
+        """Draw a level for a new node and connect it on every layer up to it"""
+        level = int(-np.log(1.0 - self._rng.random()) * self.level_mult)
+        self._links.append([[] for _ in range(level + 1)])
+        
+        if self.entry_point < 0:
+            self.entry_point = node
+            self.max_level = level
+            return
+        
+        entry_points = [self.entry_point]
+        for layer in range(self.max_level, level, -1):
+            entry_points = [self._search_layer(vector, entry_points, 1, layer)[0][1]]
+        
+        for layer in range(min(level, self.max_level), -1, -1):
+            candidates = self._search_layer(vector, entry_points, self.ef_construction, layer)
+            max_links = self.m0 if layer == 0 else self.m
+            
+            neighbors = self._select_neighbors(candidates, self.m)
+            self._links[node][layer] = neighbors
+            
+            for neighbor in neighbors:
+                links = self._links[neighbor][layer]
+                links.append(node)
+                if len(links) > max_links:
+                    distances = self._distances(self.vector_of(neighbor), links)
+                    order = np.argsort(distances)
+                    self._links[neighbor][layer] = self._select_neighbors(
+                        [(distances[i], links[i]) for i in order], max_links
+                    )
+            
+            entry_points = [n for _, n in candidates]
+        
+        if level > self.max_level:
+            self.entry_point = node
+            self.max_level = level
+    
+    def remove(self, object_id: str):
+        """Soft-delete a vector; its node keeps routing searches"""
+        node = self._nodes.pop(object_id, None)
+        if node is not None:
+            self._deleted[node] = True
+    
+    def search(self, query: np.ndarray, k: int = 10, ef: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        Find approximate nearest neighbours
+        
+        Args:
+            query: Query vector
+            k: Number of results
+            ef: Candidate list size, defaults to ef_search (never below k)
+            
+        Returns:
+            List of (object_id, cosine similarity) pairs, most similar first
+        """
+        if not self._nodes:
+            return []
+        
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        query = query / (np.linalg.norm(query) or 1.0)
+        
+        entry_points = [self.entry_point]
+        for layer in range(self.max_level, 0, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, layer)[0][1]]
+        
+        ef = max(ef or self.ef_search, k)
+        while True:
+            found = self._search_layer(query, entry_points, ef, 0)
+            hits = [(self._ids[node], 1.0 - distance) for distance, node in found if not self._deleted[node]]
+            # Deleted nodes take up candidate slots; widen the beam until k live ones are found
+            if len(hits) >= k or ef >= self._count:
+                return hits[:k]
+            ef *= 2
+    
+    def save(self, path: str):
+        """Write the graph to an .npz file, atomically replacing any previous one"""
+        levels = np.array([len(links) for links in self._links], dtype=np.int32)
+        flat = [layer_links for links in self._links for layer_links in links]
+        offsets = np.cumsum([0] + [len(layer_links) for layer_links in flat]).astype(np.int64)
+        data = np.array([n for layer_links in flat for n in layer_links], dtype=np.int32)
+        meta = {
+            'dimension': self.dimension,
+            'm': self.m,
+            'ef_construction': self.ef_construction,
+            'ef_search': self.ef_search,
+            'entry_point': self.entry_point,
+            'max_level': self.max_level,
+            'last_seq': self.last_seq,
+            'base_count': self._base_count,
+            'base_version': self.base_version,
+        }
+        
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(
+                    f,
+                    meta=np.array(json.dumps(meta)),
+                    vectors=self._vectors[:self._count - self._base_count],
+                    deleted=self._deleted[:self._count],
+                    ids=np.array(self._ids, dtype=str),
+                    levels=levels,
+                    offsets=offsets,
+                    links=data,
+                )
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+    
+    @classmethod
+    def load(cls, path: str) -> 'HNSWIndex':
+        """Read a graph written by save(); one with base rows then needs attach_base()"""
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            index = cls(meta['dimension'], meta['m'], meta['ef_construction'], meta['ef_search'])
+            index._vectors = data['vectors'].astype(np.float32)
+            index._base_count = meta.get('base_count', 0)
+            index.base_version = meta.get('base_version')
+            index._deleted = data['deleted'].astype(bool)
+            index._ids = data['ids'].tolist()
+            levels = data['levels']
+            offsets = data['offsets']
+            links = data['links'].tolist()
+        
+        index._count = len(index._ids)
+        index._nodes = {
+            object_id: node for node, object_id in enumerate(index._ids) if not index._deleted[node]
+        }
+        
+        position = 0
+        for level_count in levels.tolist():
+            node_links = []
+            for _ in range(level_count):
+                node_links.append(links[offsets[position]:offsets[position + 1]])
+                position += 1
+            index._links.append(node_links)
+        
+        index.entry_point = meta['entry_point']
+        index.max_level = meta['max_level']
+        index.last_seq = meta['last_seq']
+        return index
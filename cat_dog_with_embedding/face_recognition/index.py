@@ -0,0 +1,1137 @@
+import os
+import time
+import tempfile
+import heapq
+import itertools
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import EmbeddingChangeLog
+from .snapshot import EmbeddingSnapshot, PET_TYPE_CODES, get_snapshot_identity, file_identity
+from .hnsw import HNSWIndex
+from .quantization import load_quantizer
+from .sketch import compute_sketches, hamming_distances, max_hamming_distance
+from .similarity import normalize_rows, similarities
+
+logger = logging.getLogger(__name__)
+
+
+# Model, row filter, pet type field and vector field behind each change log source
+INDEX_SOURCES = {
+    'face_embedding': ('face_recognition.FaceEmbedding', {'status': 'completed'}, 'pet__pet_type', 'embedding_vector'),
+    'face_vector': ('simple_face_id.FaceVector', {}, 'project__species', 'embedding_vector'),
+    'face_project': ('simple_face_id.FaceProject', {'status': 'completed'}, 'species', 'centroid_vector'),
+}
+
+
+def merge_top_k(rows: np.ndarray, scores: np.ndarray, block_rows: np.ndarray,
+                block_scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge one block of (rows, queries) scores into the running top-k of every query
+    
+    Args:
+        rows: (<= k, queries) row numbers kept so far
+        scores: (<= k, queries) their scores
+        block_rows: (n,) row numbers of the block
+        block_scores: (n, queries) scores of the block
+        k: Results kept per query
+        
+    Returns:
+        The updated (rows, scores), unordered within each column
+    """
+    rows = np.concatenate([rows, np.broadcast_to(block_rows[:, None], block_scores.shape)])
+    scores = np.concatenate([scores, block_scores])
+    if len(scores) > k:
+        keep = np.argpartition(-scores, k - 1, axis=0)[:k]
+        rows = np.take_along_axis(rows, keep, axis=0)
+        scores = np.take_along_axis(scores, keep, axis=0)
+    return rows, scores
+
+
+class EmbeddingIndex:
+    """
+    In-memory cosine similarity index over one embedding table
+    
+    The bulk of the vectors comes from the node's memory-mapped snapshot file
+    (shared by all workers through the page cache), or from the database when
+    there is no usable snapshot. On top of that base each worker keeps a small
+    private delta: at most every POLL_INTERVAL seconds it fetches the
+    EmbeddingChangeLog entries written since the last sequence number it has
+    applied, appends upserted rows and tombstones removed ones.
+    
+    Rows are numbered base first, then delta. Base rows are ordered by pet
+    type, so a search restricted to one pet type (see PET_TYPE_CODES) scans
+    contiguous slices of the base and masks the delta. Rows of unknown type
+    (e.g. projects registered before species were recorded) are included in
+    every pet type.
+    
+    With the 'hnsw' backend searches go through an HNSW graph, loaded from the
+    file written by `manage.py build_hnsw_index` and kept current with the
+    same change log entries; the exact rows stay available as a fallback and
+    as the recall oracle (search_exact).
+    
+    With QUANTIZATION set to 'sq8' or 'pq' the scan runs over compact codes
+    (trained by `manage.py train_quantizers`) and only the best candidates are
+    re-scored with their float vectors. The memory saving needs a snapshot:
+    its float vectors are paged in lazily from the shared memory map and its
+    codes are memory-mapped from the file written next to the codebook, so a
+    worker privately holds only the codes of rows changed since. Loaded from
+    the database, the float rows stay resident and the codes are encoded in
+    every worker.
+    
+    Threshold searches (search_above) shortlist rows by the Hamming distance
+    of their sign sketches and exactly score only the shortlist. Base
+    sketches come from the snapshot, or are computed on first use.
+    """
+    
+    def __init__(self, source: str, backend: Optional[str] = None, quantization: Optional[str] = None):
+        if source not in INDEX_SOURCES:
+            raise ValueError(f"Unknown index source: {source}")
+        
+        self.source = source
+        self.backend = backend or settings.EMBEDDING_INDEX['BACKEND']
+        self.quantization = quantization or settings.EMBEDDING_INDEX['QUANTIZATION']
+        self.model_label, self.row_filter, self.pet_type_field, self.vector_field = INDEX_SOURCES[source]
+        
+        self._lock = threading.RLock()
+        self.snapshot: Optional[EmbeddingSnapshot] = None
+        self._snapshot_identity = None
+        self.graph: Optional[HNSWIndex] = None
+        self._graph_identity = None
+        self.quantizer = None
+        self.reset_rows(np.zeros((0, 0), dtype=np.float32), [], np.zeros(0, dtype=np.uint8))
+        
+        self.last_seq = 0
+        self._loaded = False
+        self._warming = False
+        self._last_poll = 0.0
+    
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+    
+    def __len__(self):
+        return self._base_count + self._size - self._dead
+    
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+    
+    @property
+    def dimension(self) -> int:
+        return self._base.shape[1] if self._base_count else self._vectors.shape[1]
+    
+    def reset_rows(self, base: np.ndarray, base_ids, base_pet_types: np.ndarray,
+                   base_codes: Optional[np.ndarray] = None):
+        """Replace the base rows (ordered by pet type) and clear the delta; base codes are encoded unless given"""
+        self._base = base
+        self._base_ids = base_ids
+        self._base_count = len(base_ids)
+        self._base_rows: Optional[Dict[str, int]] = None
+        self._base_pet_types = base_pet_types
+        self._partitions = {
+            code: (int(np.searchsorted(base_pet_types, code, 'left')),
+                   int(np.searchsorted(base_pet_types, code, 'right')))
+            for code in [0] + list(PET_TYPE_CODES.values())
+        }
+        
+        self._vectors = np.zeros((0, base.shape[1]), dtype=np.float32)
+        self._pet_types = np.zeros(0, dtype=np.uint8)
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._size = 0
+        
+        self._alive = np.ones(self._base_count, dtype=bool)
+        self._dead = 0
+        self._base_dead = 0
+        
+        self._base_sketches: Optional[np.ndarray] = None
+        self._sketches = np.zeros((0, settings.SIGN_SKETCH['BITS'] // 64), dtype=np.uint64)
+        
+        if self.quantizer is not None and self._base_count and self.quantizer.dimension != base.shape[1]:
+            logger.warning(f"Ignoring {self.source} {self.quantizer.kind} codebook with dimension {self.quantizer.dimension}")
+            self.quantizer = None
+        if self.quantizer is not None:
+            self._codes = np.zeros((0, self.quantizer.code_size), dtype=np.uint8)
+            if base_codes is None:
+                base_codes = np.zeros((self._base_count, self.quantizer.code_size), dtype=np.uint8)
+                for start in range(0, self._base_count, 65536):
+                    base_codes[start:start + 65536] = self.quantizer.encode(base[start:start + 65536])
+            self._base_codes = base_codes
+    
+    def base_id(self, row: int) -> str:
+        object_id = self._base_ids[row]
+        return object_id.decode() if isinstance(object_id, bytes) else object_id
+    
+    def find_row(self, object_id: str) -> Optional[int]:
+        """Get the live row of an object, if it is indexed"""
+        row = self._rows.get(object_id)
+        if row is not None:
+            return row
+        
+        if self._base_rows is None:
+            # Built on first use so opening a snapshot stays O(1)
+            self._base_rows = {self.base_id(row): row for row in range(self._base_count)}
+        row = self._base_rows.get(object_id)
+        if row is not None and self._alive[row]:
+            return row
+        return None
+    
+    def vector_at(self, row: int) -> np.ndarray:
+        if row < self._base_count:
+            return np.asarray(self._base[row])
+        return self._vectors[row - self._base_count]
+    
+    def vectors_at(self, rows: np.ndarray) -> np.ndarray:
+        """Get the vectors of several rows; base rows are only read from the snapshot here"""
+        in_base = rows < self._base_count
+        vectors = np.empty((len(rows), self.dimension), dtype=np.float32)
+        vectors[in_base] = self._base[rows[in_base]]
+        vectors[~in_base] = self._vectors[rows[~in_base] - self._base_count]
+        return vectors
+    
+    def pet_type_at(self, row: int) -> int:
+        if row < self._base_count:
+            return int(self._base_pet_types[row])
+        return int(self._pet_types[row - self._base_count])
+    
+    def pet_type_codes(self, pet_type: str) -> Tuple[int, ...]:
+        """Get the pet type codes a search restricted to one pet type covers"""
+        code = PET_TYPE_CODES.get(pet_type, 0)
+        return (0, code) if code else (0,)
+    
+    def scan_ranges(self, pet_type: Optional[str]) -> Tuple[List[Tuple[int, int]], np.ndarray]:
+        """
+        Get the rows a search restricted to one pet type has to score
+        
+        Returns:
+            (start, end) slices of the base and the mask of live delta rows
+            to score; all live rows when pet_type is None
+        """
+        delta_alive = self._alive[self._base_count:self._base_count + self._size]
+        if pet_type is None:
+            return [(0, self._base_count)], delta_alive
+        
+        codes = self.pet_type_codes(pet_type)
+        ranges = [self._partitions[code] for code in codes]
+        return ranges, delta_alive & np.isin(self._pet_types[:self._size], codes)
+    
+    def vectors_for(self, object_ids: List[str]) -> Tuple[List[str], np.ndarray]:
+        """
+        Get the indexed vectors of some objects
+        
+        Returns:
+            The ids that are indexed and their (n, dimension) vectors
+        """
+        self.refresh()
+        
+        with self._lock:
+            found = []
+            rows = []
+            for object_id in object_ids:
+                row = self.find_row(object_id)
+                if row is not None:
+                    found.append(object_id)
+                    rows.append(row)
+            if not rows:
+                return [], np.zeros((0, self.dimension), dtype=np.float32)
+            return found, self.vectors_at(np.array(rows))
+    
+    def live_rows(self):
+        """Yield (object_id, vector) for every row that is not tombstoned"""
+        for row in np.flatnonzero(self._alive[:self._base_count + self._size]).tolist():
+            yield self.object_id(row), self.vector_at(row)
+    
+    def fetch_vectors(self, object_ids: Optional[List[str]] = None):
+        """Yield (id, vector, pet type code) for indexable rows, optionally restricted to some ids"""
+        queryset = self.model.objects.filter(**self.row_filter)
+        if object_ids is not None:
+            queryset = queryset.filter(pk__in=object_ids)
+        
+        fields = ['pk', self.vector_field, self.pet_type_field] if self.pet_type_field else ['pk', self.vector_field]
+        for row in queryset.values_list(*fields).iterator(chunk_size=1000):
+            if row[1]:
+                pet_type = PET_TYPE_CODES.get(row[2], 0) if self.pet_type_field else 0
+                yield str(row[0]), np.asarray(row[1], dtype=np.float32), pet_type
+    
+    def load(self):
+        """Rebuild the index from the snapshot file, or from the database without one"""
+        snapshot = EmbeddingSnapshot.open(self.source)
+        self._snapshot_identity = snapshot.identity if snapshot is not None else None
+        reason = snapshot.unusable_reason() if snapshot is not None else None
+        if reason:
+            logger.warning(f"Ignoring {self.source} snapshot {reason}")
+            snapshot = None
+        
+        self.graph = None
+        self.quantizer = self.load_quantizer()
+        if snapshot is not None:
+            self.load_snapshot(snapshot)
+        else:
+            self.load_database()
+        self.attach_graph()
+    
+    def load_snapshot(self, snapshot: EmbeddingSnapshot):
+        """Use a snapshot as the base and catch up from its sequence number"""
+        with self._lock:
+            self.snapshot = snapshot
+            self.reset_rows(snapshot.vectors, snapshot.ids, snapshot.pet_types, self.load_codes(snapshot))
+            self.last_seq = snapshot.last_seq
+            self._loaded = True
+            self._last_poll = 0.0
+            
+            logger.info(f"Opened {self.source} snapshot {snapshot.version}: {len(snapshot)} vectors up to seq {snapshot.last_seq}")
+            self.refresh(force=True)
+    
+    def load_database(self):
+        """Rebuild the index by reading every row from the database"""
+        start_time = time.time()
+        
+        # Read the log position first: anything written while the table is
+        # being read is replayed by the next refresh
+        last_seq = EmbeddingChangeLog.settled_seq(self.source)
+        
+        ids = []
+        vectors = []
+        pet_types = []
+        for object_id, vector, pet_type in self.fetch_vectors():
+            if vectors and vector.shape != vectors[0].shape:
+                logger.warning(f"Skipping {self.source} {object_id}: dimension {vector.shape[0]} != {vectors[0].shape[0]}")
+                continue
+            ids.append(object_id)
+            vectors.append(vector)
+            pet_types.append(pet_type)
+        
+        # Group the rows by pet type
+        order = np.argsort(np.array(pet_types, dtype=np.uint8), kind='stable')
+        pet_types = np.array(pet_types, dtype=np.uint8)[order]
+        ids = [ids[i] for i in order]
+        if vectors:
+            base = normalize_rows(np.vstack(vectors)[order]).astype(np.float32)
+        else:
+            base = np.zeros((0, 0), dtype=np.float32)
+        
+        with self._lock:
+            self.snapshot = None
+            self.reset_rows(base, ids, pet_types)
+            self.last_seq = last_seq
+            self._loaded = True
+            self._last_poll = time.monotonic()
+        
+        logger.info(f"Loaded {self.source} index: {len(ids)} vectors in {time.time() - start_time:.2f}s")
+    
+    def refresh(self, force: bool = False):
+        """
+        Apply change log entries written since the last refresh
+        
+        Polls at most every POLL_INTERVAL seconds unless forced, so a search
+        sees writes from other workers within that staleness window. Switches
+        to a newer snapshot when the file has been replaced.
+        """
+        config = settings.EMBEDDING_INDEX
+        
+        with self._lock:
+            now = time.monotonic()
+            if not self._loaded:
+                self.load()
+                return
+            
+            if not force and now - self._last_poll < config['POLL_INTERVAL']:
+                return
+            
+            if get_snapshot_identity(self.source) != self._snapshot_identity:
+                self.load()
+                return
+            
+            # Pick up a graph written (or rewritten) by build_hnsw_index
+            if self.backend == 'hnsw' and file_identity(get_graph_path(self.source)) != self._graph_identity:
+                self.graph = None
+                self.attach_graph()
+            
+            # Entries older than the retention may already be compacted away
+            if self._last_poll and now - self._last_poll > config['CHANGELOG_RETENTION_HOURS'] * 3600:
+                self.load()
+                return
+            
+            entries = list(
+                EmbeddingChangeLog.objects.filter(source=self.source, seq__gt=self.last_seq)
+                .order_by('seq')
+                .values_list('seq', 'object_id', 'operation')[:config['MAX_CHANGES'] + 1]
+            )
+            self._last_poll = now
+            
+            if not entries:
+                return
+            
+            if len(entries) > config['MAX_CHANGES']:
+                logger.info(f"{self.source} index is more than {config['MAX_CHANGES']} changes behind, reloading")
+                self.graph = None
+                self.load_database()
+                self.attach_graph()
+                return
+            
+            if any(operation == 'reset' for _, _, operation in entries):
+                # Every row changed at once (embedding model swap)
+                logger.info(f"{self.source} index was reset, reloading")
+                self.graph = None
+                self.load_database()
+                self.attach_graph()
+                return
+            
+            self.apply_changes(entries)
+    
+    def apply_changes(self, entries: List[Tuple[int, str, str]]):
+        """Apply a batch of (seq, object_id, operation) change log entries"""
+        # Read before the vectors, so nothing newer than what we fetch is skipped
+        settled_seq = EmbeddingChangeLog.settled_seq(self.source)
+        
+        # Only the last operation per object matters
+        latest = {}
+        for seq, object_id, operation in entries:
+            latest[object_id] = operation
+        
+        upserted = [object_id for object_id, operation in latest.items() if operation == 'upsert']
+        fetched = {object_id: (vector, pet_type) for object_id, vector, pet_type in self.fetch_vectors(upserted)} if upserted else {}
+        
+        for object_id in latest:
+            vector, pet_type = fetched.get(object_id, (None, 0))
+            if vector is None:
+                # Deleted, or no longer indexable (e.g. status changed)
+                self.remove(object_id)
+                if self.graph is not None:
+                    self.graph.remove(object_id)
+            else:
+                self.upsert(object_id, vector, pet_type)
+                if self.graph is not None:
+                    self.graph.add(object_id, vector)
+        
+        # Entries past the settled sequence number are re-read on the next
+        # poll in case an earlier one commits late; replaying them is harmless
+        self.last_seq = max(self.last_seq, min(entries[-1][0], settled_seq))
+        if self.graph is not None:
+            self.graph.last_seq = self.last_seq
+        
+        # Snapshot rows cannot be reclaimed until the next snapshot
+        reclaimable = self._dead - self._base_dead if self.snapshot is not None else self._dead
+        if reclaimable > max(1, len(self)) * settings.EMBEDDING_INDEX['COMPACT_RATIO']:
+            self.compact()
+        
+        logger.debug(f"Applied {len(entries)} changes to {self.source} index (seq {self.last_seq})")
+    
+    def upsert(self, object_id: str, vector: np.ndarray, pet_type: int = 0):
+        """Insert or replace the vector of an object"""
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        
+        if (self._base_count or self._size) and vector.shape[0] != self.dimension:
+            logger.warning(f"Skipping {self.source} {object_id}: dimension {vector.shape[0]} != {self.dimension}")
+            return
+        
+        row = self.find_row(object_id)
+        if row is not None and row < self._base_count:
+            # Base rows are read-only: shadow the old one with a delta row
+            self.remove(object_id)
+            row = None
+        
+        if row is None:
+            if self._size >= self._vectors.shape[0]:
+                self.grow(vector.shape[0])
+            row = self._base_count + self._size
+            self._ids.append(object_id)
+            self._rows[object_id] = row
+            self._size += 1
+        
+        self._vectors[row - self._base_count] = vector
+        self._sketches[row - self._base_count] = compute_sketches(vector)[0]
+        self._pet_types[row - self._base_count] = pet_type
+        self._alive[row] = True
+        if self.quantizer is not None:
+            self._codes[row - self._base_count] = self.quantizer.encode(vector)[0]
+    
+    def remove(self, object_id: str):
+        """Tombstone an object's row until the next compaction"""
+        row = self.find_row(object_id)
+        if row is not None:
+            self._rows.pop(object_id, None)
+            self._alive[row] = False
+            self._dead += 1
+            if row < self._base_count:
+                self._base_dead += 1
+    
+    def grow(self, dimension: int):
+        """Double the delta row capacity"""
+        capacity = max(64, self._vectors.shape[0] * 2)
+        vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        sketches = np.zeros((capacity, self._sketches.shape[1]), dtype=np.uint64)
+        sketches[:self._size] = self._sketches[:self._size]
+        pet_types = np.zeros(capacity, dtype=np.uint8)
+        pet_types[:self._size] = self._pet_types[:self._size]
+        alive = np.zeros(self._base_count + capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._vectors = vectors
+        self._sketches = sketches
+        self._pet_types = pet_types
+        self._alive = alive
+        if self.quantizer is not None:
+            codes = np.zeros((capacity, self.quantizer.code_size), dtype=np.uint8)
+            codes[:self._size] = self._codes[:self._size]
+            self._codes = codes
+    
+    def compact(self):
+        """Drop tombstoned rows; rows of a memory-mapped snapshot stay masked instead"""
+        if self.snapshot is None:
+            keep = np.flatnonzero(self._alive[:self._base_count + self._size])
+            pet_types = np.concatenate([self._base_pet_types, self._pet_types[:self._size]])
+            keep = keep[np.argsort(pet_types[keep], kind='stable')]
+            parts = [matrix for matrix in (self._base, self._vectors[:self._size]) if len(matrix)]
+            vectors = np.concatenate(parts)[keep] if parts else self._base
+            sketches = None
+            if self._base_sketches is not None:
+                sketches = np.concatenate([self._base_sketches, self._sketches[:self._size]])[keep]
+            codes = None
+            if self.quantizer is not None:
+                codes = np.concatenate([self._base_codes, self._codes[:self._size]])[keep]
+            self.reset_rows(vectors, [self.object_id(row) for row in keep], pet_types[keep], codes)
+            self._base_sketches = sketches
+            return
+        
+        delta_alive = self._alive[self._base_count:self._base_count + self._size]
+        keep = np.flatnonzero(delta_alive)
+        self._vectors = self._vectors[keep].copy()
+        self._sketches = self._sketches[keep].copy()
+        self._pet_types = self._pet_types[keep].copy()
+        self._ids = [self._ids[row] for row in keep]
+        self._rows = {object_id: self._base_count + row for row, object_id in enumerate(self._ids)}
+        self._size = len(keep)
+        self._alive = np.concatenate([self._alive[:self._base_count], np.ones(self._size, dtype=bool)])
+        self._dead = self._base_dead
+        if self.quantizer is not None:
+            self._codes = self._codes[keep].copy()
+    
+    def load_codes(self, snapshot: EmbeddingSnapshot) -> Optional[np.ndarray]:
+        """Memory-map the codes written for a snapshot with the loaded codebook, if there are any"""
+        if self.quantizer is None or self.quantizer.dimension != snapshot.dimension:
+            return None
+        
+        path = get_codes_path(self.source, self.quantizer.kind, snapshot.version)
+        if not path.exists():
+            logger.warning(f"No {self.quantizer.kind} codes for {self.source} snapshot {snapshot.version}, encoding it")
+            return None
+        
+        try:
+            codes = np.load(str(path), mmap_mode='r')
+        except Exception as e:
+            logger.error(f"Could not load codes {path}: {e}")
+            return None
+        
+        # A spread of rows re-encoded with the loaded codebook catches codes
+        # written with a codebook that has since been retrained
+        sample = np.linspace(0, len(snapshot) - 1, num=min(16, len(snapshot))).astype(np.int64)
+        if codes.shape != (len(snapshot), self.quantizer.code_size) or (
+                len(sample) and not np.array_equal(codes[sample], self.quantizer.encode(snapshot.vectors[sample]))):
+            logger.warning(f"Ignoring {self.source} {self.quantizer.kind} codes written with another codebook")
+            return None
+        return codes
+    
+    def load_quantizer(self):
+        """Load the trained codebook for the configured quantization mode, if any"""
+        if self.quantization in (None, 'none'):
+            return None
+        
+        path = get_quantizer_path(self.source, self.quantization)
+        if not path.exists():
+            logger.warning(f"No {self.quantization} codebook for {self.source} at {path}, searching float vectors")
+            return None
+        
+        try:
+            return load_quantizer(str(path))
+        except Exception as e:
+            logger.error(f"Could not load codebook {path}: {e}")
+            return None
+    
+    def warm_up(self):
+        """Load the index in a background thread so a caller need not wait for it"""
+        if self._loaded or self._warming:
+            return
+        self._warming = True
+        threading.Thread(target=self._warm_up, name=f'warm-{self.source}-index', daemon=True).start()
+    
+    def _warm_up(self):
+        """Background body of warm_up(), so a failed load can be retried by the next caller"""
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Error warming up the {self.source} index: {e}")
+        finally:
+            self._warming = False
+            connection.close()
+    
+    def attach_graph(self):
+        """
+        Load the HNSW graph for the 'hnsw' backend and catch it up with the exact rows
+        
+        Graphs are only built offline by `manage.py build_hnsw_index`: until a
+        usable graph file exists searches stay exact. A graph built over a
+        snapshot reads its vectors from this index's snapshot memory map, so
+        workers do not each hold a copy of them.
+        """
+        if self.backend != 'hnsw' or self.graph is not None:
+            return
+        
+        path = get_graph_path(self.source)
+        self._graph_identity = file_identity(path)
+        graph = None
+        if self._graph_identity is not None:
+            try:
+                graph = HNSWIndex.load(str(path))
+            except Exception as e:
+                logger.error(f"Could not load HNSW graph {path}: {e}")
+        
+        if graph is not None and graph.base_version is not None:
+            if self.snapshot is None or self.snapshot.version != graph.base_version:
+                logger.warning(f"Ignoring {self.source} HNSW graph built over another snapshot")
+                graph = None
+            else:
+                graph.attach_base(self.snapshot.vectors)
+        
+        if graph is not None and len(self) and len(graph) and graph.dimension != self.dimension:
+            logger.warning(f"Ignoring {self.source} HNSW graph with dimension {graph.dimension}")
+            graph = None
+        
+        if graph is not None:
+            entries = list(
+                EmbeddingChangeLog.objects.filter(source=self.source, seq__gt=graph.last_seq)
+                .values_list('object_id', 'operation')[:settings.EMBEDDING_INDEX['MAX_CHANGES'] + 1]
+            )
+            if len(entries) > settings.EMBEDDING_INDEX['MAX_CHANGES']:
+                logger.warning(f"Ignoring {self.source} HNSW graph that is too far behind")
+                graph = None
+            elif any(operation == 'reset' for _, operation in entries):
+                logger.warning(f"Ignoring {self.source} HNSW graph that predates the last embedding model swap")
+                graph = None
+            else:
+                # The exact rows are current, so they tell what each changed object looks like now
+                for object_id in {object_id for object_id, _ in entries}:
+                    row = self.find_row(object_id)
+                    if row is None:
+                        graph.remove(object_id)
+                    else:
+                        graph.add(object_id, self.vector_at(row))
+        
+        if graph is None:
+            logger.warning(f"No usable {self.source} HNSW graph, searching exactly until "
+                           f"`manage.py build_hnsw_index` writes one")
+            return
+        
+        graph.last_seq = self.last_seq
+        self.graph = graph
+    
+    def search(self, query: np.ndarray, top_k: int = 10, pet_type: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Find the most similar vectors
+        
+        Args:
+            query: Query embedding
+            top_k: Number of results
+            pet_type: Only search rows of this pet type ('cat' or 'dog')
+            
+        Returns:
+            List of (object_id, cosine similarity) pairs, most similar first
+        """
+        self.refresh()
+        
+        with self._lock:
+            if self.graph is not None:
+                return self.search_graph(query, top_k, pet_type)
+            if self.quantizer is not None:
+                return self.search_quantized(query, top_k, pet_type=pet_type)
+        
+        return self.search_exact(query, top_k, pet_type)
+    
+    def score_rows(self, pet_type: Optional[str], score_base, score_delta, fill, dtype=np.float32) -> np.ndarray:
+        """
+        Score the live rows of a pet type partition
+        
+        Args:
+            pet_type: Pet type to score, or None for every row
+            score_base: Callable scoring the base rows [start, end)
+            score_delta: Callable scoring all delta rows
+            fill: Value of rows that are dead or outside the partition
+            dtype: Score dtype
+            
+        Returns:
+            One score per row, base first
+        """
+        ranges, delta_mask = self.scan_ranges(pet_type)
+        values = np.full(self._base_count + self._size, fill, dtype=dtype)
+        for start, end in ranges:
+            if end > start:
+                partition = values[start:end]
+                partition[:] = score_base(start, end)
+                partition[~self._alive[start:end]] = fill
+        if self._size:
+            values[self._base_count:] = np.where(delta_mask, score_delta(), fill)
+        return values
+    
+    def search_graph(self, query: np.ndarray, top_k: int = 10, pet_type: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Search the HNSW graph, widening the search until enough hits have the pet type"""
+        if pet_type is None:
+            return self.graph.search(query, top_k)
+        
+        codes = self.pet_type_codes(pet_type)
+        k = top_k
+        while True:
+            hits = self.graph.search(query, k)
+            rows = [self.find_row(object_id) for object_id, _ in hits]
+            matching = [hit for hit, row in zip(hits, rows) if row is not None and self.pet_type_at(row) in codes]
+            if len(matching) >= top_k or len(hits) < k:
+                return matching[:top_k]
+            k *= 4
+    
+    def search_quantized(self, query: np.ndarray, top_k: int = 10,
+                         rerank_factor: Optional[int] = None,
+                         pet_type: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Scan the quantized codes, then re-score the best candidates exactly
+        
+        Args:
+            query: Query embedding
+            top_k: Number of results
+            rerank_factor: Candidates re-scored per result, defaults to
+                EMBEDDING_INDEX['RERANK_FACTOR']; 0 returns the approximate scores
+            pet_type: Only search rows of this pet type
+        """
+        with self._lock:
+            if not len(self):
+                return []
+            
+            query = np.asarray(query, dtype=np.float32).reshape(-1)
+            query = query / (np.linalg.norm(query) or 1.0)
+            
+            rows = self._base_count + self._size
+            scores = self.score_rows(
+                pet_type,
+                lambda start, end: self.quantizer.scores(self._base_codes[start:end], query),
+                lambda: self.quantizer.scores(self._codes[:self._size], query),
+                -np.inf,
+            )
+            
+            if rerank_factor is None:
+                rerank_factor = settings.EMBEDDING_INDEX['RERANK_FACTOR']
+            candidates = min(int(np.isfinite(scores).sum()), top_k * max(rerank_factor, 1))
+            if not candidates:
+                return []
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            
+            if rerank_factor:
+                # Sorted rows keep memory-mapped reads sequential
+                top = np.sort(top)
+                scores = np.full(rows, -np.inf, dtype=np.float32)
+                scores[top] = self.vectors_at(top) @ query
+            
+            k = min(top_k, len(top))
+            top = top[np.argsort(-scores[top])[:k]]
+            return [(self.object_id(row), float(scores[row])) for row in top]
+    
+    def base_sketches(self) -> np.ndarray:
+        """Get the sign sketches of the base rows, computing them on first use without a snapshot"""
+        if self._base_sketches is None:
+            if self.snapshot is not None and self.snapshot.sketches is not None:
+                self._base_sketches = self.snapshot.sketches
+            else:
+                sketches = np.zeros((self._base_count, self._sketches.shape[1]), dtype=np.uint64)
+                for start in range(0, self._base_count, 65536):
+                    sketches[start:start + 65536] = compute_sketches(self._base[start:start + 65536])
+                self._base_sketches = sketches
+        return self._base_sketches
+    
+    def search_above(self, query: np.ndarray, threshold: float, top_k: int = 10,
+                     pet_type: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Find the most similar vectors reaching a similarity threshold
+        
+        Rows are shortlisted by the Hamming distance between sign sketches,
+        so only rows whose sketch is close enough to plausibly reach the
+        threshold are scored exactly. When no sketch is close enough the
+        search returns without reading a single float vector.
+        
+        Args:
+            query: Query embedding
+            threshold: Minimum cosine similarity
+            top_k: Number of results
+            pet_type: Only search rows of this pet type
+            
+        Returns:
+            List of (object_id, cosine similarity) pairs at or above the
+            threshold, most similar first
+        """
+        self.refresh()
+        config = settings.SIGN_SKETCH
+        
+        with self._lock:
+            if not len(self):
+                return []
+            
+            query = np.asarray(query, dtype=np.float32).reshape(-1)
+            query = query / (np.linalg.norm(query) or 1.0)
+            query_sketch = compute_sketches(query)[0]
+            
+            distances = self.score_rows(
+                pet_type,
+                lambda start, end: hamming_distances(self.base_sketches()[start:end], query_sketch),
+                lambda: hamming_distances(self._sketches[:self._size], query_sketch),
+                config['BITS'] + 1,
+                np.int32,
+            )
+            
+            limit = max_hamming_distance(threshold, config['BITS'], config['Z_SCORE'])
+            shortlist = np.flatnonzero(distances <= limit)
+            if not len(shortlist):
+                return []
+            if len(shortlist) > config['MAX_SHORTLIST']:
+                closest = np.argpartition(distances[shortlist], config['MAX_SHORTLIST'] - 1)
+                shortlist = shortlist[closest[:config['MAX_SHORTLIST']]]
+            
+            # Sorted rows keep memory-mapped reads sequential
+            shortlist = np.sort(shortlist)
+            scores = self.vectors_at(shortlist) @ query
+            passing = np.flatnonzero(scores >= threshold)
+            top = passing[np.argsort(-scores[passing])[:top_k]]
+            return [(self.object_id(shortlist[i]), float(scores[i])) for i in top]
+    
+    def search_exact(self, query: np.ndarray, top_k: int = 10, pet_type: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Brute-force search over every live row, optionally of one pet type"""
+        with self._lock:
+            if not len(self):
+                return []
+            
+            query = np.asarray(query, dtype=np.float32).reshape(-1)
+            query = query / (np.linalg.norm(query) or 1.0)
+            
+            scores = self.score_rows(
+                pet_type,
+                lambda start, end: self._base[start:end] @ query,
+                lambda: self._vectors[:self._size] @ query,
+                -np.inf,
+            )
+            
+            k = min(top_k, int(np.isfinite(scores).sum()))
+            if not k:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self.object_id(row), float(scores[row])) for row in top]
+    
+    def search_batch(self, queries: np.ndarray, top_k: int = 10,
+                     pet_types: Optional[List[Optional[str]]] = None) -> List[List[Tuple[str, float]]]:
+        """
+        Find the most similar vectors for several queries at once
+        
+        The exact backend scores all queries of a pet type with one
+        matrix-matrix product per block of rows, so the rows are read once
+        per batch instead of once per query. The graph and quantized backends
+        search each query on its own.
+        
+        Args:
+            queries: (n, dimension) query embeddings
+            top_k: Number of results per query
+            pet_types: Pet type to search for each query, None for every row
+            
+        Returns:
+            One list of (object_id, cosine similarity) pairs per query, most similar first
+        """
+        self.refresh()
+        queries = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        pet_types = list(pet_types) if pet_types is not None else [None] * len(queries)
+        
+        with self._lock:
+            if self.graph is not None or self.quantizer is not None:
+                return [self.search(query, top_k, pet_type) for query, pet_type in zip(queries, pet_types)]
+            
+            groups: Dict[Optional[str], List[int]] = {}
+            for i, pet_type in enumerate(pet_types):
+                groups.setdefault(pet_type, []).append(i)
+            
+            results: List[List[Tuple[str, float]]] = [[] for _ in range(len(queries))]
+            for pet_type, members in groups.items():
+                for i, hits in zip(members, self.search_exact_batch(queries[members], top_k, pet_type)):
+                    results[i] = hits
+            return results
+    
+    def search_exact_batch(self, queries: np.ndarray, top_k: int = 10,
+                           pet_type: Optional[str] = None,
+                           block_size: int = 65536) -> List[List[Tuple[str, float]]]:
+        """Brute-force search of L2-normalized queries over blocks of live rows, optionally of one pet type"""
+        with self._lock:
+            if not len(self) or not len(queries):
+                return [[] for _ in range(len(queries))]
+            
+            ranges, delta_mask = self.scan_ranges(pet_type)
+            rows = np.zeros((0, len(queries)), dtype=np.int64)
+            scores = np.zeros((0, len(queries)), dtype=np.float32)
+            
+            for range_start, range_end in ranges:
+                for start in range(range_start, range_end, block_size):
+                    end = min(start + block_size, range_end)
+                    block_scores = self._base[start:end] @ queries.T
+                    block_scores[~self._alive[start:end]] = -np.inf
+                    rows, scores = merge_top_k(rows, scores, np.arange(start, end), block_scores, top_k)
+            
+            if self._size:
+                block_scores = self._vectors[:self._size] @ queries.T
+                block_scores[~delta_mask] = -np.inf
+                block_rows = np.arange(self._base_count, self._base_count + self._size)
+                rows, scores = merge_top_k(rows, scores, block_rows, block_scores, top_k)
+            
+            results = []
+            for column in range(len(queries)):
+                order = np.argsort(-scores[:, column])
+                results.append([
+                    (self.object_id(int(rows[i, column])), float(scores[i, column]))
+                    for i in order if np.isfinite(scores[i, column])
+                ])
+            return results
+    
+    def scan_database(self, query: np.ndarray, top_k: int = 10,
+                      pet_type: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Exact search straight from the database, for when the index is not loaded
+        
+        Only (id, vector) tuples are read, SCAN_CHUNK_SIZE rows at a time;
+        each chunk is scored as one matrix and merged into a running top-k
+        heap, so memory stays constant whatever the size of the table.
+        
+        Args:
+            query: Query embedding
+            top_k: Number of results
+            pet_type: Only search rows of this pet type (or of no known type)
+            
+        Returns:
+            List of (object_id, cosine similarity) pairs, most similar first
+        """
+        return self.scan_database_batch(np.asarray(query, dtype=np.float32).reshape(1, -1), top_k, [pet_type])[0]
+    
+    def scan_database_batch(self, queries: np.ndarray, top_k: int = 10,
+                            pet_types: Optional[List[Optional[str]]] = None) -> List[List[Tuple[str, float]]]:
+        """
+        Exact search of several queries straight from the database
+        
+        The table is streamed once per pet type, and each chunk is scored
+        against all the queries of that pet type with one matrix product.
+        
+        Args:
+            queries: (n, dimension) query embeddings
+            top_k: Number of results per query
+            pet_types: Pet type to search for each query, None for every row
+            
+        Returns:
+            One list of (object_id, cosine similarity) pairs per query, most similar first
+        """
+        queries = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        pet_types = list(pet_types) if pet_types is not None else [None] * len(queries)
+        chunk_size = settings.EMBEDDING_INDEX['SCAN_CHUNK_SIZE']
+        
+        groups: Dict[Optional[str], List[int]] = {}
+        for i, pet_type in enumerate(pet_types):
+            groups.setdefault(pet_type, []).append(i)
+        
+        heaps: List[List[Tuple[float, str]]] = [[] for _ in range(len(queries))]
+        for pet_type, members in groups.items():
+            queryset = self.model.objects.filter(**self.row_filter)
+            if pet_type is not None and self.pet_type_field:
+                queryset = queryset.filter(
+                    Q(**{self.pet_type_field: pet_type})
+                    | ~Q(**{f'{self.pet_type_field}__in': list(PET_TYPE_CODES)})
+                    | Q(**{f'{self.pet_type_field}__isnull': True})
+                )
+            rows = queryset.values_list('pk', self.vector_field).iterator(chunk_size=chunk_size)
+            
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                chunk = [
+                    (str(object_id), vector) for object_id, vector in chunk
+                    if vector and len(vector) == queries.shape[1]
+                ]
+                if not chunk:
+                    continue
+                
+                scores = similarities(queries[members], [vector for _, vector in chunk])
+                k = min(top_k, scores.shape[1])
+                for i, query_scores in zip(members, scores):
+                    heap = heaps[i]
+                    for row in np.argpartition(-query_scores, k - 1)[:k].tolist():
+                        item = (float(query_scores[row]), chunk[row][0])
+                        if len(heap) < top_k:
+                            heapq.heappush(heap, item)
+                        elif item > heap[0]:
+                            heapq.heapreplace(heap, item)
+        
+        return [[(object_id, score) for score, object_id in sorted(heap, reverse=True)] for heap in heaps]
+    
+    def object_id(self, row: int) -> str:
+        if row < self._base_count:
+            return self.base_id(row)
+        return self._ids[row - self._base_count]
+
+
+def get_graph_path(source: str) -> Path:
+    """Get the path of the HNSW graph file for a change log source"""
+    return Path(settings.EMBEDDING_SNAPSHOT_DIR) / f'{source}.hnsw.npz'
+
+
+def get_quantizer_path(source: str, kind: str) -> Path:
+    """Get the path of the trained codebook of a quantization mode for a change log source"""
+    return Path(settings.EMBEDDING_SNAPSHOT_DIR) / f'{source}.{kind}.npz'
+
+
+def get_codes_path(source: str, kind: str, version: int) -> Path:
+    """Get the path of the codes of a snapshot version encoded with a quantization mode's codebook"""
+    return Path(settings.EMBEDDING_SNAPSHOT_DIR) / f'{source}.{kind}.codes-{version}.npy'
+
+
+def write_codes(source: str, quantizer) -> Optional[Path]:
+    """
+    Encode the current snapshot of a source into a codes file the workers memory-map
+    
+    Codes of older snapshots are removed. Does nothing without a snapshot.
+    
+    Args:
+        source: Change log source
+        quantizer: Trained quantizer whose codebook is saved next to the codes
+        
+    Returns:
+        Path of the codes file, or None without a snapshot
+    """
+    snapshot = EmbeddingSnapshot.open(source)
+    if snapshot is None:
+        return None
+    
+    path = get_codes_path(source, quantizer.kind, snapshot.version)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    os.close(fd)
+    try:
+        codes = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.uint8,
+                                          shape=(len(snapshot), quantizer.code_size))
+        for start in range(0, len(snapshot), 65536):
+            codes[start:start + 65536] = quantizer.encode(snapshot.vectors[start:start + 65536])
+        codes.flush()
+        del codes
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    
+    for old_path in path.parent.glob(f'{source}.{quantizer.kind}.codes-*.npy'):
+        if old_path != path:
+            old_path.unlink(missing_ok=True)
+    return path
+
+
+def build_graph(index: EmbeddingIndex, m: Optional[int] = None, ef_construction: Optional[int] = None,
+                ef_search: Optional[int] = None) -> HNSWIndex:
+    """
+    Build an HNSW graph over the live rows of an exact index
+    
+    Over a snapshot the graph's first nodes are the snapshot rows, read from
+    the memory map when the graph is loaded, so only rows changed since the
+    snapshot are stored in the graph file.
+    
+    Args:
+        index: Loaded index
+        m, ef_construction, ef_search: Graph parameters (default: settings.HNSW_INDEX)
+    """
+    params = settings.HNSW_INDEX
+    graph = HNSWIndex(index.dimension, m or params['M'], ef_construction or params['EF_CONSTRUCTION'],
+                      ef_search or params['EF_SEARCH'])
+    
+    if index.snapshot is not None:
+        base_count = index._base_count
+        graph.add_base(index.snapshot.vectors, [index.base_id(row) for row in range(base_count)],
+                       index.snapshot.version)
+        for row in np.flatnonzero(~index._alive[:base_count]).tolist():
+            graph.remove(index.base_id(row))
+        for row in (np.flatnonzero(index._alive[base_count:base_count + index._size]) + base_count).tolist():
+            graph.add(index.object_id(row), index.vector_at(row))
+    else:
+        for object_id, vector in index.live_rows():
+            graph.add(object_id, vector)
+    
+    graph.last_seq = index.last_seq
+    return graph
+
+
+_indexes: Dict[str, EmbeddingIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(source: str) -> EmbeddingIndex:
+    """Get this process' index for a change log source, creating it on first use"""
+    with _indexes_lock:
+        index = _indexes.get(source)
+        if index is None:
+            index = EmbeddingIndex(source)
+            _indexes[source] = index
+        return index
+
+
+def search_embeddings(source: str, query: np.ndarray, top_k: int = 10, pet_type: Optional[str] = None,
+                      threshold: Optional[float] = None) -> List[Tuple[str, float]]:
+    """
+    Search the index of a change log source without loading it in the request
+    
+    A cold index starts loading in the background and the query is answered
+    by streaming the table (scan_database) meanwhile, so no request pays for,
+    or holds the memory of, a synchronous load of the whole table.
+    
+    Args:
+        source: Change log source
+        query: Query embedding
+        top_k: Number of results
+        pet_type: Only search rows of this pet type
+        threshold: Only return results with at least this cosine similarity
+        
+    Returns:
+        List of (object_id, cosine similarity) pairs, most similar first
+    """
+    index = get_index(source)
+    if not index.loaded:
+        index.warm_up()
+        hits = index.scan_database(query, top_k, pet_type)
+        return [hit for hit in hits if threshold is None or hit[1] >= threshold]
+    
+    if threshold is not None:
+        return index.search_above(query, threshold, top_k, pet_type)
+    return index.search(query, top_k, pet_type)
+
+
+def search_embeddings_batch(source: str, queries: np.ndarray, top_k: int = 10,
+                            pet_types: Optional[List[Optional[str]]] = None) -> List[List[Tuple[str, float]]]:
+    """Batch variant of search_embeddings, one list of (object_id, similarity) pairs per query"""
+    index = get_index(source)
+    if not index.loaded:
+        index.warm_up()
+        return index.scan_database_batch(queries, top_k, pet_types)
+    return index.search_batch(queries, top_k, pet_types)
+
+
+def _reset_indexes_after_fork():
+    """Locks held by other threads at fork time would never be released in the child"""
+    global _indexes_lock
+    _indexes_lock = threading.Lock()
+    for index in _indexes.values():
+        index._lock = threading.RLock()
+        index._warming = False
+
+
+os.register_at_fork(after_in_child=_reset_indexes_after_fork)
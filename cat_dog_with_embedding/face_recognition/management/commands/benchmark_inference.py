@@ -0,0 +1,157 @@
+import os
+import time
+import queue
+import tempfile
+import multiprocessing
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _parse_counts(value):
+    """Parse a comma separated list of positive integers"""
+    try:
+        counts = sorted({int(v) for v in value.split(',') if v.strip()})
+    except ValueError:
+        raise CommandError(f"Invalid count list: {value}")
+    if not counts or counts[0] < 1:
+        raise CommandError(f"Counts must be positive integers: {value}")
+    return counts
+
+
+def _benchmark_worker(model_kind, image_path, torch_threads, iterations, start_event, results):
+    """Run inference in a forked worker and report its elapsed time"""
+    from face_recognition.runtime import apply_runtime_profile
+    from face_recognition.services import YOLODetectionService, FaceEmbeddingService
+    
+    apply_runtime_profile(force=True, torch_threads=torch_threads)
+    
+    if model_kind == 'detector':
+        service = YOLODetectionService(endpoint='search')
+        
+        def run_once():
+            # Defeat the decoded image cache so every iteration pays the decode
+            service._decoded = None
+            service.detect_pet_faces(image_path)
+    else:
+        service = FaceEmbeddingService()
+        crop = cv2.imread(image_path)
+        
+        def run_once():
+            service.generate_embedding(crop)
+    
+    # Warm up before the timed section
+    run_once()
+    run_once()
+    
+    results.put(None)
+    start_event.wait()
+    latencies = []
+    for _ in range(iterations):
+        start = time.time()
+        run_once()
+        latencies.append(time.time() - start)
+    results.put(latencies)
+
+
+class Command(BaseCommand):
+    help = 'Sweep torch thread count against worker count and print inference throughput'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=['detector', 'embedder'], default='embedder',
+                            help='Model to benchmark')
+        parser.add_argument('--threads', default='1,2,4,8',
+                            help='Comma separated torch thread counts per worker')
+        parser.add_argument('--workers', default='1,2,4,8',
+                            help='Comma separated worker process counts')
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Timed inferences per worker')
+        parser.add_argument('--image', help='Image to run (defaults to a synthetic 1280x960 JPEG)')
+        parser.add_argument('--timeout', type=float, default=600,
+                            help='Seconds to wait for the workers to load their model, and then to finish')
+    
+    def handle(self, *args, **options):
+        thread_counts = _parse_counts(options['threads'])
+        worker_counts = _parse_counts(options['workers'])
+        iterations = options['iterations']
+        cpu_count = os.cpu_count() or 1
+        
+        image_path = options['image']
+        temp_path = None
+        if not image_path:
+            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
+            temp_file.close()
+            temp_path = image_path = temp_file.name
+            rng = np.random.default_rng(0)
+            cv2.imwrite(image_path, rng.integers(0, 255, (960, 1280, 3), dtype=np.uint8))
+        elif not os.path.exists(image_path):
+            raise CommandError(f"Image not found: {image_path}")
+        
+        # Fork so every worker starts with fresh torch thread pools
+        context = multiprocessing.get_context('fork')
+        
+        self.stdout.write(f"Benchmarking {options['model']} on {cpu_count} cores, {iterations} iterations per worker")
+        self.stdout.write(f"{'workers':>8} {'threads':>8} {'total':>6} {'img/s':>9} {'p50 ms':>9} {'p95 ms':>9}")
+        
+        try:
+            for workers in worker_counts:
+                for threads in thread_counts:
+                    start_event = context.Event()
+                    results = context.Queue()
+                    processes = [
+                        context.Process(
+                            target=_benchmark_worker,
+                            args=(options['model'], image_path, threads, iterations, start_event, results)
+                        )
+                        for _ in range(workers)
+                    ]
+                    for process in processes:
+                        process.start()
+                    
+                    try:
+                        # Start the clock once every worker has warmed up
+                        self.collect(results, processes, options['timeout'])
+                        start_event.set()
+                        start = time.time()
+                        latencies = [
+                            latency for worker_latencies in self.collect(results, processes, options['timeout'])
+                            for latency in worker_latencies
+                        ]
+                        elapsed = time.time() - start
+                    except CommandError:
+                        for process in processes:
+                            process.terminate()
+                        raise
+                    finally:
+                        for process in processes:
+                            process.join()
+                    
+                    throughput = len(latencies) / elapsed
+                    p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+                    total_threads = workers * threads
+                    line = f"{workers:>8} {threads:>8} {total_threads:>6} {throughput:>9.2f} {p50:>9.1f} {p95:>9.1f}"
+                    if total_threads > cpu_count:
+                        line += '  (oversubscribed)'
+                    self.stdout.write(line)
+        finally:
+            if temp_path:
+                os.unlink(temp_path)
+    
+    def collect(self, results, processes, timeout):
+        """Get one message from every worker, failing if a worker dies or the timeout passes"""
+        messages = []
+        deadline = time.time() + timeout
+        while len(messages) < len(processes):
+            try:
+                messages.append(results.get(timeout=1))
+                continue
+            except queue.Empty:
+                pass
+            
+            dead = [process.exitcode for process in processes if process.exitcode not in (None, 0)]
+            if dead:
+                raise CommandError(f"A benchmark worker died (exit code {dead[0]})")
+            if time.time() > deadline:
+                raise CommandError(f"Benchmark workers did not report within {timeout:.0f}s")
+        return messages
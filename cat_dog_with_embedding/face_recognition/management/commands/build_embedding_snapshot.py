@@ -0,0 +1,69 @@
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from face_recognition.index import INDEX_SOURCES, get_quantizer_path, write_codes
+from face_recognition.models import EmbeddingChangeLog
+from face_recognition.quantization import load_quantizer
+from face_recognition.snapshot import EmbeddingSnapshot, write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write memory-mapped embedding snapshots that the web workers share'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=list(INDEX_SOURCES), action='append',
+                            help='Source to snapshot (default: all)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and rewrite snapshots as the change log grows')
+        parser.add_argument('--interval', type=float, default=300,
+                            help='Seconds between checks with --loop')
+        parser.add_argument('--min-changes', type=int, default=1000,
+                            help='Change log entries since the last snapshot that trigger a rewrite with --loop')
+    
+    def handle(self, *args, **options):
+        sources = options['source'] or list(INDEX_SOURCES)
+        
+        if not options['loop']:
+            for source in sources:
+                self.write(source)
+            return
+        
+        while True:
+            for source in sources:
+                snapshot = EmbeddingSnapshot.open(source)
+                if snapshot is None:
+                    self.write(source)
+                    continue
+                
+                # Rewrite before the workers would start ignoring it (aged out or
+                # predating a model swap), however few changes it is behind
+                reason = snapshot.unusable_reason(margin=2 * options['interval'])
+                pending = EmbeddingChangeLog.objects.filter(source=source, seq__gt=snapshot.last_seq).count()
+                if reason or pending >= options['min_changes']:
+                    if reason:
+                        self.stdout.write(f"{source}: rewriting snapshot {reason}")
+                    self.write(source)
+            time.sleep(options['interval'])
+    
+    def write(self, source):
+        start_time = time.time()
+        path = write_snapshot(source)
+        snapshot = EmbeddingSnapshot(path)
+        self.stdout.write(
+            f"{source}: {len(snapshot)} vectors, dimension {snapshot.dimension}, seq {snapshot.last_seq} "
+            f"-> {path} ({time.time() - start_time:.1f}s)"
+        )
+        
+        # Quantized codes and HNSW graphs are built over a particular snapshot's rows
+        for kind in ('sq8', 'pq'):
+            quantizer_path = get_quantizer_path(source, kind)
+            if quantizer_path.exists():
+                codes_path = write_codes(source, load_quantizer(str(quantizer_path)))
+                self.stdout.write(f"{source}: {kind} codes -> {codes_path}")
+        
+        
+        if settings.EMBEDDING_INDEX['BACKEND'] == 'hnsw':
+            call_command('build_hnsw_index', source=[source], queries=0, stdout=self.stdout)
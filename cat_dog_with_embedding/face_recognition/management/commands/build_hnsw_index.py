@@ -0,0 +1,67 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from face_recognition.index import INDEX_SOURCES, EmbeddingIndex, build_graph, get_graph_path
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the HNSW graph used by the hnsw index backend and report its recall against exact search'
+    
+    def add_arguments(self, parser):
+        params = settings.HNSW_INDEX
+        parser.add_argument('--source', choices=list(INDEX_SOURCES), action='append',
+                            help='Source to index (default: all)')
+        parser.add_argument('--m', type=int, default=params['M'], help='Links per node')
+        parser.add_argument('--ef-construction', type=int, default=params['EF_CONSTRUCTION'],
+                            help='Candidate list size while inserting')
+        parser.add_argument('--ef-search', type=int, default=params['EF_SEARCH'],
+                            help='Candidate list size while searching')
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Stored vectors (plus noise) to use as recall queries, 0 to skip')
+        parser.add_argument('--k', type=int, default=10, help='Neighbours compared for recall@k')
+    
+    def handle(self, *args, **options):
+        for source in options['source'] or list(INDEX_SOURCES):
+            index = EmbeddingIndex(source, backend='exact')
+            index.load()
+            
+            start_time = time.time()
+            graph = build_graph(index, options['m'], options['ef_construction'], options['ef_search'])
+            build_time = time.time() - start_time
+            
+            path = get_graph_path(source)
+            graph.save(str(path))
+            self.stdout.write(f"{source}: {len(graph)} vectors indexed in {build_time:.1f}s -> {path}")
+            
+            if options['queries'] and len(graph):
+                self.report_recall(index, graph, options['queries'], options['k'])
+    
+    def report_recall(self, index, graph, count, k):
+        """Compare graph results with exact search on perturbed stored vectors"""
+        rng = np.random.default_rng(0)
+        vectors = [vector for _, vector in index.live_rows()]
+        queries = [
+            vectors[i] + rng.normal(scale=0.05, size=index.dimension).astype(np.float32)
+            for i in rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)
+        ]
+        
+        recall = 0.0
+        graph_time = exact_time = 0.0
+        for query in queries:
+            start_time = time.time()
+            exact = {object_id for object_id, _ in index.search_exact(query, k)}
+            exact_time += time.time() - start_time
+            
+            start_time = time.time()
+            found = {object_id for object_id, _ in graph.search(query, k)}
+            graph_time += time.time() - start_time
+            
+            recall += len(exact & found) / len(exact)
+        
+        self.stdout.write(
+            f"  recall@{k}={recall / len(queries):.3f} over {len(queries)} queries, "
+            f"hnsw {graph_time / len(queries) * 1000:.2f}ms vs exact {exact_time / len(queries) * 1000:.2f}ms per query"
+        )
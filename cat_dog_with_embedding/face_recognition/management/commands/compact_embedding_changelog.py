@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from face_recognition.models import EmbeddingChangeLog
+
+
+class Command(BaseCommand):
+    help = 'Drop superseded and expired entries from the embedding change log'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-hours', type=int,
+                            default=settings.EMBEDDING_INDEX['CHANGELOG_RETENTION_HOURS'],
+                            help='Keep tombstones at least this long')
+    
+    def handle(self, *args, **options):
+        before = EmbeddingChangeLog.objects.count()
+        deleted = EmbeddingChangeLog.compact(timedelta(hours=options['retention_hours']))
+        self.stdout.write(f"Deleted {deleted} of {before} change log entries")
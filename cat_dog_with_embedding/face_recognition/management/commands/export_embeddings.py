@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from face_recognition.reembedding import get_active_embedding_model
+from face_recognition.transfer import EXPORT_SOURCES, export_embeddings
+
+
+class Command(BaseCommand):
+    help = 'Stream the pet embeddings, face vectors and projects into a chunked .npz archive'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archive to write (.npz)')
+        parser.add_argument('--source', choices=list(EXPORT_SOURCES), action='append',
+                            help='Source to export (default: all)')
+        parser.add_argument('--chunk-size', type=int,
+                            help='Rows per chunk (default: EMBEDDING_TRANSFER_CHUNK_SIZE)')
+    
+    def handle(self, *args, **options):
+        sources = [source for source in EXPORT_SOURCES if source in (options['source'] or EXPORT_SOURCES)]
+        chunk_size = options['chunk_size'] or settings.EMBEDDING_TRANSFER['CHUNK_SIZE']
+        start_time = time.time()
+        
+        def progress(source, count):
+            elapsed = time.time() - start_time
+            self.stdout.write(f"  {source}: {count} rows ({elapsed:.1f}s)")
+        
+        manifest = export_embeddings(options['path'], sources, get_active_embedding_model(), chunk_size, progress)
+        
+        total = sum(info['count'] for info in manifest['sources'].values())
+        counts = ', '.join(f"{source}: {info['count']}" for source, info in manifest['sources'].items())
+        elapsed = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {total} rows ({counts}) to {options['path']} in {elapsed:.1f}s "
+            f"({total / max(elapsed, 1e-9):.0f} rows/s)"
+        ))
@@ -0,0 +1,172 @@
+import os
+import time
+import multiprocessing
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from face_recognition.duplicates import (
+    OWNER_FIELDS, count_tiles, iter_tiles, init_scan_worker, open_scan_snapshot,
+    scan_tile, scan_tile_task, snapshot_ids
+)
+from face_recognition.index import INDEX_SOURCES
+from face_recognition.models import DuplicateScanJob, DuplicateCandidate
+from face_recognition.snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Find pairs of registrations similar enough to be the same animal (all-pairs blocked scan)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=list(OWNER_FIELDS), action='append',
+                            help='Source to scan (default: face_embedding and face_project)')
+        parser.add_argument('--threshold', type=float,
+                            help='Minimum cosine similarity of a duplicate pair (default: DUPLICATE_SCAN_THRESHOLD)')
+        parser.add_argument('--tile-size', type=int,
+                            help='Rows per tile side (default: DUPLICATE_SCAN_TILE_SIZE)')
+        parser.add_argument('--workers', type=int,
+                            help='Tile worker processes (default: DUPLICATE_SCAN_WORKERS, 0 for one per CPU)')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue the interrupted scan of each source instead of starting a new one')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and start a new scan every --interval seconds')
+        parser.add_argument('--interval', type=float, default=86400,
+                            help='Seconds between scans with --loop')
+    
+    def handle(self, *args, **options):
+        sources = options['source'] or ['face_embedding', 'face_project']
+        
+        while True:
+            for source in sources:
+                job = self.get_job(source, options)
+                if job is not None:
+                    self.run(job, options)
+                options['resume'] = False
+            
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
+    
+    def get_job(self, source, options):
+        """Get the interrupted job to resume, or start a new one over a frozen snapshot of the source"""
+        config = settings.DUPLICATE_SCAN
+        if options['resume']:
+            job = DuplicateScanJob.objects.filter(source=source, status='running').first()
+            if job is None:
+                raise CommandError(f'No interrupted {source} duplicate scan to resume')
+            if not Path(job.snapshot_path).exists():
+                raise CommandError(f'Snapshot {job.snapshot_path} of job {job.id} is gone, start a new scan')
+            self.stdout.write(f"Resuming {source} scan {job.id} after {job.completed_tiles} of {job.total_tiles} tiles")
+            return job
+        
+        DuplicateScanJob.objects.filter(source=source, status='running').update(
+            status='failed', error_message='Superseded by a new scan'
+        )
+        job = DuplicateScanJob.objects.create(
+            source=source,
+            threshold=options['threshold'] or config['THRESHOLD'],
+            tile_size=options['tile_size'] or config['TILE_SIZE'],
+        )
+        
+        path = Path(settings.EMBEDDING_SNAPSHOT_DIR) / f'duplicates-{source}-{job.id}.snapshot'
+        job.snapshot_path = str(write_snapshot(source, path))
+        job.total_rows = open_scan_snapshot(job.snapshot_path).count
+        job.total_tiles = count_tiles(job.total_rows, job.tile_size)
+        job.save(update_fields=['snapshot_path', 'total_rows', 'total_tiles'])
+        
+        if job.total_rows < 2:
+            self.finish(job)
+            return None
+        
+        self.stdout.write(
+            f"Scanning {job.total_rows} {source} rows in {job.total_tiles} tiles of {job.tile_size} "
+            f"at threshold {job.threshold} (job {job.id})"
+        )
+        return job
+    
+    def run(self, job, options):
+        """Scan the remaining tiles, checkpointing after each one"""
+        workers = options['workers'] if options['workers'] is not None else settings.DUPLICATE_SCAN['WORKERS']
+        workers = workers or os.cpu_count() or 1
+        start_time = time.time()
+        start_tiles = job.completed_tiles
+        
+        tiles = ((job.snapshot_path, job.tile_size, job.threshold, tile)
+                 for tile in iter_tiles(job.total_rows, job.tile_size, job.completed_tiles))
+        
+        try:
+            if workers == 1:
+                self.collect(job, (scan_tile(*task) for task in tiles), start_time, start_tiles)
+            else:
+                # Forked workers never use the parent's database connections
+                connections.close_all()
+                context = multiprocessing.get_context('fork')
+                with context.Pool(workers, initializer=init_scan_worker) as pool:
+                    self.collect(job, pool.imap(scan_tile_task, tiles), start_time, start_tiles)
+        except Exception as e:
+            job.status = 'failed'
+            job.error_message = str(e)
+            job.save(update_fields=['status', 'error_message'])
+            raise
+        
+        self.finish(job)
+        self.stdout.write(
+            f"{job.source}: {job.pairs_found} duplicate candidates among {job.total_rows} rows "
+            f"in {time.time() - start_time:.1f}s (job {job.id})"
+        )
+    
+    def collect(self, job, results, start_time, start_tiles):
+        """Store each tile's pairs as it finishes; imap keeps tiles in checkpoint order"""
+        owner_field = OWNER_FIELDS[job.source]
+        model = apps.get_model(INDEX_SOURCES[job.source][0])
+        report_every = max(1, job.total_tiles // 100)
+        
+        for rows_a, rows_b, scores in results:
+            candidates = []
+            if len(rows_a):
+                ids_a = snapshot_ids(job.snapshot_path, rows_a)
+                ids_b = snapshot_ids(job.snapshot_path, rows_b)
+                owners = {}
+                if owner_field:
+                    owners = {
+                        str(object_id): owner
+                        for object_id, owner in model.objects.filter(pk__in=set(ids_a) | set(ids_b)).values_list('pk', owner_field)
+                    }
+                for object_id_a, object_id_b, score in zip(ids_a, ids_b, scores.tolist()):
+                    # Two embeddings of the same pet (or vectors of the same project) are not duplicates
+                    if owner_field and owners.get(object_id_a) == owners.get(object_id_b):
+                        continue
+                    candidates.append(DuplicateCandidate(
+                        job=job,
+                        source=job.source,
+                        object_id_a=object_id_a,
+                        object_id_b=object_id_b,
+                        similarity_score=min(1.0, score)
+                    ))
+            
+            with transaction.atomic():
+                DuplicateCandidate.objects.bulk_create(candidates, ignore_conflicts=True)
+                job.completed_tiles += 1
+                # ignore_conflicts skips pairs a resumed tile already stored, so count what is stored
+                if candidates:
+                    job.pairs_found = DuplicateCandidate.objects.filter(job=job).count()
+                job.save(update_fields=['completed_tiles', 'pairs_found'])
+            
+            if job.completed_tiles % report_every == 0:
+                done = job.completed_tiles - start_tiles
+                remaining = (time.time() - start_time) / done * (job.total_tiles - job.completed_tiles)
+                self.stdout.write(
+                    f"  {job.completed_tiles}/{job.total_tiles} tiles, {job.pairs_found} pairs, ~{remaining:.0f}s left"
+                )
+    
+    def finish(self, job):
+        """Mark a job completed and drop its snapshot"""
+        job.status = 'completed'
+        job.completed_at = timezone.now()
+        job.save(update_fields=['status', 'completed_at'])
+        if job.snapshot_path and os.path.exists(job.snapshot_path):
+            os.unlink(job.snapshot_path)
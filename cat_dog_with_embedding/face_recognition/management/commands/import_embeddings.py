@@ -0,0 +1,86 @@
+import time
+import zipfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from face_recognition.reembedding import get_active_embedding_model
+from face_recognition.snapshot import write_snapshot
+from face_recognition.transfer import (
+    EXPORT_SOURCES, filter_import_chunk, import_chunk, iter_import_chunks, read_manifest
+)
+
+
+class Command(BaseCommand):
+    help = 'Import an archive written by export_embeddings, one chunk per transaction'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archive to read (.npz)')
+        parser.add_argument('--source', choices=list(EXPORT_SOURCES), action='append',
+                            help='Source to import (default: every source in the archive)')
+        parser.add_argument('--skip-existing', action='store_true',
+                            help='Skip rows whose id already exists instead of failing')
+        parser.add_argument('--snapshot', action='store_true',
+                            help='Write the memory-mapped index snapshot of each imported source afterwards')
+        parser.add_argument('--force', action='store_true',
+                            help='Import even if the vectors were made with another embedding model')
+    
+    def handle(self, *args, **options):
+        try:
+            archive = zipfile.ZipFile(options['path'])
+            manifest = read_manifest(archive)
+        except (OSError, zipfile.BadZipFile, ValueError) as e:
+            raise CommandError(f"Cannot read {options['path']}: {e}")
+        
+        active_model = get_active_embedding_model()
+        if manifest['embedding_model'] != active_model and not options['force']:
+            raise CommandError(
+                f"The archive was made with {manifest['embedding_model']} but {active_model} is active; "
+                f"its vectors would not be comparable (use --force to import anyway)"
+            )
+        
+        sources = [
+            source for source in EXPORT_SOURCES
+            if source in manifest['sources'] and source in (options['source'] or EXPORT_SOURCES)
+        ]
+        start_time = time.time()
+        
+        with archive:
+            for source in sources:
+                self.import_source(archive, manifest, source, options['skip_existing'])
+        
+        elapsed = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(f"Imported {', '.join(sources)} in {elapsed:.1f}s"))
+        
+        if options['snapshot']:
+            # Wait for the import's change log entries to settle, so the snapshot covers them
+            time.sleep(settings.EMBEDDING_INDEX['SETTLE_SECONDS'])
+            for source in sources:
+                path = write_snapshot(source)
+                self.stdout.write(f"Wrote {source} snapshot {path}")
+    
+    def import_source(self, archive, manifest, source, skip_existing):
+        """Import every chunk of one source"""
+        start_time = time.time()
+        total = manifest['sources'][source]['count']
+        inserted = existing = orphans = 0
+        
+        for objects in iter_import_chunks(archive, manifest, source):
+            objects, chunk_existing, chunk_orphans = filter_import_chunk(source, objects, skip_existing)
+            try:
+                inserted += import_chunk(source, objects)
+            except IntegrityError as e:
+                raise CommandError(f"Could not import {source}: {e} (use --skip-existing to keep the rows already there)")
+            existing += chunk_existing
+            orphans += chunk_orphans
+            
+            elapsed = time.time() - start_time
+            self.stdout.write(
+                f"  {source}: {inserted + existing + orphans}/{total} rows, {inserted / max(elapsed, 1e-9):.0f} rows/s"
+            )
+        
+        self.stdout.write(
+            f"{source}: {inserted} imported, {existing} already present, {orphans} without their pet or project "
+            f"({time.time() - start_time:.1f}s)"
+        )
@@ -0,0 +1,168 @@
+import os
+import time
+import multiprocessing
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from face_recognition.models import ReembeddingJob
+from face_recognition.reembedding import (
+    activate_job, count_reembedding_items, embed_batch, exclude_reembedded, get_active_embedding_model,
+    init_reembedding_worker, iter_reembedding_batches, store_batch
+)
+
+
+SOURCES = ('face_exemplar', 'face_vector')
+
+
+class Command(BaseCommand):
+    help = 'Re-embed every stored face with a new embedding model, then swap it in (resumable)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--model', help='Embedding model to re-embed with (starts a new job)')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue the interrupted job, or catch a completed one up with faces stored since')
+        parser.add_argument('--activate', action='store_true',
+                            help='Swap the completed job in (alone: the most recently completed job)')
+        parser.add_argument('--force', action='store_true',
+                            help='Activate even if some faces could not be re-embedded, deleting them')
+        parser.add_argument('--batch-size', type=int,
+                            help='Faces per forward pass (default: REEMBEDDING_BATCH_SIZE)')
+        parser.add_argument('--workers', type=int,
+                            help='Embedding worker processes (default: REEMBEDDING_WORKERS, 0 for one per CPU)')
+    
+    def handle(self, *args, **options):
+        if options['model'] and options['resume']:
+            raise CommandError('Use either --model or --resume')
+        
+        if options['model'] or options['resume']:
+            job = self.get_job(options)
+            self.run(job, options)
+        elif options['activate']:
+            job = ReembeddingJob.objects.filter(status='completed').order_by('-completed_at').first()
+            if job is None:
+                raise CommandError('No completed re-embedding job to activate')
+        else:
+            raise CommandError('Give --model, --resume or --activate')
+        
+        if not options['activate']:
+            self.stdout.write(f"Job {job.id} is ready, activate it with: manage.py reembed_faces --activate")
+            return
+        
+        try:
+            job = activate_job(job, force=options['force'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        self.stdout.write(self.style.SUCCESS(f"Searches now use {job.model_name} (job {job.id})"))
+        self.stdout.write(
+            'Rebuild what was derived from the old vectors: manage.py build_embedding_snapshot, '
+            'build_hnsw_index, train_quantizers and train_ivf'
+        )
+    
+    def get_job(self, options):
+        """Get the job to resume, or start a new one for --model"""
+        if options['resume']:
+            job = ReembeddingJob.objects.filter(status__in=['running', 'completed']).order_by('-created_at').first()
+            if job is None:
+                raise CommandError('No re-embedding job to resume')
+            self.stdout.write(
+                f"Resuming job {job.id} ({job.model_name}) after {job.processed_faces} of {job.total_faces} faces"
+            )
+            return job
+        
+        active_model = get_active_embedding_model()
+        if options['model'] == active_model:
+            raise CommandError(f'{active_model} is already the active embedding model')
+        
+        ReembeddingJob.objects.filter(status__in=['running', 'completed']).update(
+            status='failed', error_message='Superseded by a new job'
+        )
+        job = ReembeddingJob.objects.create(
+            model_name=options['model'],
+            previous_model=active_model,
+            total_faces=count_reembedding_items()
+        )
+        self.stdout.write(f"Re-embedding {job.total_faces} faces with {job.model_name} (job {job.id})")
+        return job
+    
+    def run(self, job, options):
+        """Embed the remaining faces of each source, checkpointing after each batch"""
+        config = settings.REEMBEDDING
+        batch_size = options['batch_size'] or config['BATCH_SIZE']
+        workers = options['workers'] if options['workers'] is not None else config['WORKERS']
+        workers = workers or os.cpu_count() or 1
+        start_time = time.time()
+        
+        job.status = 'running'
+        job.save(update_fields=['status'])
+        
+        try:
+            if workers == 1:
+                init_reembedding_worker(job.model_name)
+                self.collect(job, batch_size, lambda batches: map(embed_batch, batches), 1, start_time)
+            else:
+                # Forked workers never use the parent's database connections
+                connections.close_all()
+                context = multiprocessing.get_context('fork')
+                torch_threads = max(1, (os.cpu_count() or 1) // workers)
+                with context.Pool(workers, initializer=init_reembedding_worker,
+                                  initargs=(job.model_name, torch_threads)) as pool:
+                    self.collect(job, batch_size, lambda batches: pool.imap(embed_batch, batches), workers * 2, start_time)
+        except Exception as e:
+            job.status = 'failed'
+            job.error_message = str(e)
+            job.save(update_fields=['status', 'error_message'])
+            raise
+        
+        job.status = 'completed'
+        job.completed_at = timezone.now()
+        job.save(update_fields=['status', 'completed_at'])
+        self.stdout.write(
+            f"Re-embedded {job.processed_faces - job.failed_faces} faces ({job.failed_faces} failed) "
+            f"in {time.time() - start_time:.1f}s (job {job.id})"
+        )
+    
+    def collect(self, job, batch_size, embed, window, start_time):
+        """
+        Embed each source's faces and store each batch as it finishes
+        
+        The pk-ordered pass resumes from the checkpoint; faces stored since
+        the job started may sort before it, so a catch-up pass then embeds
+        those still without a shadow embedding.
+        """
+        progress = {'start': job.processed_faces, 'reported': job.processed_faces, 'time': start_time}
+        
+        for source in SOURCES:
+            batches = iter_reembedding_batches(source, job.checkpoint.get(source), batch_size)
+            self.embed_batches(job, source, batches, embed, window, progress, checkpoint=True)
+            
+            catch_up = (
+                exclude_reembedded(job, source, batch)
+                for batch in iter_reembedding_batches(source, None, batch_size, since=job.created_at)
+            )
+            self.embed_batches(job, source, (batch for batch in catch_up if batch), embed, window, progress,
+                               checkpoint=False)
+    
+    def embed_batches(self, job, source, batches, embed, window, progress, checkpoint):
+        """Embed batches a window at a time (one batch per worker in flight) and store them in order"""
+        report_every = max(1, job.total_faces // 100)
+        
+        while True:
+            pending = list(islice(batches, window))
+            if not pending:
+                return
+            
+            for batch, embeddings in zip(pending, embed(pending)):
+                store_batch(job, source, batch, embeddings, checkpoint=checkpoint)
+            
+            if job.processed_faces - progress['reported'] >= report_every:
+                progress['reported'] = job.processed_faces
+                done = job.processed_faces - progress['start']
+                remaining = (time.time() - progress['time']) / done * max(0, job.total_faces - job.processed_faces)
+                self.stdout.write(
+                    f"  {job.processed_faces}/{job.total_faces} faces, {job.failed_faces} failed, ~{remaining:.0f}s left"
+                )
@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from face_recognition.index import INDEX_SOURCES, EmbeddingIndex, get_quantizer_path, write_codes
+from face_recognition.quantization import ScalarQuantizer, ProductQuantizer, save_quantizer
+
+
+class Command(BaseCommand):
+    help = 'Train int8 scalar and product quantization codebooks and report their recall against exact search'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=list(INDEX_SOURCES), action='append',
+                            help='Source to train on (default: all)')
+        parser.add_argument('--mode', choices=['sq8', 'pq'], action='append',
+                            help='Quantizer to train (default: both)')
+        parser.add_argument('--subvectors', type=int, default=64,
+                            help='PQ subvectors, i.e. bytes per vector (dimension must be divisible by it)')
+        parser.add_argument('--sample', type=int, default=50000,
+                            help='Maximum number of vectors to train on')
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Stored vectors (plus noise) to use as recall queries, 0 to skip')
+        parser.add_argument('--k', type=int, default=10, help='Neighbours compared for recall@k')
+    
+    def handle(self, *args, **options):
+        for source in options['source'] or list(INDEX_SOURCES):
+            index = EmbeddingIndex(source, backend='exact', quantization='none')
+            index.load()
+            if not len(index):
+                self.stdout.write(f"{source}: no vectors, skipped")
+                continue
+            
+            rng = np.random.default_rng(0)
+            ids, vectors = zip(*index.live_rows())
+            vectors = np.asarray(vectors, dtype=np.float32)
+            sample = vectors[rng.choice(len(vectors), size=min(options['sample'], len(vectors)), replace=False)]
+            
+            for mode in options['mode'] or ['sq8', 'pq']:
+                start_time = time.time()
+                if mode == 'sq8':
+                    quantizer = ScalarQuantizer.train(sample)
+                else:
+                    try:
+                        quantizer = ProductQuantizer.train(sample, options['subvectors'])
+                    except ValueError as e:
+                        raise CommandError(str(e))
+                
+                path = get_quantizer_path(source, mode)
+                save_quantizer(quantizer, str(path))
+                self.stdout.write(
+                    f"{source} {mode}: {quantizer.code_size} bytes per vector "
+                    f"({vectors.shape[1] * 4 / quantizer.code_size:.0f}x smaller), "
+                    f"trained on {len(sample)} vectors in {time.time() - start_time:.1f}s -> {path}"
+                )
+                
+                codes_path = write_codes(source, quantizer)
+                if codes_path is None:
+                    self.stdout.write("  no snapshot: every worker encodes the vectors itself")
+                else:
+                    self.stdout.write(f"  snapshot codes -> {codes_path}")
+                
+                if options['queries']:
+                    self.report_recall(index, quantizer, vectors, options['queries'], options['k'])
+    
+    def report_recall(self, index, quantizer, vectors, count, k):
+        """Compare approximate and re-ranked results with exact search on perturbed stored vectors"""
+        index.quantizer = quantizer
+        index.reset_rows(vectors, [str(i) for i in range(len(vectors))], np.zeros(len(vectors), dtype=np.uint8))
+        
+        rng = np.random.default_rng(1)
+        queries = vectors[rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)]
+        queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+        
+        recall = {'approximate': 0.0, 'reranked': 0.0}
+        for query in queries:
+            exact = {object_id for object_id, _ in index.search_exact(query, k)}
+            approximate = {object_id for object_id, _ in index.search_quantized(query, k, rerank_factor=0)}
+            reranked = {object_id for object_id, _ in index.search_quantized(query, k)}
+            recall['approximate'] += len(exact & approximate) / len(exact)
+            recall['reranked'] += len(exact & reranked) / len(exact)
+        
+        self.stdout.write(
+            f"  recall@{k} over {len(queries)} queries: {recall['approximate'] / len(queries):.3f} from codes only, "
+            f"{recall['reranked'] / len(queries):.3f} after re-ranking"
+        )
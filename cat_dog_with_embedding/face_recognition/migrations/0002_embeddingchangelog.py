@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingChangeLog',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('source', models.CharField(choices=[('face_embedding', 'Face Embedding'), ('face_vector', 'Face Vector')], max_length=20)),
+                ('object_id', models.CharField(max_length=64)),
+                ('operation', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['seq'],
+                'indexes': [models.Index(fields=['source', 'seq'], name='face_recogn_source_3805b7_idx'), models.Index(fields=['source', 'object_id'], name='face_recogn_source_1fef83_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition', '0002_embeddingchangelog'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='embeddingchangelog',
+            name='source',
+            field=models.CharField(choices=[('face_embedding', 'Face Embedding'), ('face_vector', 'Face Vector'), ('face_project', 'Face Project')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0001_initial'),
+        ('face_recognition', '0003_alter_embeddingchangelog_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceExemplar',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('vector', models.BinaryField()),
+                ('vector_dimension', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('face_embedding', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exemplars', to='face_recognition.faceembedding')),
+                ('pet_image', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='face_exemplars', to='pets.petimage')),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition', '0004_faceexemplar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateScanJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('face_embedding', 'Face Embedding'), ('face_vector', 'Face Vector'), ('face_project', 'Face Project')], max_length=20)),
+                ('threshold', models.FloatField()),
+                ('tile_size', models.IntegerField()),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('snapshot_path', models.CharField(blank=True, default='', max_length=500)),
+                ('total_rows', models.IntegerField(default=0)),
+                ('total_tiles', models.IntegerField(default=0)),
+                ('completed_tiles', models.IntegerField(default=0)),
+                ('pairs_found', models.IntegerField(default=0)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DuplicateCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('face_embedding', 'Face Embedding'), ('face_vector', 'Face Vector'), ('face_project', 'Face Project')], max_length=20)),
+                ('object_id_a', models.CharField(max_length=64)),
+                ('object_id_b', models.CharField(max_length=64)),
+                ('similarity_score', models.FloatField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed duplicate'), ('dismissed', 'Dismissed')], default='pending', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidates', to='face_recognition.duplicatescanjob')),
+            ],
+            options={
+                'ordering': ['-similarity_score'],
+                'unique_together': {('job', 'object_id_a', 'object_id_b')},
+            },
+        ),
+    ]
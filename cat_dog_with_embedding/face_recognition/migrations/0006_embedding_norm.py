@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:21
+
+from django.db import migrations, models
+import numpy as np
+
+
+def normalize_embeddings(apps, schema_editor):
+    """L2-normalize the stored embeddings and exemplars, keeping their norms"""
+    FaceEmbedding = apps.get_model('face_recognition', 'FaceEmbedding')
+    FaceExemplar = apps.get_model('face_recognition', 'FaceExemplar')
+
+    batch = []
+    for face_embedding in FaceEmbedding.objects.filter(embedding_norm__isnull=True).only('pk', 'embedding_vector').iterator(chunk_size=1000):
+        vector = np.asarray(face_embedding.embedding_vector or [], dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        face_embedding.embedding_vector = (vector / (norm or 1.0)).tolist()
+        face_embedding.embedding_norm = norm
+        batch.append(face_embedding)
+        if len(batch) == 1000:
+            FaceEmbedding.objects.bulk_update(batch, ['embedding_vector', 'embedding_norm'])
+            batch = []
+    FaceEmbedding.objects.bulk_update(batch, ['embedding_vector', 'embedding_norm'])
+
+    batch = []
+    for exemplar in FaceExemplar.objects.filter(vector_norm__isnull=True).only('pk', 'vector').iterator(chunk_size=1000):
+        vector = np.frombuffer(bytes(exemplar.vector), dtype=np.float16).astype(np.float32)
+        norm = float(np.linalg.norm(vector))
+        exemplar.vector = (vector / (norm or 1.0)).astype(np.float16).tobytes()
+        exemplar.vector_norm = norm
+        batch.append(exemplar)
+        if len(batch) == 1000:
+            FaceExemplar.objects.bulk_update(batch, ['vector', 'vector_norm'])
+            batch = []
+    FaceExemplar.objects.bulk_update(batch, ['vector', 'vector_norm'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition', '0005_duplicatescanjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceembedding',
+            name='embedding_norm',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='faceexemplar',
+            name='vector_norm',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(normalize_embeddings, migrations.RunPython.noop),
+    ]
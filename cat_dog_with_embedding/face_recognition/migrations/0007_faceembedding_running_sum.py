@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition', '0006_embedding_norm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceembedding',
+            name='embedding_sum',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='faceembedding',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition', '0007_faceembedding_running_sum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReembeddingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=200)),
+                ('previous_model', models.CharField(blank=True, default='', max_length=200)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('active', 'Active'), ('retired', 'Retired'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('total_faces', models.IntegerField(default=0)),
+                ('processed_faces', models.IntegerField(default=0)),
+                ('failed_faces', models.IntegerField(default=0)),
+                ('checkpoint', models.JSONField(blank=True, default=dict)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('activated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='embeddingchangelog',
+            name='operation',
+            field=models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete'), ('reset', 'Reset')], max_length=10),
+        ),
+        migrations.CreateModel(
+            name='ShadowEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('face_exemplar', 'Face Exemplar'), ('face_vector', 'Face Vector')], max_length=20)),
+                ('object_id', models.CharField(max_length=64)),
+                ('vector', models.BinaryField()),
+                ('vector_dimension', models.IntegerField()),
+                ('vector_norm', models.FloatField()),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shadow_embeddings', to='face_recognition.reembeddingjob')),
+            ],
+            options={
+                'unique_together': {('job', 'source', 'object_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face_recognition', '0008_reembeddingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceembedding',
+            name='failed_images',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,188 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no model replica becomes available within the wait timeout"""
+
+
+class ModelPool:
+    """
+    Bounded pool of model replicas for concurrent inference
+    
+    YOLO and SentenceTransformer objects are not documented as thread-safe, so
+    each replica is lent to one caller at a time. Replicas are created lazily
+    up to ``size`` and callers wait (up to ``timeout`` seconds) when all of
+    them are checked out.
+    """
+    
+    def __init__(self, name: str, factory: Callable[[], Any], size: int, timeout: float):
+        self.name = name
+        self.factory = factory
+        self.size = max(1, size)
+        self.timeout = timeout
+        
+        self._idle = []
+        self._created = 0
+        self.reset()
+    
+    def reset(self):
+        """Recreate the lock and metrics, e.g. in a freshly forked worker"""
+        self._condition = threading.Condition()
+        self._in_use = 0
+        
+        # Metrics
+        self._started = time.monotonic()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._busy_total = 0.0
+    
+    def checkout(self, timeout: Optional[float] = None) -> Any:
+        """
+        Borrow a replica, creating one if the pool is not full yet
+        
+        Args:
+            timeout: Seconds to wait for a free replica, defaults to the pool timeout
+            
+        Returns:
+            Model replica, which must be returned with checkin()
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        
+        with self._condition:
+            while not self._idle and self._created >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"No {self.name} replica available after {timeout:.1f}s")
+                self._condition.wait(remaining)
+            
+            replica = self._idle.pop() if self._idle else None
+            if replica is None:
+                # Reserve the slot now, build the replica outside the lock
+                self._created += 1
+            self._in_use += 1
+            wait = time.monotonic() - start
+        
+        if replica is None:
+            try:
+                replica = self.factory()
+                logger.info(f"Created {self.name} replica {self._created}/{self.size}")
+            except Exception:
+                with self._condition:
+                    self._created -= 1
+                    self._in_use -= 1
+                    self._condition.notify()
+                raise
+        
+        with self._condition:
+            self._checkouts += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            log_stats = self._checkouts % settings.MODEL_POOL['LOG_EVERY'] == 0
+        
+        if log_stats:
+            logger.info(f"Model pool {self.name}: {self.stats()}")
+        
+        return replica
+    
+    def checkin(self, replica: Any, busy_time: float = 0.0):
+        """Return a borrowed replica to the pool"""
+        with self._condition:
+            self._idle.append(replica)
+            self._in_use -= 1
+            self._busy_total += busy_time
+            self._condition.notify()
+    
+    @contextmanager
+    def borrow(self, timeout: Optional[float] = None):
+        """Context manager that checks a replica out and always checks it back in"""
+        replica = self.checkout(timeout)
+        start = time.monotonic()
+        try:
+            yield replica
+        finally:
+            self.checkin(replica, time.monotonic() - start)
+    
+    def preload(self, count: int = 1):
+        """Eagerly create replicas so the first requests do not pay the load"""
+        replicas = [self.checkout() for _ in range(min(count, self.size))]
+        for replica in replicas:
+            self.checkin(replica)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get wait time and utilization metrics for this pool"""
+        with self._condition:
+            elapsed = max(time.monotonic() - self._started, 1e-9)
+            return {
+                'name': self.name,
+                'size': self.size,
+                'created': self._created,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'avg_wait_ms': (self._wait_total / self._checkouts * 1000) if self._checkouts else 0.0,
+                'max_wait_ms': self._wait_max * 1000,
+                'utilization': self._busy_total / (elapsed * self.size),
+            }
+
+
+_pools: Dict[str, ModelPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_model_pool(name: str, factory: Callable[[], Any], size: int) -> ModelPool:
+    """
+    Get the process-wide pool for a model, creating it on first use
+    
+    Args:
+        name: Pool key, e.g. the model path or name
+        factory: Callable building one replica
+        size: Maximum number of replicas
+        
+    Returns:
+        ModelPool shared by all service instances in this process
+    """
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = ModelPool(name, factory, size, settings.MODEL_POOL['WAIT_TIMEOUT'])
+            _pools[name] = pool
+        return pool
+
+
+def get_model_pools() -> List[ModelPool]:
+    """Get every model pool created in this process"""
+    with _pools_lock:
+        return list(_pools.values())
+
+
+def get_pool_stats() -> List[Dict[str, Any]]:
+    """Get metrics for every model pool in this process"""
+    return [pool.stats() for pool in get_model_pools()]
+
+
+def _reset_pools_after_fork():
+    """Locks held by other threads at fork time would never be released in the child"""
+    global _pools_lock
+    _pools_lock = threading.Lock()
+    for pool in _pools.values():
+        # Replicas lent out at fork time belong to threads that do not exist in the child
+        pool._created = len(pool._idle)
+        pool.reset()
+
+
+os.register_at_fork(after_in_child=_reset_pools_after_fork)
@@ -1,10 +1,14 @@
 from django.db import models
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from datetime import timedelta
 import uuid
 import numpy as np
 import json
 
+from .similarity import normalize, similarities
+
 User = get_user_model()
 
 
@@ -19,7 +23,8 @@ class FaceEmbedding(models.Model):
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     pet = models.ForeignKey('pets.Pet', on_delete=models.CASCADE, related_name='face_embeddings')
-    embedding_vector = models.JSONField()  # Store the embedding as JSON array
+    embedding_vector = models.JSONField()  # Store the embedding as JSON array (L2-normalized)
+    embedding_norm = models.FloatField(blank=True, null=True)  # L2 norm before normalization
     embedding_model = models.CharField(max_length=100, default='clip-ViT-B-32')
     vector_dimension = models.IntegerField()
     status = models.CharField(max_length=20, choices=EMBEDDING_STATUS, default='pending')
@@ -28,6 +33,13 @@ class FaceEmbedding(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     source_images_count = models.IntegerField(default=0)
     
+    # Running float32 sum of the per-image embeddings the vector is the mean
+    # of, so new images are added without re-embedding the old ones
+    embedding_sum = models.BinaryField(blank=True, null=True)
+    version = models.PositiveIntegerField(default=1)  # Bumped whenever the vector is recomputed
+    # PetImage ids no face could be embedded from, so updates do not detect them again
+    failed_images = models.JSONField(default=list, blank=True)
+    
     # Metadata about the embedding creation process
     processing_time = models.FloatField(blank=True, null=True)  # Time in seconds
     confidence_score = models.FloatField(blank=True, null=True)
@@ -40,36 +52,71 @@ class FaceEmbedding(models.Model):
         return f"Face Embedding for {self.pet.name} - {self.status}"
     
     def set_embedding_vector(self, vector):
-        """Set embedding vector from numpy array"""
-        if isinstance(vector, np.ndarray):
-            self.embedding_vector = vector.tolist()
-            self.vector_dimension = len(vector)
-        else:
-            self.embedding_vector = vector
-            self.vector_dimension = len(vector)
+        """Set embedding vector from numpy array or list, L2-normalized so similarity is a dot product"""
+        vector, norm = normalize(vector)
+        self.embedding_vector = vector.tolist()
+        self.vector_dimension = len(vector)
+        self.embedding_norm = norm
     
     def get_embedding_vector(self):
         """Get embedding vector as numpy array"""
         return np.array(self.embedding_vector)
     
+    def get_embedding_sum(self):
+        """Get the running sum of the per-image embeddings as a float32 numpy array"""
+        if self.embedding_sum:
+            return np.frombuffer(bytes(self.embedding_sum), dtype=np.float32).copy()
+        # Written before the sum was kept: the mean times the number of images
+        vector = np.asarray(self.embedding_vector, dtype=np.float32)
+        return vector * (self.embedding_norm or 1.0) * self.source_images_count
+    
+    def add_image_embeddings(self, embeddings):
+        """Add per-image embeddings to the running sum and set the vector to the new mean"""
+        total = np.sum(np.asarray(embeddings, dtype=np.float32), axis=0)
+        if self.source_images_count:
+            total += self.get_embedding_sum()
+        self.source_images_count += len(embeddings)
+        self.embedding_sum = total.tobytes()
+        self.set_embedding_vector(total / self.source_images_count)
+    
     def calculate_similarity(self, other_embedding):
         """Calculate cosine similarity with another embedding"""
         if isinstance(other_embedding, FaceEmbedding):
             other_vector = other_embedding.get_embedding_vector()
         else:
-            other_vector = np.array(other_embedding)
-        
-        this_vector = self.get_embedding_vector()
-        
-        # Cosine similarity
-        dot_product = np.dot(this_vector, other_vector)
-        magnitude1 = np.linalg.norm(this_vector)
-        magnitude2 = np.linalg.norm(other_vector)
+            other_vector, _ = normalize(other_embedding)
         
-        if magnitude1 == 0 or magnitude2 == 0:
-            return 0
-        
-        return dot_product / (magnitude1 * magnitude2)
+        return float(similarities(other_vector, self.get_embedding_vector())[0, 0])
+
+
+class FaceExemplar(models.Model):
+    """Per-image embedding kept alongside the averaged FaceEmbedding, for re-ranking"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    face_embedding = models.ForeignKey(FaceEmbedding, on_delete=models.CASCADE, related_name='exemplars')
+    pet_image = models.ForeignKey('pets.PetImage', on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='face_exemplars')
+    vector = models.BinaryField()  # L2-normalized float16, half the size of float32
+    vector_dimension = models.IntegerField()
+    vector_norm = models.FloatField(blank=True, null=True)  # L2 norm before normalization
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['created_at']
+    
+    def __str__(self):
+        return f"Exemplar of {self.face_embedding_id}"
+    
+    def set_vector(self, vector):
+        """Set the vector from a numpy array or list, L2-normalized"""
+        vector, norm = normalize(vector)
+        self.vector = vector.astype(np.float16).tobytes()
+        self.vector_dimension = len(vector)
+        self.vector_norm = norm
+    
+    def get_vector(self):
+        """Get the vector as a float32 numpy array"""
+        return np.frombuffer(bytes(self.vector), dtype=np.float16).astype(np.float32)
 
 
 class FaceRecognitionResult(models.Model):
@@ -119,9 +166,10 @@ class FaceRecognitionResult(models.Model):
     @classmethod
     def determine_confidence_level(cls, similarity_score):
         """Determine confidence level based on similarity score"""
-        if similarity_score >= 0.90:
+        thresholds = settings.FACE_SIMILARITY_THRESHOLD
+        if similarity_score >= thresholds['EAGLE_TRAIL']:
             return 'eagle_trail'
-        elif similarity_score >= 0.80:
+        elif similarity_score >= thresholds['LOBO_TRAIL']:
             return 'lobo_trail'
         else:
             return 'no_match'
@@ -209,3 +257,221 @@ class EmbeddingProcessingJob(models.Model):
         if self.total_images == 0:
             return 0
         return (self.processed_images / self.total_images) * 100
+
+
+class EmbeddingChangeLog(models.Model):
+    """Append-only log of embedding writes, replayed by the in-memory search indexes"""
+    SOURCES = [
+        ('face_embedding', 'Face Embedding'),
+        ('face_vector', 'Face Vector'),
+        ('face_project', 'Face Project'),  # Project centroids
+    ]
+    
+    OPERATIONS = [
+        ('upsert', 'Upsert'),
+        ('delete', 'Delete'),
+        ('reset', 'Reset'),  # Every row changed (embedding model swap): reload from the database
+    ]
+    
+    seq = models.BigAutoField(primary_key=True)
+    source = models.CharField(max_length=20, choices=SOURCES)
+    object_id = models.CharField(max_length=64)
+    operation = models.CharField(max_length=10, choices=OPERATIONS)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['seq']
+        indexes = [
+            models.Index(fields=['source', 'seq']),
+            models.Index(fields=['source', 'object_id']),
+        ]
+    
+    def __str__(self):
+        return f"#{self.seq} {self.operation} {self.source} {self.object_id}"
+    
+    @classmethod
+    def record(cls, source, object_ids, operation):
+        """
+        Append changes for a batch of objects
+        
+        Call inside the transaction that writes the objects themselves, so the
+        log and the embedding tables never disagree.
+        """
+        cls.objects.bulk_create([
+            cls(source=source, object_id=str(object_id), operation=operation)
+            for object_id in object_ids
+        ])
+    
+    @classmethod
+    def latest_seq(cls, source):
+        """Get the sequence number of the last change for a source"""
+        return cls.objects.filter(source=source).aggregate(models.Max('seq'))['seq__max'] or 0
+    
+    @classmethod
+    def settled_seq(cls, source):
+        """
+        Get the last sequence number below which every change has committed
+        
+        Sequence numbers are allocated at insert but become visible at commit,
+        so the newest entries may still have an uncommitted predecessor. Entries
+        older than EMBEDDING_INDEX['SETTLE_SECONDS'] are taken as final.
+        """
+        settled = timezone.now() - timedelta(seconds=settings.EMBEDDING_INDEX['SETTLE_SECONDS'])
+        return cls.objects.filter(
+            source=source, created_at__lte=settled
+        ).aggregate(models.Max('seq'))['seq__max'] or 0
+    
+    @classmethod
+    def compact(cls, retention):
+        """
+        Drop entries superseded by a later change of the same object, and
+        tombstones older than the retention period
+        
+        Returns:
+            Number of deleted entries
+        """
+        latest = cls.objects.values('source', 'object_id').annotate(
+            latest_seq=models.Max('seq')
+        ).values('latest_seq')
+        superseded, _ = cls.objects.exclude(seq__in=models.Subquery(latest)).delete()
+        
+        expired, _ = cls.objects.filter(
+            operation='delete',
+            created_at__lt=timezone.now() - retention
+        ).delete()
+        
+        return superseded + expired
+
+
+class DuplicateScanJob(models.Model):
+    """
+    All-pairs similarity scan of one embedding source for duplicate registrations
+    
+    The rows are frozen in a private snapshot file when the job starts, and
+    tiles are numbered in a fixed order, so `completed_tiles` is the
+    checkpoint an interrupted job resumes from.
+    """
+    JOB_STATUS = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    source = models.CharField(max_length=20, choices=EmbeddingChangeLog.SOURCES)
+    threshold = models.FloatField()
+    tile_size = models.IntegerField()
+    status = models.CharField(max_length=20, choices=JOB_STATUS, default='running')
+    snapshot_path = models.CharField(max_length=500, blank=True, default='')
+    
+    # Progress
+    total_rows = models.IntegerField(default=0)
+    total_tiles = models.IntegerField(default=0)
+    completed_tiles = models.IntegerField(default=0)
+    pairs_found = models.IntegerField(default=0)
+    error_message = models.TextField(blank=True, null=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Duplicate scan {self.id} of {self.source} ({self.completed_tiles}/{self.total_tiles} tiles) - {self.status}"
+
+
+class DuplicateCandidate(models.Model):
+    """Two registrations whose embeddings are similar enough to be the same animal"""
+    REVIEW_STATUS = [
+        ('pending', 'Pending'),
+        ('confirmed', 'Confirmed duplicate'),
+        ('dismissed', 'Dismissed'),
+    ]
+    
+    job = models.ForeignKey(DuplicateScanJob, on_delete=models.CASCADE, related_name='candidates')
+    source = models.CharField(max_length=20, choices=EmbeddingChangeLog.SOURCES)
+    object_id_a = models.CharField(max_length=64)
+    object_id_b = models.CharField(max_length=64)
+    similarity_score = models.FloatField()
+    status = models.CharField(max_length=20, choices=REVIEW_STATUS, default='pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-similarity_score']
+        unique_together = ['job', 'object_id_a', 'object_id_b']
+    
+    def __str__(self):
+        return f"{self.source} {self.object_id_a} ~ {self.object_id_b} ({self.similarity_score:.3f})"
+
+
+class ReembeddingJob(models.Model):
+    """
+    Re-embedding of every stored face with a new embedding model
+    
+    New vectors go to ShadowEmbedding rows while searches keep using the
+    current ones; faces are processed in primary key order per source, so
+    `checkpoint` (last pk done per source) is where an interrupted job
+    resumes. Activating a completed job copies the vectors over in
+    checkpointed batches (job.checkpoint['activation']), then swaps the
+    active model in one short transaction.
+    """
+    JOB_STATUS = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),  # Shadow vectors ready to activate
+        ('active', 'Active'),        # Its model is the one searches use
+        ('retired', 'Retired'),      # Replaced by a later activation
+        ('failed', 'Failed'),
+    ]
+    
+    model_name = models.CharField(max_length=200)
+    previous_model = models.CharField(max_length=200, blank=True, default='')
+    status = models.CharField(max_length=20, choices=JOB_STATUS, default='running')
+    
+    # Progress
+    total_faces = models.IntegerField(default=0)
+    processed_faces = models.IntegerField(default=0)
+    failed_faces = models.IntegerField(default=0)
+    checkpoint = models.JSONField(default=dict, blank=True)
+    error_message = models.TextField(blank=True, null=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    activated_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Re-embedding {self.id} with {self.model_name} ({self.processed_faces}/{self.total_faces}) - {self.status}"
+
+
+class ShadowEmbedding(models.Model):
+    """A face re-embedded by a ReembeddingJob, swapped in when the job is activated"""
+    SOURCES = [
+        ('face_exemplar', 'Face Exemplar'),  # Re-cropped from the PetImage and its detection
+        ('face_vector', 'Face Vector'),      # Read from the stored face crop
+    ]
+    
+    job = models.ForeignKey(ReembeddingJob, on_delete=models.CASCADE, related_name='shadow_embeddings')
+    source = models.CharField(max_length=20, choices=SOURCES)
+    object_id = models.CharField(max_length=64)
+    vector = models.BinaryField()  # float32, L2-normalized
+    vector_dimension = models.IntegerField()
+    vector_norm = models.FloatField()  # L2 norm before normalization
+    
+    class Meta:
+        unique_together = ['job', 'source', 'object_id']
+    
+    def __str__(self):
+        return f"Shadow {self.source} {self.object_id} of job {self.job_id}"
+    
+    def set_vector(self, vector):
+        """Store a new-model embedding, L2-normalized"""
+        vector, norm = normalize(vector)
+        self.vector = vector.tobytes()
+        self.vector_dimension = len(vector)
+        self.vector_norm = norm
+    
+    def get_vector(self):
+        """Get the embedding as a float32 numpy array"""
+        return np.frombuffer(bytes(self.vector), dtype=np.float32)
@@ -0,0 +1,95 @@
+import gc
+import os
+import time
+import logging
+from typing import Dict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_preloaded = False
+
+
+def preload_models():
+    """
+    Load and freeze every model replica in the gunicorn master before forking
+    
+    Workers then share the weight pages copy-on-write instead of each loading
+    its own copy. Torch stays single-threaded in the master so no thread pool
+    exists at fork time; after_fork() applies the real runtime profile.
+    Only call this where workers are forked afterwards (gunicorn.conf.py's
+    on_starting hook with preload_app), or the profile is never resumed.
+    """
+    global _preloaded
+    
+    from .runtime import defer_runtime_profile
+    from .model_pool import get_model_pools
+    from .services import YOLODetectionService, FaceEmbeddingService
+    
+    start_time = time.time()
+    defer_runtime_profile()
+    
+    detection_service = YOLODetectionService()
+    if settings.YOLO_CASCADE['ENDPOINTS']:
+        detection_service.get_small_model_pool()
+    FaceEmbeddingService()
+    
+    # Load every replica now so none of them is created privately in a worker
+    for pool in get_model_pools():
+        pool.preload(pool.size)
+    
+    # Move everything allocated so far out of the collector's reach, so GC
+    # passes in the workers do not write to (and un-share) these pages
+    gc.collect()
+    gc.freeze()
+    
+    _preloaded = True
+    logger.info(f"Preloaded models for copy-on-write sharing in {time.time() - start_time:.1f}s")
+
+
+def after_fork():
+    """Re-initialize per-process state in a worker forked from a preloaded master"""
+    if not _preloaded:
+        return
+    
+    from .runtime import resume_runtime_profile
+    
+    resume_runtime_profile()
+
+
+def get_memory_report() -> Dict[str, float]:
+    """
+    Get this process' resident memory split into shared and private pages (MB)
+    
+    Reads /proc/self/smaps_rollup, so it is only available on Linux.
+    """
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    except OSError:
+        return {}
+    
+    return {
+        'rss_mb': fields.get('Rss', 0.0),
+        'pss_mb': fields.get('Pss', 0.0),
+        'shared_mb': fields.get('Shared_Clean', 0.0) + fields.get('Shared_Dirty', 0.0),
+        'private_mb': fields.get('Private_Clean', 0.0) + fields.get('Private_Dirty', 0.0),
+    }
+
+
+def log_memory_report(label: str = ''):
+    """Log private versus shared RSS for this process"""
+    report = get_memory_report()
+    if not report:
+        logger.info(f"Memory report unavailable for {label or os.getpid()}")
+        return
+    
+    logger.info(
+        f"Memory {label or os.getpid()}: rss={report['rss_mb']:.0f}MB shared={report['shared_mb']:.0f}MB "
+        f"private={report['private_mb']:.0f}MB pss={report['pss_mb']:.0f}MB (preloaded={_preloaded})"
+    )
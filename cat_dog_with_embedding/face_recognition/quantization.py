@@ -0,0 +1,187 @@
+import os
+import tempfile
+
+import numpy as np
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 25, seed: int = 0) -> np.ndarray:
+    """
+    Plain Lloyd's k-means (squared Euclidean distance)
+    
+    Args:
+        vectors: (n, d) training vectors
+        n_clusters: Number of centroids
+        iterations: Number of Lloyd iterations
+        seed: Random seed
+        
+    Returns:
+        (n_clusters, d) float32 centroids
+    """
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), size=n_clusters, replace=False)].copy()
+    
+    for _ in range(iterations):
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, and |x|^2 does not change the argmin
+        distances = (centroids ** 2).sum(axis=1) - 2 * vectors @ centroids.T
+        assignments = np.argmin(distances, axis=1)
+        
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled][:, None]
+        # Re-seed empty clusters on random training vectors
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), size=len(empty), replace=False)]
+    
+    return centroids
+
+
+class ScalarQuantizer:
+    """
+    Per-dimension 8-bit scalar quantization (4x smaller than float32)
+    
+    Each dimension is mapped linearly from its trained [min, max] range onto
+    0..255. Scores are computed asymmetrically: the query stays float, so
+    q . x ~= q . min + (q * scale) . code.
+    """
+    
+    kind = 'sq8'
+    
+    def __init__(self, minimum: np.ndarray, scale: np.ndarray):
+        self.minimum = np.asarray(minimum, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.dimension = len(self.minimum)
+    
+    @property
+    def code_size(self) -> int:
+        return self.dimension
+    
+    @classmethod
+    def train(cls, vectors: np.ndarray) -> 'ScalarQuantizer':
+        vectors = np.asarray(vectors, dtype=np.float32)
+        minimum = vectors.min(axis=0)
+        scale = (vectors.max(axis=0) - minimum) / 255
+        scale[scale == 0] = 1.0
+        return cls(minimum, scale)
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self.minimum) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+    
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * self.scale + self.minimum
+    
+    def scores(self, codes: np.ndarray, query: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+        """Approximate dot products of a float query with every code"""
+        weights = query * self.scale
+        offset = float(query @ self.minimum)
+        scores = np.empty(len(codes), dtype=np.float32)
+        # Chunked so the float copy of the codes stays small
+        for start in range(0, len(codes), chunk_size):
+            scores[start:start + chunk_size] = codes[start:start + chunk_size].astype(np.float32) @ weights + offset
+        return scores
+    
+    def arrays(self):
+        return {'minimum': self.minimum, 'scale': self.scale}
+
+
+class ProductQuantizer:
+    """
+    Product quantization with asymmetric distance computation (ADC)
+    
+    The vector is split into ``subvectors`` equal chunks and each chunk is
+    replaced by the index of its nearest centroid in a 256-entry codebook
+    trained for that chunk, so a 512-dim float32 vector (2KB) becomes 64 or
+    32 bytes. At query time one lookup table of query-chunk . centroid dot
+    products is built per chunk and a code's score is the sum of its entries.
+    """
+    
+    kind = 'pq'
+    
+    def __init__(self, codebooks: np.ndarray):
+        # (subvectors, 256, subvector dimension)
+        self.codebooks = np.asarray(codebooks, dtype=np.float32)
+        self.subvectors, self.n_centroids, self.sub_dimension = self.codebooks.shape
+        self.dimension = self.subvectors * self.sub_dimension
+    
+    @property
+    def code_size(self) -> int:
+        return self.subvectors
+    
+    @classmethod
+    def train(cls, vectors: np.ndarray, subvectors: int = 64, iterations: int = 25, seed: int = 0) -> 'ProductQuantizer':
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape[1] % subvectors:
+            raise ValueError(f"Dimension {vectors.shape[1]} is not divisible by {subvectors} subvectors")
+        
+        sub_dimension = vectors.shape[1] // subvectors
+        codebooks = np.zeros((subvectors, 256, sub_dimension), dtype=np.float32)
+        for i in range(subvectors):
+            chunk = vectors[:, i * sub_dimension:(i + 1) * sub_dimension]
+            centroids = kmeans(chunk, 256, iterations, seed + i)
+            codebooks[i, :len(centroids)] = centroids
+        return cls(codebooks)
+    
+    def split(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float32).reshape(-1, self.subvectors, self.sub_dimension)
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        chunks = self.split(vectors)
+        codes = np.empty((len(chunks), self.subvectors), dtype=np.uint8)
+        norms = (self.codebooks ** 2).sum(axis=2)
+        for i in range(self.subvectors):
+            distances = norms[i] - 2 * chunks[:, i] @ self.codebooks[i].T
+            codes[:, i] = np.argmin(distances, axis=1)
+        return codes
+    
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = [self.codebooks[i][codes[:, i]] for i in range(self.subvectors)]
+        return np.concatenate(parts, axis=1)
+    
+    def scores(self, codes: np.ndarray, query: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+        """Approximate dot products of a float query with every code (ADC)"""
+        # (subvectors, 256) table of partial dot products
+        table = np.einsum('sd,scd->sc', self.split(query)[0], self.codebooks)
+        scores = np.empty(len(codes), dtype=np.float32)
+        columns = np.arange(self.subvectors)
+        for start in range(0, len(codes), chunk_size):
+            block = codes[start:start + chunk_size]
+            scores[start:start + chunk_size] = table[columns, block].sum(axis=1)
+        return scores
+    
+    def arrays(self):
+        return {'codebooks': self.codebooks}
+
+
+QUANTIZERS = {
+    ScalarQuantizer.kind: ScalarQuantizer,
+    ProductQuantizer.kind: ProductQuantizer,
+}
+
+
+def save_quantizer(quantizer, path: str):
+    """Write a trained quantizer to an .npz file, atomically replacing any previous one"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, kind=np.array(quantizer.kind), **quantizer.arrays())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def load_quantizer(path: str):
+    """Read a quantizer written by save_quantizer()"""
+    with np.load(path) as data:
+        kind = str(data['kind'])
+        arrays = {name: data[name] for name in data.files if name != 'kind'}
+    return QUANTIZERS[kind](**arrays)
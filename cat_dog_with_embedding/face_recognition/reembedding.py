@@ -0,0 +1,425 @@
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from sentence_transformers import SentenceTransformer
+
+from .models import EmbeddingChangeLog, FaceDetection, FaceEmbedding, FaceExemplar, ReembeddingJob, ShadowEmbedding
+from .runtime import apply_runtime_profile, freeze_module, inference_mode
+from .signals import embedding_model_activated
+
+logger = logging.getLogger(__name__)
+
+
+_active_model: Optional[str] = None
+_active_model_checked = 0.0
+_active_model_lock = threading.Lock()
+
+
+def get_active_embedding_model() -> str:
+    """
+    Get the embedding model searches and registrations use
+    
+    That is the model of the last activated ReembeddingJob, or
+    FACE_EMBEDDING_MODEL when none was ever activated; the database is
+    re-checked at most every REEMBEDDING['ACTIVE_MODEL_TTL'] seconds.
+    """
+    global _active_model, _active_model_checked
+    
+    with _active_model_lock:
+        if _active_model is None or time.monotonic() - _active_model_checked > settings.REEMBEDDING['ACTIVE_MODEL_TTL']:
+            try:
+                model_name = (
+                    ReembeddingJob.objects.filter(status='active').order_by('-activated_at')
+                    .values_list('model_name', flat=True).first()
+                )
+            except Exception as e:
+                logger.error(f"Could not read the active embedding model: {e}")
+                return _active_model or settings.FACE_EMBEDDING_MODEL
+            _active_model = model_name or settings.FACE_EMBEDDING_MODEL
+            _active_model_checked = time.monotonic()
+        return _active_model
+
+
+def count_reembedding_items() -> int:
+    """Get the number of faces a re-embedding job has to embed"""
+    FaceVector = apps.get_model('simple_face_id', 'FaceVector')
+    return FaceExemplar.objects.count() + FaceVector.objects.count()
+
+
+def get_reembedding_batch(source: str, after: Optional[str], batch_size: int,
+                          since=None) -> List[Tuple[str, str, Optional[list]]]:
+    """
+    Get the next faces of a source to re-embed, in primary key order
+    
+    Exemplars are re-cropped from their PetImage with the bounding box of
+    its best detection; face vectors are read from their stored crop.
+    Neither runs the detector again. Exemplars without an image get an
+    empty path and count as failed.
+    
+    Args:
+        source: 'face_exemplar' or 'face_vector'
+        after: Checkpoint, the last pk already done
+        batch_size: Faces per batch
+        since: Only faces stored at or after this time
+        
+    Returns:
+        List of (object_id, image path, bounding box or None)
+    """
+    media_root = Path(settings.MEDIA_ROOT)
+    
+    if source == 'face_exemplar':
+        queryset = FaceExemplar.objects.all()
+        if after:
+            queryset = queryset.filter(pk__gt=after)
+        if since is not None:
+            queryset = queryset.filter(created_at__gte=since)
+        rows = list(queryset.order_by('pk').values_list('pk', 'pet_image_id', 'pet_image__image')[:batch_size])
+        
+        boxes: Dict[str, list] = {}
+        for image_id, bounding_box in (
+            FaceDetection.objects.filter(image_id__in=[image_id for _, image_id, _ in rows])
+            .order_by('image_id', '-confidence').values_list('image_id', 'bounding_box')
+        ):
+            boxes.setdefault(image_id, bounding_box)
+        
+        # An image without a recorded detection is embedded whole
+        return [
+            (str(object_id), str(media_root / image) if image else '', boxes.get(image_id))
+            for object_id, image_id, image in rows
+        ]
+    
+    FaceVector = apps.get_model('simple_face_id', 'FaceVector')
+    queryset = FaceVector.objects.all()
+    if after:
+        queryset = queryset.filter(pk__gt=after)
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=since)
+    return [
+        (str(object_id), str(media_root / face_crop_path), None)
+        for object_id, face_crop_path in queryset.order_by('pk').values_list('pk', 'face_crop_path')[:batch_size]
+    ]
+
+
+def iter_reembedding_batches(source: str, after: Optional[str], batch_size: int,
+                             since=None) -> Iterator[List[Tuple[str, str, Optional[list]]]]:
+    """Yield the batches of a source after a checkpoint, one keyset query per batch"""
+    while True:
+        batch = get_reembedding_batch(source, after, batch_size, since)
+        if not batch:
+            return
+        yield batch
+        after = batch[-1][0]
+
+
+def exclude_reembedded(job: ReembeddingJob, source: str,
+                       items: List[Tuple[str, str, Optional[list]]]) -> List[Tuple[str, str, Optional[list]]]:
+    """Drop the faces a job already has a shadow embedding of"""
+    done = set(
+        job.shadow_embeddings.filter(source=source, object_id__in=[object_id for object_id, _, _ in items])
+        .values_list('object_id', flat=True)
+    )
+    return [item for item in items if item[0] not in done]
+
+
+_embedder = None
+
+
+def init_reembedding_worker(model_name: str, torch_threads: Optional[int] = None):
+    """Load the new model once per worker process"""
+    global _embedder
+    apply_runtime_profile(force=True, torch_threads=torch_threads)
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    # No fallback model here: a job must never mix models
+    _embedder = freeze_module(SentenceTransformer(model_name, device=device))
+
+
+def read_face_crop(image_path: str, bounding_box: Optional[list]) -> Optional[Image.Image]:
+    """Read a face crop, cutting it out of the full image when a bounding box is given"""
+    image = cv2.imread(image_path) if image_path else None
+    if image is None:
+        return None
+    
+    if bounding_box:
+        h, w = image.shape[:2]
+        x1, y1, x2, y2 = (int(coord) for coord in bounding_box)
+        image = image[max(0, y1):min(h, y2), max(0, x1):min(w, x2)]
+        if not image.size:
+            return None
+    
+    return Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+
+
+def embed_batch(items: List[Tuple[str, str, Optional[list]]]) -> List[Optional[np.ndarray]]:
+    """
+    Embed one batch of faces with the worker's model in one forward pass
+    
+    Returns:
+        One float32 embedding per item, None for faces that cannot be read
+    """
+    crops = [read_face_crop(image_path, bounding_box) for _, image_path, bounding_box in items]
+    images = [crop for crop in crops if crop is not None]
+    
+    embeddings = []
+    if images:
+        with inference_mode():
+            embeddings = _embedder.encode(images, batch_size=len(images), convert_to_tensor=False)
+    
+    embeddings = iter(embeddings)
+    return [np.asarray(next(embeddings), dtype=np.float32) if crop is not None else None for crop in crops]
+
+
+def store_batch(job: ReembeddingJob, source: str, items: List[Tuple[str, str, Optional[list]]],
+                embeddings: List[Optional[np.ndarray]], checkpoint: bool = True):
+    """
+    Write one batch of shadow embeddings and move the job's checkpoint past it
+    
+    With checkpoint=False (faces caught up after the pk-ordered pass) the
+    batch is added to the job's total instead.
+    """
+    shadows = []
+    for (object_id, image_path, _), embedding in zip(items, embeddings):
+        if embedding is None:
+            logger.warning(f"Could not re-embed {source} {object_id}: cannot read {image_path}")
+            continue
+        shadow = ShadowEmbedding(job=job, source=source, object_id=object_id)
+        shadow.set_vector(embedding)
+        shadows.append(shadow)
+    
+    with transaction.atomic():
+        ShadowEmbedding.objects.bulk_create(shadows, ignore_conflicts=True)
+        if checkpoint:
+            job.checkpoint[source] = items[-1][0]
+        else:
+            job.total_faces += len(items)
+        job.processed_faces += len(items)
+        job.failed_faces += len(items) - len(shadows)
+        job.save(update_fields=['checkpoint', 'total_faces', 'processed_faces', 'failed_faces'])
+
+
+def iter_chunks(queryset, size: int = 1000) -> Iterator[list]:
+    """Yield the objects of a queryset in pk order, one keyset query per chunk"""
+    after = None
+    while True:
+        chunk = list((queryset.filter(pk__gt=after) if after is not None else queryset).order_by('pk')[:size])
+        if not chunk:
+            return
+        yield chunk
+        after = chunk[-1].pk
+
+
+def get_shadow_vectors(job: ReembeddingJob, source: str, object_ids: List[str]) -> Dict[str, Tuple[np.ndarray, float]]:
+    """Get the (unit vector, norm) of some objects' shadow embeddings"""
+    return {
+        object_id: (np.frombuffer(bytes(vector), dtype=np.float32), norm)
+        for object_id, vector, norm in job.shadow_embeddings.filter(source=source, object_id__in=object_ids)
+        .values_list('object_id', 'vector', 'vector_norm')
+    }
+
+
+def count_unembedded(job: ReembeddingJob) -> int:
+    """Count the faces stored since a job started that it has no shadow embedding of"""
+    FaceVector = apps.get_model('simple_face_id', 'FaceVector')
+    missing = 0
+    for source, model in (('face_exemplar', FaceExemplar), ('face_vector', FaceVector)):
+        for chunk in iter_chunks(model.objects.filter(created_at__gte=job.created_at).only('pk')):
+            object_ids = {str(row.pk) for row in chunk}
+            done = set(
+                job.shadow_embeddings.filter(source=source, object_id__in=object_ids)
+                .values_list('object_id', flat=True)
+            )
+            missing += len(object_ids - done)
+    return missing
+
+
+def activate_pet_embeddings(job: ReembeddingJob, embeddings: list, force: bool, before=None):
+    """
+    Copy the shadow vectors of some pet embeddings' exemplars and recompute their means
+    
+    Args:
+        job: Completed job
+        embeddings: FaceEmbedding objects
+        force: Delete exemplars without a shadow embedding instead of raising
+        before: Only use exemplars stored before this time (later ones are left to the final flip)
+    """
+    exemplars = FaceExemplar.objects.filter(face_embedding__in=embeddings)
+    if before is not None:
+        exemplars = exemplars.filter(created_at__lt=before)
+    exemplars = list(exemplars)
+    shadows = get_shadow_vectors(job, 'face_exemplar', [str(exemplar.pk) for exemplar in exemplars])
+    
+    kept, dropped, new_vectors = [], [], {}
+    for exemplar in exemplars:
+        shadow = shadows.get(str(exemplar.pk))
+        if shadow is None:
+            if not force:
+                raise ValueError(f"Exemplar {exemplar.pk} was not re-embedded, resume job {job.id} to catch up")
+            dropped.append(exemplar.pk)
+            continue
+        vector, norm = shadow
+        exemplar.set_vector(vector * norm)
+        kept.append(exemplar)
+        new_vectors.setdefault(exemplar.face_embedding_id, []).append(vector * norm)
+    
+    for face_embedding in embeddings:
+        vectors = new_vectors.get(face_embedding.pk)
+        if vectors:
+            face_embedding.source_images_count = 0
+            face_embedding.embedding_sum = None
+            face_embedding.add_image_embeddings(vectors)
+            face_embedding.embedding_model = job.model_name
+            face_embedding.version += 1
+        elif face_embedding.status == 'completed':
+            face_embedding.status = 'failed'
+            face_embedding.notes = f"Not re-embedded with {job.model_name}, regenerate it"
+    
+    FaceExemplar.objects.filter(pk__in=dropped).delete()
+    FaceExemplar.objects.bulk_update(kept, ['vector', 'vector_dimension', 'vector_norm'])
+    FaceEmbedding.objects.bulk_update(embeddings, [
+        'embedding_vector', 'embedding_norm', 'vector_dimension', 'embedding_sum',
+        'source_images_count', 'embedding_model', 'version', 'status', 'notes'
+    ])
+
+
+def activate_face_vectors(job: ReembeddingJob, face_vectors: list, force: bool):
+    """Copy the shadow vectors of some face vectors, deleting those without one when forced"""
+    FaceVector = apps.get_model('simple_face_id', 'FaceVector')
+    shadows = get_shadow_vectors(job, 'face_vector', [str(face_vector.pk) for face_vector in face_vectors])
+    kept, dropped = [], []
+    for face_vector in face_vectors:
+        shadow = shadows.get(str(face_vector.pk))
+        if shadow is None:
+            if not force:
+                raise ValueError(f"Face vector {face_vector.pk} was not re-embedded, resume job {job.id} to catch up")
+            dropped.append(face_vector.pk)
+            continue
+        face_vector.set_embedding_vector(shadow[0] * shadow[1])
+        kept.append(face_vector)
+    FaceVector.objects.filter(pk__in=dropped).delete()
+    FaceVector.objects.bulk_update(kept, ['embedding_vector', 'embedding_norm', 'vector_dimension'])
+
+
+def activate_centroids(projects: list, before=None):
+    """Recompute some project centroids from their face vectors, optionally only those stored before a time"""
+    FaceVector = apps.get_model('simple_face_id', 'FaceVector')
+    FaceProject = apps.get_model('simple_face_id', 'FaceProject')
+    face_vectors = FaceVector.objects.filter(project__in=projects)
+    if before is not None:
+        face_vectors = face_vectors.filter(created_at__lt=before)
+    vectors: Dict[str, list] = {}
+    for project_id, vector in face_vectors.values_list('project_id', 'embedding_vector'):
+        vectors.setdefault(project_id, []).append(vector)
+    for project in projects:
+        project.set_centroid_vector(vectors.get(project.pk, []))
+    FaceProject.objects.bulk_update(projects, ['centroid_vector'])
+
+
+def activate_job(job: ReembeddingJob, force: bool = False) -> ReembeddingJob:
+    """
+    Swap every stored vector and the active model to a completed job's
+    
+    The vectors are copied in chunks of their own short transactions,
+    checkpointed under job.checkpoint['activation'] so an interrupted
+    activation resumes where it stopped. Pet embeddings become the mean of
+    their re-embedded exemplars and project centroids are recomputed. The
+    copy records no change log entries, so workers' indexes keep serving
+    the vectors they loaded; only rows read straight from the tables may
+    already be new. A final short transaction redoes the rows written while
+    the copy ran, flips the active model and records a 'reset' change log
+    entry per source, which makes every worker's index reload.
+    
+    Faces the job could not re-embed, or that were stored after it caught
+    up, would be incomparable with the rest, so the activation is refused
+    before anything is copied unless forced. Forced, their exemplars and
+    face vectors are deleted, and pet embeddings left without any exemplar
+    are marked failed (out of the index until regenerated).
+    
+    Raises:
+        ValueError: The job is not completed, or misses faces and force is not set
+    """
+    FaceVector = apps.get_model('simple_face_id', 'FaceVector')
+    FaceProject = apps.get_model('simple_face_id', 'FaceProject')
+    
+    job.refresh_from_db()
+    if job.status != 'completed':
+        raise ValueError(f"Re-embedding job {job.id} is {job.status}, only a completed job can be activated")
+    # Embeddings from before exemplars were kept have nothing to re-embed
+    orphans = FaceEmbedding.objects.filter(status='completed', exemplars__isnull=True).count()
+    unembedded = count_unembedded(job)
+    if (job.failed_faces or unembedded or orphans) and not force:
+        raise ValueError(
+            f"Re-embedding job {job.id} could not re-embed {job.failed_faces} faces, misses {unembedded} "
+            f"faces stored since it started (resume it to catch up) and {orphans} pet embeddings without exemplars"
+        )
+    
+    progress = job.checkpoint.setdefault('activation', {})
+    if 'started_at' not in progress:
+        progress['started_at'] = timezone.now().isoformat()
+        job.save(update_fields=['checkpoint'])
+    started_at = parse_datetime(progress['started_at'])
+    
+    # Rows stored from here on are left to the final flip
+    steps = (
+        ('face_embedding', FaceEmbedding.objects.filter(created_at__lt=started_at),
+         lambda chunk: activate_pet_embeddings(job, chunk, force, before=started_at)),
+        ('face_vector', FaceVector.objects.filter(created_at__lt=started_at),
+         lambda chunk: activate_face_vectors(job, chunk, force)),
+        ('face_project', FaceProject.objects.filter(created_at__lt=started_at),
+         lambda chunk: activate_centroids(chunk, before=started_at)),
+    )
+    for source, queryset, activate in steps:
+        after = progress.get(source)
+        for chunk in iter_chunks(queryset.filter(pk__gt=after) if after is not None else queryset):
+            with transaction.atomic():
+                activate(chunk)
+                progress[source] = str(chunk[-1].pk)
+                job.save(update_fields=['checkpoint'])
+        logger.info(f"Copied {source} vectors of re-embedding job {job.id}")
+    
+    with transaction.atomic():
+        job = ReembeddingJob.objects.select_for_update().get(pk=job.pk)
+        if job.status != 'completed':
+            raise ValueError(f"Re-embedding job {job.id} is {job.status}, only a completed job can be activated")
+        
+        # Rows written while the copy ran
+        embeddings = FaceEmbedding.objects.filter(
+            Q(created_at__gte=started_at) | Q(updated_at__gte=started_at) | Q(exemplars__created_at__gte=started_at)
+        ).distinct()
+        for chunk in iter_chunks(embeddings):
+            activate_pet_embeddings(job, chunk, force)
+        for chunk in iter_chunks(FaceVector.objects.filter(created_at__gte=started_at)):
+            activate_face_vectors(job, chunk, force)
+        projects = FaceProject.objects.filter(
+            Q(created_at__gte=started_at) | Q(updated_at__gte=started_at) | Q(face_vectors__created_at__gte=started_at)
+        ).distinct()
+        for chunk in iter_chunks(projects):
+            activate_centroids(chunk)
+        
+        for source in ('face_embedding', 'face_vector', 'face_project'):
+            EmbeddingChangeLog.record(source, ['*'], 'reset')
+        
+        ReembeddingJob.objects.filter(status='active').update(status='retired')
+        job.status = 'active'
+        job.activated_at = timezone.now()
+        job.save(update_fields=['status', 'activated_at'])
+        
+        # Receivers drop state derived from the old model in the same transaction
+        embedding_model_activated.send(sender=ReembeddingJob, job=job)
+    
+    global _active_model_checked
+    _active_model_checked = 0.0
+    
+    logger.info(f"Activated embedding model {job.model_name} (re-embedding job {job.id})")
+    return job
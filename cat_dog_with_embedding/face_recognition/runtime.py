@@ -0,0 +1,115 @@
+import os
+import logging
+import threading
+from typing import Optional
+
+import cv2
+import torch
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_profile_lock = threading.Lock()
+_profile_applied = False
+_profile_deferred = False
+
+
+def get_torch_thread_count() -> int:
+    """
+    Get the torch intra-op thread count for this process
+    
+    Uses INFERENCE_RUNTIME['TORCH_THREADS'] when set, otherwise splits the
+    CPU cores evenly across the WEB_CONCURRENCY web workers.
+    """
+    configured = settings.INFERENCE_RUNTIME['TORCH_THREADS']
+    if configured:
+        return configured
+    
+    workers = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def apply_runtime_profile(force: bool = False, torch_threads: Optional[int] = None):
+    """
+    Apply the CPU inference runtime profile once per process
+    
+    Args:
+        force: Re-apply even if the profile was already applied (e.g. after fork)
+        torch_threads: Override the configured torch thread count
+    """
+    global _profile_applied
+    
+    with _profile_lock:
+        if (_profile_applied or _profile_deferred) and not force:
+            return
+        
+        runtime = settings.INFERENCE_RUNTIME
+        threads = torch_threads or get_torch_thread_count()
+        
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(runtime['TORCH_INTEROP_THREADS'])
+        except RuntimeError:
+            # Only allowed before the inter-op pool has started
+            pass
+        
+        cv2.setNumThreads(runtime['CV2_THREADS'])
+        
+        _profile_applied = True
+        logger.info(
+            f"Inference runtime: torch threads={threads}, interop threads={torch.get_num_interop_threads()}, "
+            f"cv2 threads={runtime['CV2_THREADS']}"
+        )
+
+
+def defer_runtime_profile():
+    """
+    Keep torch single-threaded until resume_runtime_profile() is called
+    
+    Used when the gunicorn master preloads models: an OpenMP/inter-op thread
+    pool started before fork is not usable in the forked workers.
+    """
+    global _profile_deferred
+    
+    with _profile_lock:
+        _profile_deferred = True
+        torch.set_num_threads(1)
+
+
+def resume_runtime_profile():
+    """Apply the deferred runtime profile, called in each worker after fork"""
+    global _profile_deferred
+    
+    with _profile_lock:
+        _profile_deferred = False
+    apply_runtime_profile(force=True)
+
+
+def freeze_module(module: torch.nn.Module) -> torch.nn.Module:
+    """Put a model in eval mode and drop gradient tracking from its weights"""
+    module.eval()
+    for parameter in module.parameters():
+        parameter.requires_grad_(False)
+    return module
+
+
+def optimize_module(module: torch.nn.Module) -> torch.nn.Module:
+    """
+    Convert a convolutional torch module to channels-last memory format
+    
+    Only worth it for conv-heavy models such as the YOLO detector; the
+    transformer-based embedding model is left untouched.
+    """
+    if not settings.INFERENCE_RUNTIME['CHANNELS_LAST']:
+        return module
+    
+    try:
+        return module.to(memory_format=torch.channels_last)
+    except Exception as e:
+        logger.warning(f"Could not convert model to channels-last: {e}")
+        return module
+
+
+def inference_mode():
+    """Context manager disabling autograd tracking for inference"""
+    return torch.inference_mode()
@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import FaceEmbedding, FaceRecognitionResult, FaceDetection, EmbeddingProcessingJob
 from pets.serializers import PetSerializer
@@ -12,10 +13,10 @@ class FaceEmbeddingSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'pet', 'embedding_model', 'vector_dimension', 'status',
             'quality_score', 'created_at', 'updated_at', 'source_images_count',
-            'processing_time', 'confidence_score', 'notes'
+            'version', 'processing_time', 'confidence_score', 'notes'
         ]
         read_only_fields = [
-            'id', 'vector_dimension', 'created_at', 'updated_at',
+            'id', 'vector_dimension', 'created_at', 'updated_at', 'version',
             'processing_time', 'confidence_score'
         ]
 
@@ -69,29 +70,90 @@ class EmbeddingProcessingJobSerializer(serializers.ModelSerializer):
         ]
 
 
-class FaceSearchSerializer(serializers.Serializer):
-    """Serializer for face search requests"""
-    image = serializers.ImageField()
-    top_k = serializers.IntegerField(default=10, min_value=1, max_value=50)
+def validate_search_image(value):
+    """Validate an uploaded search image"""
+    # Check file size (max 10MB)
+    if value.size > 10 * 1024 * 1024:
+        raise serializers.ValidationError("Image file too large. Maximum size is 10MB.")
+    
+    # Check file format
+    allowed_formats = ['jpeg', 'jpg', 'png']
+    if not any(value.name.lower().endswith(f'.{fmt}') for fmt in allowed_formats):
+        raise serializers.ValidationError("Invalid image format. Use JPEG or PNG.")
+    
+    return value
+
+
+class MultiImageSearchSerializer(serializers.Serializer):
+    """
+    Base serializer for searches by one or several photos of the same animal
+    
+    Accepts `image`, `images` or both; validated_data['images'] holds all of them.
+    """
+    image = serializers.ImageField(required=False)
+    images = serializers.ListField(child=serializers.ImageField(), required=False)
+    fusion = serializers.ChoiceField(choices=['mean', 'max'], required=False)
     
     def validate_image(self, value):
         """Validate uploaded image"""
-        # Check file size (max 10MB)
-        if value.size > 10 * 1024 * 1024:
-            raise serializers.ValidationError("Image file too large. Maximum size is 10MB.")
+        return validate_search_image(value)
+    
+    def validate_images(self, value):
+        """Validate uploaded images"""
+        for image in value:
+            validate_search_image(image)
+        return value
+    
+    def validate(self, attrs):
+        """Collect every uploaded photo into `images`"""
+        images = ([attrs['image']] if attrs.get('image') else []) + list(attrs.get('images') or [])
+        if not images:
+            raise serializers.ValidationError({'image': "Upload at least one image."})
         
-        # Check file format
-        allowed_formats = ['jpeg', 'jpg', 'png']
-        if not any(value.name.lower().endswith(f'.{fmt}') for fmt in allowed_formats):
-            raise serializers.ValidationError("Invalid image format. Use JPEG or PNG.")
+        max_images = settings.QUERY_FUSION['MAX_IMAGES']
+        if len(images) > max_images:
+            raise serializers.ValidationError({'images': f"Too many images. Maximum is {max_images} photos of one animal."})
         
+        attrs['images'] = images
+        return attrs
+
+
+class FaceSearchSerializer(MultiImageSearchSerializer):
+    """Serializer for face search requests"""
+    top_k = serializers.IntegerField(default=10, min_value=1, max_value=50)
+
+
+class FaceBatchSearchSerializer(serializers.Serializer):
+    """Serializer for batch face search requests"""
+    images = serializers.ListField(child=serializers.ImageField(), allow_empty=False)
+    # Optional animal label per image; images sharing a label are searched as one animal
+    groups = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+    top_k = serializers.IntegerField(default=5, min_value=1, max_value=50)
+    output_format = serializers.ChoiceField(choices=['jsonl', 'csv'], default='jsonl')
+    
+    def validate_images(self, value):
+        """Validate uploaded images"""
+        max_images = settings.BATCH_SEARCH['MAX_IMAGES']
+        if len(value) > max_images:
+            raise serializers.ValidationError(f"Too many images. Maximum is {max_images} per request.")
+        
+        for image in value:
+            validate_search_image(image)
         return value
+    
+    def validate(self, attrs):
+        """Validate that groups label every image"""
+        groups = attrs.get('groups')
+        if groups and len(groups) != len(attrs['images']):
+            raise serializers.ValidationError({'groups': "Provide one group label per image."})
+        return attrs
 
 
 class FaceSearchResultSerializer(serializers.Serializer):
     """Serializer for face search results"""
     results = FaceRecognitionResultSerializer(many=True, read_only=True)
     total_matches = serializers.IntegerField(read_only=True)
+    faces_detected = serializers.IntegerField(read_only=True)
     processing_time = serializers.FloatField(read_only=True)
     search_quality = serializers.CharField(read_only=True)
     best_match = FaceRecognitionResultSerializer(read_only=True)
@@ -4,119 +4,398 @@ import torch
 from PIL import Image
 import time
 import logging
+import threading
 from pathlib import Path
 from typing import List, Tuple, Optional, Dict, Any
 import json
 
 from django.conf import settings
+from django.db import transaction
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from ultralytics import YOLO
 from sentence_transformers import SentenceTransformer
 import torchvision.transforms as transforms
 
-from .models import FaceEmbedding, FaceDetection, FaceRecognitionResult
+from .models import FaceEmbedding, FaceExemplar, FaceDetection, FaceRecognitionResult
+from .runtime import apply_runtime_profile, optimize_module, freeze_module, inference_mode
+from .model_pool import get_model_pool, PoolTimeout
+from .index import get_index, search_embeddings, search_embeddings_batch
+from .reembedding import get_active_embedding_model
+from .similarity import normalize, normalize_rows, similarities
 from pets.models import Pet, PetImage
 
 logger = logging.getLogger(__name__)
 
 
+# OpenCV flags that let libjpeg decode directly at 1/8, 1/4 and 1/2 scale
+REDUCED_DECODE_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+
 class YOLODetectionService:
     """Service for YOLO-based pet face detection"""
     
-    def __init__(self):
-        self.model = None
+    # Map class names (adjust based on your trained model)
+    CLASS_NAMES = {
+        0: 'cat',
+        1: 'cat_face',
+        2: 'dog',
+        3: 'dog_face'
+    }
+    
+    # Per-endpoint cascade counters shared by all service instances
+    _cascade_stats = {}
+    _cascade_lock = threading.Lock()
+    
+    def __init__(self, endpoint: str = 'default'):
+        self.model_pool = None
+        self.small_model_pool = None
         self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
         self.confidence_threshold = 0.5
+        self.endpoint = endpoint
+        self.imgsz = self.get_imgsz(endpoint)
+        self.embedder_input_size = settings.FACE_EMBEDDING_INPUT_SIZE
+        self._decoded = None  # (cache key, reduced image, scale factor)
         self.load_model()
     
-    def load_model(self):
-        """Load the YOLO model"""
+    @staticmethod
+    def get_imgsz(endpoint: str) -> int:
+        """Get the detector input size configured for an endpoint"""
+        sizes = settings.YOLO_DETECTION_IMGSZ
+        return sizes.get(endpoint, sizes['default'])
+    
+    @staticmethod
+    def build_detector(model_path: str):
+        """Build one YOLO replica for the model pool"""
         try:
-            model_path = settings.YOLO_MODEL_PATH
             if not Path(model_path).exists():
                 logger.warning(f"YOLO model not found at {model_path}. Using default YOLOv8l.")
                 # Use the pre-trained YOLOv8l model if custom model is not available
-                self.model = YOLO('yolov8l.pt')
+                model = YOLO('yolov8l.pt')
             else:
-                self.model = YOLO(model_path)
-            
-            logger.info(f"YOLO model loaded successfully on {self.device}")
+                model = YOLO(model_path)
         except Exception as e:
             logger.error(f"Failed to load YOLO model: {e}")
             # Fallback to base model
-            self.model = YOLO('yolov8l.pt')
+            model = YOLO('yolov8l.pt')
+        
+        freeze_module(model.model)
+        optimize_module(model.model)
+        return model
     
-    def detect_pet_faces(self, image_path: str) -> List[Dict[str, Any]]:
+    def load_model(self):
+        """Attach to the shared YOLO replica pool, loading the first replica if needed"""
+        apply_runtime_profile()
+        model_path = settings.YOLO_MODEL_PATH
+        self.model_pool = get_model_pool(
+            f'yolo:{model_path}',
+            lambda: self.build_detector(model_path),
+            settings.MODEL_POOL['DETECTOR_REPLICAS']
+        )
+        self.model_pool.preload()
+        logger.info(f"YOLO model loaded successfully on {self.device}")
+    
+    def load_detection_image(self, image_path: str, imgsz: Optional[int] = None) -> Tuple[Optional[np.ndarray], int]:
         """
-        Detect pet faces in an image
+        Decode an image at the smallest JPEG scale that still covers the detector input
         
         Args:
             image_path: Path to the image file
+            imgsz: Detector input size, defaults to the endpoint setting
             
         Returns:
-            List of detection results with bounding boxes and confidence scores
+            Tuple of (reduced BGR image, scale factor back to full resolution)
         """
+        imgsz = imgsz or self.imgsz
         try:
-            if not self.model:
-                logger.error("YOLO model not loaded")
-                return []
+            stat = Path(image_path).stat()
+            cache_key = (image_path, stat.st_mtime_ns, stat.st_size, imgsz)
+        except OSError:
+            return None, 1
+        
+        if self._decoded and self._decoded[0] == cache_key:
+            return self._decoded[1], self._decoded[2]
+        
+        # Read the dimensions from the header only, without decoding pixels
+        flag, factor = cv2.IMREAD_COLOR, 1
+        try:
+            with Image.open(image_path) as img:
+                long_side = max(img.size)
+            for reduce_factor, reduce_flag in REDUCED_DECODE_FLAGS:
+                if long_side // reduce_factor >= imgsz:
+                    flag, factor = reduce_flag, reduce_factor
+                    break
+        except Exception as e:
+            logger.warning(f"Could not read image header for {image_path}: {e}")
+        
+        image = cv2.imread(image_path, flag)
+        if image is None:
+            return None, 1
+        
+        self._decoded = (cache_key, image, factor)
+        return image, factor
+    
+    def get_small_model_pool(self):
+        """Get the replica pool of the small first-tier detector used by the cascade"""
+        if self.small_model_pool is None:
+            model_path = settings.YOLO_CASCADE['SMALL_MODEL_PATH']
+            if not model_path or not Path(model_path).exists():
+                logger.warning(f"Small YOLO model not found at {model_path!r}. Cascade disabled.")
+                self.small_model_pool = False
+            else:
+                self.small_model_pool = get_model_pool(
+                    f'yolo:{model_path}',
+                    lambda: self.build_detector(model_path),
+                    settings.MODEL_POOL['DETECTOR_REPLICAS']
+                )
+        return self.small_model_pool or None
+    
+    def run_detector(self, model_pool, image: np.ndarray, imgsz: int, scale: int) -> List[Dict[str, Any]]:
+        """
+        Run a YOLO model on a decoded image
+        
+        Args:
+            model_pool: Replica pool of the YOLO model to run
+            image: Decoded BGR image
+            imgsz: Detector input size
+            scale: Factor mapping image pixels back to full resolution
             
-            # Run inference
-            results = self.model(image_path, device=self.device, conf=self.confidence_threshold)
+        Returns:
+            List of detections sorted by confidence
+        """
+        return self.run_detector_batch(model_pool, [image], imgsz, [scale])[0]
+    
+    def run_detector_batch(self, model_pool, images: List[np.ndarray], imgsz: int,
+                           scales: List[int]) -> List[List[Dict[str, Any]]]:
+        """
+        Run a YOLO model on several decoded images in one forward pass
+        
+        Args:
+            model_pool: Replica pool of the YOLO model to run
+            images: Decoded BGR images
+            imgsz: Detector input size
+            scales: Factor mapping each image's pixels back to full resolution
             
+        Returns:
+            One list of detections per image, each sorted by confidence
+        """
+        with model_pool.borrow() as model, inference_mode():
+            results = model(images, device=self.device, conf=self.confidence_threshold, imgsz=imgsz)
+        
+        all_detections = []
+        for r, scale in zip(results, scales):
             detections = []
-            for r in results:
-                boxes = r.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        # Extract box coordinates
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        confidence = box.conf[0].cpu().numpy()
-                        class_id = int(box.cls[0].cpu().numpy())
-                        
-                        # Map class names (adjust based on your trained model)
-                        class_names = {
-                            0: 'cat',
-                            1: 'cat_face', 
-                            2: 'dog',
-                            3: 'dog_face'
-                        }
-                        
-                        class_name = class_names.get(class_id, 'unknown')
-                        
-                        detection = {
-                            'class': class_name,
-                            'confidence': float(confidence),
-                            'bounding_box': [float(x1), float(y1), float(x2), float(y2)],
-                            'area': (x2 - x1) * (y2 - y1)
-                        }
-                        detections.append(detection)
+            boxes = r.boxes
+            if boxes is not None:
+                for box in boxes:
+                    # Extract box coordinates and map them back to full resolution
+                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy() * scale
+                    confidence = box.conf[0].cpu().numpy()
+                    class_id = int(box.cls[0].cpu().numpy())
+                    
+                    class_name = self.CLASS_NAMES.get(class_id, 'unknown')
+                    
+                    detection = {
+                        'class': class_name,
+                        'confidence': float(confidence),
+                        'bounding_box': [float(x1), float(y1), float(x2), float(y2)],
+                        'area': (x2 - x1) * (y2 - y1)
+                    }
+                    detections.append(detection)
             
             # Sort by confidence score
             detections.sort(key=lambda x: x['confidence'], reverse=True)
-            return detections
+            all_detections.append(detections)
+        
+        return all_detections
+    
+    def detect_pet_faces(self, image_path: str, endpoint: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Detect pet faces in an image
+        
+        When the cascade is enabled for the endpoint, the small detector runs first
+        and the large model is only used if no face clears the accept confidence.
+        
+        Args:
+            image_path: Path to the image file
+            endpoint: Endpoint profile for the detector input size, defaults to the service endpoint
+            
+        Returns:
+            List of detection results with bounding boxes (in full-resolution pixels) and confidence scores
+        """
+        try:
+            if not self.model_pool:
+                logger.error("YOLO model not loaded")
+                return []
+            
+            endpoint = endpoint or self.endpoint
+            imgsz = self.get_imgsz(endpoint)
+            image, scale = self.load_detection_image(image_path, imgsz)
+            if image is None:
+                logger.error(f"Could not decode image {image_path}")
+                return []
+            
+            cascade = settings.YOLO_CASCADE
+            small_model_pool = self.get_small_model_pool() if endpoint in cascade['ENDPOINTS'] else None
+            
+            if small_model_pool is not None:
+                tier_start = time.time()
+                detections = self.run_detector(small_model_pool, image, imgsz, scale)
+                small_time = time.time() - tier_start
+                
+                face_confidences = [d['confidence'] for d in detections if d['class'].endswith('_face')]
+                if face_confidences and max(face_confidences) >= cascade['ACCEPT_CONFIDENCE']:
+                    self.record_cascade(endpoint, small_time)
+                    return detections
+                
+                # Not confident enough: escalate to the large model
+                tier_start = time.time()
+                detections = self.run_detector(self.model_pool, image, imgsz, scale)
+                self.record_cascade(endpoint, small_time, time.time() - tier_start)
+                return detections
+            
+            return self.run_detector(self.model_pool, image, imgsz, scale)
             
+        except PoolTimeout:
+            raise
         except Exception as e:
             logger.error(f"Error in pet face detection: {e}")
             return []
     
+    def detect_pet_faces_batch(self, images: List[Tuple[np.ndarray, int]],
+                               endpoint: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Detect pet faces in several decoded images with batched forward passes
+        
+        With the cascade enabled for the endpoint, the small detector runs on
+        the whole batch and only the images it is not confident about are
+        re-run, again as one batch, through the large model.
+        
+        Args:
+            images: (reduced BGR image, scale factor) pairs from load_detection_image
+            endpoint: Endpoint profile for the detector input size, defaults to the service endpoint
+            
+        Returns:
+            One list of detections per image
+        """
+        if not self.model_pool:
+            logger.error("YOLO model not loaded")
+            return [[] for _ in images]
+        if not images:
+            return []
+        
+        endpoint = endpoint or self.endpoint
+        imgsz = self.get_imgsz(endpoint)
+        decoded = [image for image, _ in images]
+        scales = [scale for _, scale in images]
+        
+        cascade = settings.YOLO_CASCADE
+        small_model_pool = self.get_small_model_pool() if endpoint in cascade['ENDPOINTS'] else None
+        if small_model_pool is None:
+            return self.run_detector_batch(self.model_pool, decoded, imgsz, scales)
+        
+        tier_start = time.time()
+        results = self.run_detector_batch(small_model_pool, decoded, imgsz, scales)
+        small_time = (time.time() - tier_start) / len(images)
+        
+        escalate = [
+            i for i, detections in enumerate(results)
+            if max((d['confidence'] for d in detections if d['class'].endswith('_face')), default=0.0)
+            < cascade['ACCEPT_CONFIDENCE']
+        ]
+        for _ in range(len(images) - len(escalate)):
+            self.record_cascade(endpoint, small_time)
+        
+        if escalate:
+            # Not confident enough: re-run those images through the large model
+            tier_start = time.time()
+            large_results = self.run_detector_batch(
+                self.model_pool, [decoded[i] for i in escalate], imgsz, [scales[i] for i in escalate]
+            )
+            large_time = (time.time() - tier_start) / len(escalate)
+            for i, detections in zip(escalate, large_results):
+                results[i] = detections
+                self.record_cascade(endpoint, small_time, large_time)
+        
+        return results
+    
+    @classmethod
+    def record_cascade(cls, endpoint: str, small_time: float, large_time: Optional[float] = None):
+        """Record per-tier hit rate and latency for the detector cascade"""
+        with cls._cascade_lock:
+            stats = cls._cascade_stats.setdefault(endpoint, {
+                'total': 0, 'small_accepted': 0, 'small_time': 0.0, 'large_time': 0.0
+            })
+            stats['total'] += 1
+            stats['small_time'] += small_time
+            if large_time is None:
+                stats['small_accepted'] += 1
+            else:
+                stats['large_time'] += large_time
+            
+            if stats['total'] % settings.YOLO_CASCADE['LOG_EVERY'] == 0:
+                escalated = stats['total'] - stats['small_accepted']
+                logger.info(
+                    f"YOLO cascade [{endpoint}]: {stats['small_accepted'] / stats['total']:.1%} accepted by small tier "
+                    f"over {stats['total']} detections, small avg {stats['small_time'] / stats['total'] * 1000:.1f}ms, "
+                    f"large avg {(stats['large_time'] / escalated * 1000) if escalated else 0.0:.1f}ms"
+                )
+        
+        tier = 'small' if large_time is None else 'large'
+        logger.debug(f"YOLO cascade [{endpoint}]: resolved by {tier} tier")
+    
     def extract_face_crop(self, image_path: str, bounding_box: List[float]) -> Optional[np.ndarray]:
         """
         Extract face crop from image using bounding box
         
+        The crop is cut from the reduced detection image when it still covers the
+        embedder input size, otherwise from a full-resolution decode.
+        
         Args:
             image_path: Path to the image
-            bounding_box: [x1, y1, x2, y2] coordinates
+            bounding_box: [x1, y1, x2, y2] coordinates in full-resolution pixels
             
         Returns:
             Cropped face image as numpy array
         """
         try:
-            image = cv2.imread(image_path)
+            image, scale = self.load_detection_image(image_path)
+            return self.crop_face(image_path, image, scale, bounding_box)
+            
+        except Exception as e:
+            logger.error(f"Error extracting face crop: {e}")
+            return None
+    
+    def crop_face(self, image_path: str, image: Optional[np.ndarray], scale: int,
+                  bounding_box: List[float]) -> Optional[np.ndarray]:
+        """
+        Cut a face crop from an already decoded detection image
+        
+        Falls back to a full-resolution decode of image_path when the reduced
+        image does not cover the embedder input size.
+        
+        Args:
+            image_path: Path to the image
+            image: Reduced image from load_detection_image
+            scale: Scale factor of the reduced image
+            bounding_box: [x1, y1, x2, y2] coordinates in full-resolution pixels
+            
+        Returns:
+            Cropped face image as numpy array
+        """
+        try:
+            box_width = (bounding_box[2] - bounding_box[0]) / scale
+            box_height = (bounding_box[3] - bounding_box[1]) / scale
+            if image is None or (scale > 1 and min(box_width, box_height) < self.embedder_input_size):
+                image, scale = cv2.imread(image_path), 1
+            
             if image is None:
                 return None
             
-            x1, y1, x2, y2 = map(int, bounding_box)
+            x1, y1, x2, y2 = (int(coord / scale) for coord in bounding_box)
             
             # Ensure coordinates are within image bounds
             h, w = image.shape[:2]
@@ -174,7 +453,8 @@ class FaceEmbeddingService:
     """Service for generating face embeddings using sentence transformers"""
     
     def __init__(self):
-        self.model = None
+        self.model_pool = None
+        self.model_name = None
         self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
         self.load_model()
         
@@ -185,16 +465,34 @@ class FaceEmbeddingService:
             transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
         ])
     
-    def load_model(self):
-        """Load the face embedding model"""
+    @staticmethod
+    def build_embedder(model_name: str, device: str):
+        """Build one SentenceTransformer replica for the model pool"""
         try:
-            model_name = settings.FACE_EMBEDDING_MODEL
-            self.model = SentenceTransformer(model_name, device=self.device)
+            model = SentenceTransformer(model_name, device=device)
             logger.info(f"Face embedding model loaded: {model_name}")
         except Exception as e:
             logger.error(f"Failed to load face embedding model: {e}")
             # Fallback to a basic model
-            self.model = SentenceTransformer('clip-ViT-B-32', device=self.device)
+            model = SentenceTransformer('clip-ViT-B-32', device=device)
+        return freeze_module(model)
+    
+    def load_model(self):
+        """Attach to the shared replica pool of the active embedding model, loading the first replica if needed"""
+        apply_runtime_profile()
+        model_name = self.model_name = get_active_embedding_model()
+        self.model_pool = get_model_pool(
+            f'embedder:{model_name}',
+            lambda: self.build_embedder(model_name, self.device),
+            settings.MODEL_POOL['EMBEDDER_REPLICAS']
+        )
+        self.model_pool.preload()
+    
+    def check_model(self):
+        """Switch to the active embedding model after a re-embedding job was activated"""
+        if self.model_name != get_active_embedding_model():
+            logger.info(f"Embedding model changed from {self.model_name}, reloading")
+            self.load_model()
     
     def generate_embedding(self, face_crop: np.ndarray) -> Optional[np.ndarray]:
         """
@@ -207,9 +505,10 @@ class FaceEmbeddingService:
             Face embedding vector
         """
         try:
-            if self.model is None:
+            if self.model_pool is None:
                 logger.error("Embedding model not loaded")
                 return None
+            self.check_model()
             
             # Convert to PIL Image
             if len(face_crop.shape) == 3:
@@ -218,20 +517,133 @@ class FaceEmbeddingService:
             pil_image = Image.fromarray(face_crop)
             
             # Generate embedding using the CLIP model
-            embedding = self.model.encode([pil_image], convert_to_tensor=False)[0]
+            with self.model_pool.borrow() as model, inference_mode():
+                embedding = model.encode([pil_image], convert_to_tensor=False)[0]
             
             return np.array(embedding)
             
+        except PoolTimeout:
+            raise
         except Exception as e:
             logger.error(f"Error generating face embedding: {e}")
             return None
     
-    def generate_pet_embeddings(self, pet_images: List[PetImage]) -> Optional[FaceEmbedding]:
+    def generate_embeddings(self, face_crops: List[np.ndarray]) -> List[Optional[np.ndarray]]:
+        """
+        Generate face embeddings for several face crops in one forward pass
+        
+        Args:
+            face_crops: Face images as numpy arrays
+            
+        Returns:
+            One embedding vector (or None) per face crop
+        """
+        try:
+            if self.model_pool is None:
+                logger.error("Embedding model not loaded")
+                return [None] * len(face_crops)
+            if not face_crops:
+                return []
+            self.check_model()
+            
+            pil_images = [
+                Image.fromarray(cv2.cvtColor(face_crop, cv2.COLOR_BGR2RGB) if len(face_crop.shape) == 3 else face_crop)
+                for face_crop in face_crops
+            ]
+            
+            with self.model_pool.borrow() as model, inference_mode():
+                embeddings = model.encode(pil_images, batch_size=len(pil_images), convert_to_tensor=False)
+            
+            return [np.array(embedding) for embedding in embeddings]
+        
+        except PoolTimeout:
+            raise
+        except Exception as e:
+            logger.error(f"Error generating face embeddings: {e}")
+            return [None] * len(face_crops)
+    
+    def embed_pet_images(self, pet_images: List[PetImage]) -> Tuple[List[PetImage], List[np.ndarray]]:
+        """
+        Detect, crop and embed the best face of each image
+        
+        Args:
+            pet_images: List of PetImage objects
+            
+        Returns:
+            The images a face was embedded from and their embeddings
+        """
+        embedded_images = []
+        all_embeddings = []
+        
+        yolo_service = YOLODetectionService(endpoint='registration')
+        
+        for pet_image in pet_images:
+            try:
+                image_path = pet_image.image.path
+                
+                # Detect faces in the image
+                detections = yolo_service.detect_pet_faces(image_path)
+                
+                # Filter for face detections
+                face_detections = [d for d in detections if d['class'].endswith('_face')]
+                
+                if not face_detections:
+                    continue
+                
+                # Use the highest confidence face detection
+                best_detection = face_detections[0]
+                
+                # Save detection to database, replacing that of an earlier attempt
+                FaceDetection.objects.filter(image=pet_image, model_version='yolov8l').delete()
+                face_detection = FaceDetection.objects.create(
+                    image=pet_image,
+                    detected_class=best_detection['class'],
+                    confidence=best_detection['confidence'],
+                    bounding_box=best_detection['bounding_box'],
+                    model_version='yolov8l',
+                    face_area=best_detection['area']
+                )
+                
+                # Extract face crop
+                face_crop = yolo_service.extract_face_crop(image_path, best_detection['bounding_box'])
+                
+                if face_crop is None:
+                    continue
+                
+                # Generate embedding
+                embedding = self.generate_embedding(face_crop)
+                
+                if embedding is not None:
+                    all_embeddings.append(embedding)
+                    embedded_images.append(pet_image)
+            
+            except PoolTimeout:
+                raise
+            except Exception as e:
+                logger.error(f"Error processing image {pet_image.id}: {e}")
+                continue
+        
+        return embedded_images, all_embeddings
+    
+    def generate_pet_embeddings(self, pet_images: List[PetImage],
+                                face_embedding: Optional[FaceEmbedding] = None,
+                                rebuild: bool = False) -> Optional[FaceEmbedding]:
         """
         Generate embeddings for a pet from multiple images
         
+        Given the pet's existing embedding, only the images it has no
+        exemplar of yet, and that did not fail before, are embedded: their
+        vectors are added to the stored running sum, the mean is re-derived
+        and the version bumped, so adding images costs O(new images). The
+        row is re-read under a lock before it is updated, so concurrent
+        updates of the same pet add up instead of overwriting each other.
+        The save reaches every worker's index through the change log,
+        replacing the row in place.
+        
         Args:
             pet_images: List of PetImage objects
+            face_embedding: Existing embedding of the pet to update
+            rebuild: Re-embed every image into face_embedding from scratch
             
         Returns:
             FaceEmbedding object or None
@@ -241,76 +653,102 @@ class FaceEmbeddingService:
                 return None
             
             pet = pet_images[0].pet
-            all_embeddings = []
-            successful_images = 0
             
-            yolo_service = YOLODetectionService()
+            if face_embedding is not None and not rebuild:
+                known_images = set(
+                    face_embedding.exemplars.exclude(pet_image=None).values_list('pet_image_id', flat=True)
+                )
+                self.check_model()
+                if face_embedding.embedding_model != self.model_name:
+                    logger.info(f"Rebuilding embedding {face_embedding.id}: made with {face_embedding.embedding_model}")
+                    rebuild = True
+                elif face_embedding.source_images_count and not known_images:
+                    # Made before exemplars recorded their image: the new images cannot be told apart
+                    logger.info(f"Rebuilding embedding {face_embedding.id}: its images are not recorded")
+                    rebuild = True
+                else:
+                    attempted = {str(image_id) for image_id in known_images} | set(face_embedding.failed_images)
+                    pet_images = [pet_image for pet_image in pet_images if str(pet_image.pk) not in attempted]
+                    if not pet_images:
+                        return face_embedding
             
-            for pet_image in pet_images:
-                try:
-                    image_path = pet_image.image.path
-                    
-                    # Detect faces in the image
-                    detections = yolo_service.detect_pet_faces(image_path)
-                    
-                    # Filter for face detections
-                    face_detections = [d for d in detections if d['class'].endswith('_face')]
-                    
-                    if not face_detections:
-                        continue
-                    
-                    # Use the highest confidence face detection
-                    best_detection = face_detections[0]
-                    
-                    # Save detection to database
-                    face_detection = FaceDetection.objects.create(
-                        image=pet_image,
-                        detected_class=best_detection['class'],
-                        confidence=best_detection['confidence'],
-                        bounding_box=best_detection['bounding_box'],
-                        model_version='yolov8l',
-                        face_area=best_detection['area']
-                    )
-                    
-                    # Extract face crop
-                    face_crop = yolo_service.extract_face_crop(image_path, best_detection['bounding_box'])
-                    
-                    if face_crop is None:
-                        continue
-                    
-                    # Generate embedding
-                    embedding = self.generate_embedding(face_crop)
-                    
-                    if embedding is not None:
-                        all_embeddings.append(embedding)
-                        successful_images += 1
-                    
-                except Exception as e:
-                    logger.error(f"Error processing image {pet_image.id}: {e}")
-                    continue
+            embedded_images, all_embeddings = self.embed_pet_images(pet_images)
+            embedded_ids = {pet_image.pk for pet_image in embedded_images}
+            failed_images = [str(pet_image.pk) for pet_image in pet_images if pet_image.pk not in embedded_ids]
             
             if not all_embeddings:
                 logger.warning(f"No valid embeddings generated for pet {pet.id}")
-                return None
-            
-            # Average all embeddings to create a representative embedding
-            final_embedding = np.mean(all_embeddings, axis=0)
+                if face_embedding is None or rebuild:
+                    return None
+                
+                # Remember the failed images without touching the vector (and the index)
+                with transaction.atomic():
+                    locked = FaceEmbedding.objects.select_for_update().get(pk=face_embedding.pk)
+                    FaceEmbedding.objects.filter(pk=locked.pk).update(
+                        failed_images=sorted(set(locked.failed_images) | set(failed_images))
+                    )
+                face_embedding.refresh_from_db()
+                return face_embedding
             
-            # Create FaceEmbedding object
-            face_embedding = FaceEmbedding.objects.create(
-                pet=pet,
-                embedding_model=settings.FACE_EMBEDDING_MODEL,
-                vector_dimension=len(final_embedding),
-                status='completed',
-                source_images_count=successful_images
-            )
+            with transaction.atomic():
+                if face_embedding is None:
+                    # Create FaceEmbedding object with its vector, so the change log
+                    # never announces a completed embedding without one
+                    locked = FaceEmbedding(
+                        pet=pet,
+                        embedding_model=self.model_name,
+                        status='completed',
+                        source_images_count=0,
+                        failed_images=failed_images
+                    )
+                else:
+                    locked = FaceEmbedding.objects.select_for_update().get(pk=face_embedding.pk)
+                    if rebuild:
+                        locked.exemplars.all().delete()
+                        locked.embedding_model = self.model_name
+                        locked.source_images_count = 0
+                        locked.embedding_sum = None
+                        locked.failed_images = failed_images
+                    else:
+                        # A concurrent update may have embedded some of these images meanwhile
+                        known_images = set(
+                            locked.exemplars.exclude(pet_image=None).values_list('pet_image_id', flat=True)
+                        )
+                        new = [i for i, pet_image in enumerate(embedded_images) if pet_image.pk not in known_images]
+                        embedded_images = [embedded_images[i] for i in new]
+                        all_embeddings = [all_embeddings[i] for i in new]
+                        locked.failed_images = sorted(set(locked.failed_images) | set(failed_images))
+                    if all_embeddings:
+                        locked.version += 1
+                
+                # Running mean over every image embedded so far; a row already
+                # copied by an activation in progress carries the new model, and
+                # its mean is recomputed from the exemplars when the model flips
+                if all_embeddings and locked.embedding_model == self.model_name:
+                    locked.add_image_embeddings(all_embeddings)
+                locked.save()
+                
+                # Keep the per-image vectors so searches can re-rank by exemplar without re-embedding
+                exemplars = []
+                for pet_image, embedding in zip(embedded_images, all_embeddings):
+                    exemplar = FaceExemplar(face_embedding=locked, pet_image=pet_image)
+                    exemplar.set_vector(embedding)
+                    exemplars.append(exemplar)
+                FaceExemplar.objects.bulk_create(exemplars)
             
-            face_embedding.set_embedding_vector(final_embedding)
-            face_embedding.save()
+            if face_embedding is None:
+                face_embedding = locked
+            else:
+                face_embedding.refresh_from_db()
             
-            logger.info(f"Successfully generated embedding for pet {pet.name} using {successful_images} images")
+            logger.info(
+                f"Successfully generated embedding for pet {pet.name} from {len(all_embeddings)} new images "
+                f"({face_embedding.source_images_count} in total, version {face_embedding.version})"
+            )
             return face_embedding
             
+        except PoolTimeout:
+            raise
         except Exception as e:
             logger.error(f"Error generating pet embeddings: {e}")
             return None
@@ -320,51 +758,347 @@ class FaceMatchingService:
     """Service for face matching and similarity comparison"""
     
     @staticmethod
-    def find_similar_pets(query_embedding: np.ndarray, top_k: int = 10) -> List[Dict[str, Any]]:
+    def route_pet_type(detection: Optional[Dict[str, Any]]) -> Optional[str]:
+        """
+        Get the pet type partition a detected face should be searched in
+        
+        Args:
+            detection: Detection dict from YOLODetectionService.detect_pet_faces
+            
+        Returns:
+            'cat' or 'dog', or None to search every pet type when the detector
+            is not confident about the class
+        """
+        if not detection or detection['confidence'] < settings.PET_TYPE_ROUTING['MIN_CONFIDENCE']:
+            return None
+        pet_type = detection['class'].replace('_face', '')
+        return pet_type if pet_type in ('cat', 'dog') else None
+    
+    @staticmethod
+    def find_similar_pets(query_embedding: np.ndarray, top_k: int = 10,
+                          pet_type: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Find similar pets based on face embedding
         
         Args:
             query_embedding: Query face embedding vector
             top_k: Number of top matches to return
+            pet_type: Only compare against pets of this type
             
         Returns:
             List of similar pets with similarity scores
         """
         try:
-            # Get all completed face embeddings
-            all_embeddings = FaceEmbedding.objects.filter(
-                status='completed'
-            ).select_related('pet')
+            # Shortlist by pet centroid, then re-rank by best exemplar
+            shortlist = max(top_k, settings.EXEMPLAR_SEARCH['SHORTLIST'])
+            matches = FaceMatchingService.search_index(query_embedding, shortlist, pet_type)
+            if matches is not None:
+                return FaceMatchingService.rerank_by_exemplars(query_embedding, matches)[:top_k]
             
-            similarities = []
+            # Index search failed: stream the table instead
+            hits = get_index('face_embedding').scan_database(query_embedding, shortlist, pet_type)
+            return FaceMatchingService.rerank_by_exemplars(
+                query_embedding, FaceMatchingService.build_matches(hits)
+            )[:top_k]
             
-            for face_embedding in all_embeddings:
-                try:
-                    stored_embedding = face_embedding.get_embedding_vector()
-                    
-                    # Calculate cosine similarity
-                    similarity = calculate_cosine_similarity(query_embedding, stored_embedding)
-                    
-                    similarities.append({
-                        'pet': face_embedding.pet,
-                        'embedding': face_embedding,
-                        'similarity': similarity,
-                        'confidence_level': FaceRecognitionResult.determine_confidence_level(similarity)
-                    })
-                    
-                except Exception as e:
-                    logger.error(f"Error calculating similarity for embedding {face_embedding.id}: {e}")
-                    continue
+        except Exception as e:
+            logger.error(f"Error finding similar pets: {e}")
+            return []
+    
+    @staticmethod
+    def find_matching_pets(query_embedding: np.ndarray, top_k: int = 10,
+                           threshold: Optional[float] = None,
+                           pet_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Find pets whose similarity reaches the match threshold
+        
+        Cheaper than find_similar_pets when only matches matter: candidates
+        are shortlisted by sign sketch, and a query no pet can match is
+        rejected without scoring any stored embedding.
+        
+        Args:
+            query_embedding: Query face embedding vector
+            top_k: Number of top matches to return
+            threshold: Minimum similarity, defaults to the lobo_trail threshold
+            pet_type: Only compare against pets of this type
             
-            # Sort by similarity score
-            similarities.sort(key=lambda x: x['similarity'], reverse=True)
+        Returns:
+            List of matching pets with similarity scores, best first
+        """
+        if threshold is None:
+            threshold = settings.FACE_SIMILARITY_THRESHOLD['LOBO_TRAIL']
+        
+        try:
+            hits = search_embeddings('face_embedding', query_embedding, top_k, pet_type, threshold)
+        except Exception as e:
+            logger.error(f"Embedding index threshold search failed, falling back to a full scan: {e}")
+            matches = FaceMatchingService.find_similar_pets(query_embedding, top_k, pet_type)
+            return [match for match in matches if match['similarity'] >= threshold]
+        
+        matches = FaceMatchingService.rerank_by_exemplars(query_embedding, FaceMatchingService.build_matches(hits))
+        return [match for match in matches if match['similarity'] >= threshold]
+    
+    @staticmethod
+    def find_similar_pets_fused(query_embeddings: List[np.ndarray], top_k: int = 10,
+                                pet_type: Optional[str] = None,
+                                fusion: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Find similar pets for several photos of the same animal
+        
+        Args:
+            query_embeddings: Face embedding vectors of the photos
+            top_k: Number of top matches to return
+            pet_type: Only compare against pets of this type
+            fusion: 'mean' searches once with the mean of the normalized
+                embeddings, 'max' scores each pet by its best photo; defaults
+                to QUERY_FUSION['METHOD']
+                
+        Returns:
+            List of similar pets with similarity scores
+        """
+        fusion = fusion or settings.QUERY_FUSION['METHOD']
+        if len(query_embeddings) == 1 or fusion == 'mean':
+            return FaceMatchingService.find_similar_pets(fuse_embeddings(query_embeddings), top_k, pet_type)
+        
+        # One batched index search shortlists pets by any photo
+        shortlist = max(top_k, settings.EXEMPLAR_SEARCH['SHORTLIST'])
+        try:
+            all_hits = search_embeddings_batch(
+                'face_embedding', np.vstack(query_embeddings), shortlist, [pet_type] * len(query_embeddings)
+            )
+        except Exception as e:
+            logger.error(f"Embedding index batch search failed, searching one photo at a time: {e}")
+            match_lists = [
+                FaceMatchingService.find_similar_pets(query_embedding, shortlist, pet_type)
+                for query_embedding in query_embeddings
+            ]
+            return FaceMatchingService.merge_by_max(match_lists)[:top_k]
+        
+        best = {}
+        for hits in all_hits:
+            for object_id, similarity in hits:
+                best[object_id] = max(similarity, best.get(object_id, -1.0))
+        hits = sorted(best.items(), key=lambda hit: hit[1], reverse=True)[:shortlist]
+        matches = FaceMatchingService.build_matches(hits)
+        return FaceMatchingService.rerank_by_exemplars(np.vstack(query_embeddings), matches)[:top_k]
+    
+    @staticmethod
+    def find_matching_pets_fused(query_embeddings: List[np.ndarray], top_k: int = 10,
+                                 threshold: Optional[float] = None,
+                                 pet_type: Optional[str] = None,
+                                 fusion: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Find pets reaching the match threshold for several photos of the same animal
+        
+        With 'max' fusion a pet matches when any photo reaches the threshold,
+        and is scored by its best photo.
+        
+        Args:
+            query_embeddings: Face embedding vectors of the photos
+            top_k: Number of top matches to return
+            threshold: Minimum similarity, defaults to the lobo_trail threshold
+            pet_type: Only compare against pets of this type
+            fusion: 'mean' or 'max', defaults to QUERY_FUSION['METHOD']
             
-            return similarities[:top_k]
+        Returns:
+            List of matching pets with similarity scores, best first
+        """
+        fusion = fusion or settings.QUERY_FUSION['METHOD']
+        if len(query_embeddings) == 1 or fusion == 'mean':
+            return FaceMatchingService.find_matching_pets(
+                fuse_embeddings(query_embeddings), top_k, threshold, pet_type
+            )
+        
+        match_lists = [
+            FaceMatchingService.find_matching_pets(query_embedding, top_k, threshold, pet_type)
+            for query_embedding in query_embeddings
+        ]
+        return FaceMatchingService.merge_by_max(match_lists)[:top_k]
+    
+    @staticmethod
+    def merge_by_max(match_lists: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Merge the matches of several queries, keeping each pet's best similarity, best first"""
+        best = {}
+        for matches in match_lists:
+            for match in matches:
+                key = match['embedding'].pk
+                if key not in best or match['similarity'] > best[key]['similarity']:
+                    best[key] = match
+        return sorted(best.values(), key=lambda x: x['similarity'], reverse=True)
+    
+    @staticmethod
+    def find_similar_pets_batch(query_embeddings: List[np.ndarray], top_k: int = 10,
+                                pet_types: Optional[List[Optional[str]]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Find similar pets for several query embeddings at once
+        
+        The index scores all queries with one matrix-matrix product, and the
+        matched pets and their exemplars are loaded with one query each for
+        the whole batch.
+        
+        Args:
+            query_embeddings: Query face embedding vectors
+            top_k: Number of top matches to return per query
+            pet_types: Pet type to compare against for each query, None for every type
             
-        except Exception as e:
-            logger.error(f"Error finding similar pets: {e}")
+        Returns:
+            One list of similar pets with similarity scores per query
+        """
+        if not query_embeddings:
             return []
+        pet_types = pet_types or [None] * len(query_embeddings)
+        
+        shortlist = max(top_k, settings.EXEMPLAR_SEARCH['SHORTLIST'])
+        try:
+            all_hits = search_embeddings_batch('face_embedding', np.vstack(query_embeddings), shortlist, pet_types)
+        except Exception as e:
+            logger.error(f"Embedding index batch search failed, searching one query at a time: {e}")
+            return [
+                FaceMatchingService.find_similar_pets(query_embedding, top_k, pet_type)
+                for query_embedding, pet_type in zip(query_embeddings, pet_types)
+            ]
+        
+        unique_hits = {object_id: similarity for hits in all_hits for object_id, similarity in hits}
+        matches_by_id = {
+            str(match['embedding'].pk): match
+            for match in FaceMatchingService.build_matches(list(unique_hits.items()))
+        }
+        exemplars = FaceMatchingService.load_exemplars(list(matches_by_id))
+        
+        results = []
+        for query_embedding, hits in zip(query_embeddings, all_hits):
+            matches = []
+            for object_id, similarity in hits:
+                match = matches_by_id.get(object_id)
+                if match is None:
+                    # Deleted since the last index refresh
+                    continue
+                # Each query gets its own copy, with its own similarity
+                similarity = max(0.0, min(1.0, similarity))
+                matches.append(dict(
+                    match,
+                    similarity=similarity,
+                    confidence_level=FaceRecognitionResult.determine_confidence_level(similarity)
+                ))
+            results.append(FaceMatchingService.rerank_by_exemplars(query_embedding, matches, exemplars)[:top_k])
+        return results
+    
+    @staticmethod
+    def load_exemplars(embedding_ids: List[Any]) -> List[Tuple[str, bytes, int]]:
+        """Get the (FaceEmbedding pk, float16 vector bytes, dimension) of the exemplars of some embeddings"""
+        return [
+            (str(embedding_id), vector, dimension)
+            for embedding_id, vector, dimension in FaceExemplar.objects.filter(
+                face_embedding_id__in=embedding_ids
+            ).values_list('face_embedding_id', 'vector', 'vector_dimension')
+        ]
+    
+    @staticmethod
+    def rerank_by_exemplars(query_embedding: np.ndarray, matches: List[Dict[str, Any]],
+                            exemplars: Optional[List[Tuple[str, bytes, int]]] = None) -> List[Dict[str, Any]]:
+        """
+        Re-score matches by their most similar per-image exemplar
+        
+        Matches whose embedding has no exemplars (created before exemplars
+        were kept) keep their centroid similarity.
+        
+        Args:
+            query_embedding: Query face embedding vector, or an (n, d) matrix of
+                query embeddings of one animal to score by the best pair
+            matches: Match dictionaries from a centroid search
+            exemplars: Exemplars from load_exemplars covering the matches,
+                loaded here when not given
+            
+        Returns:
+            The matches with updated similarity and confidence, best first
+        """
+        if not matches:
+            return matches
+        
+        queries = normalize_rows(np.atleast_2d(np.asarray(query_embedding, dtype=np.float32)))
+        
+        if exemplars is None:
+            exemplars = FaceMatchingService.load_exemplars([match['embedding'].pk for match in matches])
+        match_ids = {str(match['embedding'].pk) for match in matches}
+        rows = [
+            (embedding_id, vector)
+            for embedding_id, vector, dimension in exemplars
+            if dimension == queries.shape[1] and embedding_id in match_ids
+        ]
+        if not rows:
+            return matches
+        
+        # Exemplars are stored L2-normalized
+        vectors = np.vstack([np.frombuffer(bytes(vector), dtype=np.float16) for _, vector in rows])
+        scores = similarities(queries, vectors).max(axis=0)
+        
+        embedding_ids = sorted({embedding_id for embedding_id, _ in rows})
+        segments = np.searchsorted(embedding_ids, [embedding_id for embedding_id, _ in rows])
+        best = np.full(len(embedding_ids), -np.inf, dtype=np.float32)
+        np.maximum.at(best, segments, scores)
+        best_scores = dict(zip(embedding_ids, best.tolist()))
+        
+        for match in matches:
+            similarity = best_scores.get(str(match['embedding'].pk))
+            if similarity is not None:
+                similarity = max(0.0, min(1.0, similarity))
+                match['similarity'] = similarity
+                match['confidence_level'] = FaceRecognitionResult.determine_confidence_level(similarity)
+        
+        matches.sort(key=lambda x: x['similarity'], reverse=True)
+        return matches
+    
+    @staticmethod
+    def search_index(query_embedding: np.ndarray, top_k: int = 10,
+                     pet_type: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Find similar pets using this worker's in-memory embedding index
+        
+        While the index loads in the background the table is streamed instead.
+        
+        Args:
+            query_embedding: Query embedding vector
+            top_k: Number of top matches to return
+            pet_type: Only search the partition of this pet type
+            
+        Returns:
+            List of similar pets with similarity scores, or None if the index
+            search failed
+        """
+        try:
+            hits = search_embeddings('face_embedding', query_embedding, top_k, pet_type)
+        except Exception as e:
+            logger.error(f"Embedding index search failed, falling back to a full scan: {e}")
+            return None
+        
+        return FaceMatchingService.build_matches(hits)
+    
+    @staticmethod
+    def build_matches(hits: List[Tuple[str, float]]) -> List[Dict[str, Any]]:
+        """Turn (FaceEmbedding pk, similarity) index hits into match dictionaries"""
+        embeddings = {
+            str(face_embedding.pk): face_embedding
+            for face_embedding in FaceEmbedding.objects.select_related('pet').filter(
+                pk__in=[object_id for object_id, _ in hits]
+            )
+        }
+        
+        matches = []
+        for object_id, similarity in hits:
+            face_embedding = embeddings.get(object_id)
+            if face_embedding is None:
+                # Deleted since the last index refresh
+                continue
+            
+            similarity = max(0.0, min(1.0, similarity))
+            matches.append({
+                'pet': face_embedding.pet,
+                'embedding': face_embedding,
+                'similarity': similarity,
+                'confidence_level': FaceRecognitionResult.determine_confidence_level(similarity)
+            })
+        
+        return matches
     
     @staticmethod
     def create_recognition_result(search_embedding: FaceEmbedding, 
@@ -418,17 +1152,10 @@ def calculate_cosine_similarity(vec1: np.ndarray, vec2: np.ndarray) -> float:
         Cosine similarity score (0 to 1)
     """
     try:
-        # Normalize vectors
-        vec1_norm = vec1 / np.linalg.norm(vec1)
-        vec2_norm = vec2 / np.linalg.norm(vec2)
+        similarity = float(similarities(normalize(vec1)[0], normalize(vec2)[0])[0, 0])
         
-        # Calculate cosine similarity
-        similarity = np.dot(vec1_norm, vec2_norm)
-        
-        # Ensure result is between 0 and 1
-        similarity = max(0, min(1, similarity))
-        
-        return float(similarity)
+        # Ensure result is between 0 and 1, like the scores of index searches
+        return max(0.0, min(1.0, similarity))
         
     except Exception as e:
         logger.error(f"Error calculating cosine similarity: {e}")
@@ -445,6 +1172,21 @@ def process_search_image(image_file: InMemoryUploadedFile) -> Optional[np.ndarra
     Returns:
         Face embedding vector or None
     """
+    result = process_search_face(image_file)
+    return result[0] if result is not None else None
+
+
+def process_search_face(image_file: InMemoryUploadedFile) -> Optional[Tuple[np.ndarray, Dict[str, Any]]]:
+    """
+    Process a search image and extract the face embedding with its detection
+    
+    Args:
+        image_file: Uploaded image file
+        
+    Returns:
+        (embedding, detection) of the most confident face, or None; the
+        detection's class and confidence route the search by pet type
+    """
     try:
         # Save temporary file
         import tempfile
@@ -457,7 +1199,7 @@ def process_search_image(image_file: InMemoryUploadedFile) -> Optional[np.ndarra
         
         try:
             # Detect faces
-            yolo_service = YOLODetectionService()
+            yolo_service = YOLODetectionService(endpoint='search')
             detections = yolo_service.detect_pet_faces(temp_path)
             
             # Filter for face detections
@@ -481,12 +1223,93 @@ def process_search_image(image_file: InMemoryUploadedFile) -> Optional[np.ndarra
             embedding_service = FaceEmbeddingService()
             embedding = embedding_service.generate_embedding(face_crop)
             
-            return embedding
+            if embedding is None:
+                return None
+            return embedding, best_detection
             
         finally:
             # Clean up temporary file
             os.unlink(temp_path)
         
+    except PoolTimeout:
+        raise
     except Exception as e:
         logger.error(f"Error processing search image: {e}")
-        return None 
\ No newline at end of file
+        return None 
+
+def process_search_faces(image_files: List[InMemoryUploadedFile]) -> List[Optional[Tuple[np.ndarray, Dict[str, Any]]]]:
+    """
+    Process several search images with batched detection and embedding
+    
+    All images go through the detector as one batch and all face crops
+    through the embedding model as one batch, instead of one forward pass
+    of each model per image.
+    
+    Args:
+        image_files: Uploaded image files
+        
+    Returns:
+        One (embedding, detection) of the most confident face, or None, per image
+    """
+    import tempfile
+    import os
+    
+    temp_paths = []
+    try:
+        for image_file in image_files:
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
+                for chunk in image_file.chunks():
+                    temp_file.write(chunk)
+                temp_paths.append(temp_file.name)
+        
+        yolo_service = YOLODetectionService(endpoint='search')
+        images = [yolo_service.load_detection_image(temp_path) for temp_path in temp_paths]
+        decoded = [i for i, (image, _) in enumerate(images) if image is not None]
+        
+        detections = [[] for _ in temp_paths]
+        for i, image_detections in zip(decoded, yolo_service.detect_pet_faces_batch([images[i] for i in decoded])):
+            detections[i] = image_detections
+        
+        # Crop the most confident face of each image from its decoded image
+        crops = []
+        for i, image_detections in enumerate(detections):
+            face_detections = [d for d in image_detections if d['class'].endswith('_face')]
+            if not face_detections:
+                continue
+            image, scale = images[i]
+            face_crop = yolo_service.crop_face(temp_paths[i], image, scale, face_detections[0]['bounding_box'])
+            if face_crop is not None and face_crop.size:
+                crops.append((i, face_crop, face_detections[0]))
+        
+        results: List[Optional[Tuple[np.ndarray, Dict[str, Any]]]] = [None] * len(temp_paths)
+        embeddings = FaceEmbeddingService().generate_embeddings([face_crop for _, face_crop, _ in crops])
+        for (i, _, detection), embedding in zip(crops, embeddings):
+            if embedding is not None:
+                results[i] = (embedding, detection)
+        
+        if len(crops) < len(temp_paths):
+            logger.warning(f"No usable pet face in {len(temp_paths) - len(crops)} of {len(temp_paths)} search images")
+        return results
+    
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing search images: {e}")
+        return [None] * len(image_files)
+    finally:
+        for temp_path in temp_paths:
+            os.unlink(temp_path)
+
+
+def fuse_embeddings(embeddings: List[np.ndarray]) -> np.ndarray:
+    """
+    Fuse several embeddings of one animal into a single query embedding
+    
+    Args:
+        embeddings: Face embedding vectors of the same animal
+        
+    Returns:
+        The L2-normalized mean of the L2-normalized embeddings
+    """
+    fused, _ = normalize(normalize_rows(np.asarray(embeddings, dtype=np.float32)).mean(axis=0))
+    return fused
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+
+from .models import FaceEmbedding, EmbeddingChangeLog
+
+
+# Sent (with `job`) inside the transaction that makes a ReembeddingJob's model
+# the active one; state derived from the old model's vectors must be dropped
+embedding_model_activated = Signal()
+
+
+@receiver(post_save, sender=FaceEmbedding)
+def log_face_embedding_save(sender, instance, **kwargs):
+    """Record the write so other workers' indexes pick it up"""
+    # Only completed embeddings are searchable; anything else leaves the index
+    operation = 'upsert' if instance.status == 'completed' else 'delete'
+    EmbeddingChangeLog.record('face_embedding', [instance.pk], operation)
+
+
+@receiver(post_delete, sender=FaceEmbedding)
+def log_face_embedding_delete(sender, instance, **kwargs):
+    """Record a tombstone for a deleted embedding"""
+    EmbeddingChangeLog.record('face_embedding', [instance.pk], 'delete')
@@ -0,0 +1,45 @@
+from typing import Tuple
+
+import numpy as np
+
+
+def normalize(vector) -> Tuple[np.ndarray, float]:
+    """
+    L2-normalize one embedding
+    
+    Args:
+        vector: Embedding as a numpy array or list
+        
+    Returns:
+        The float32 unit vector (all zeros stays all zeros) and the original norm
+    """
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(vector))
+    return vector / (norm or 1.0), norm
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize the rows of a matrix, leaving all-zero rows untouched"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def similarities(query, matrix) -> np.ndarray:
+    """
+    Cosine similarities between L2-normalized embeddings
+    
+    Stored embeddings are normalized when they are written (see
+    set_embedding_vector), so the similarity is a plain dot product and
+    every pair of a batch is scored by one matrix product.
+    
+    Args:
+        query: (Q, D) unit query embeddings, or one (D,) embedding
+        matrix: (N, D) unit embeddings, or one (D,) embedding
+        
+    Returns:
+        (Q, N) float32 similarities
+    """
+    query = np.atleast_2d(np.asarray(query, dtype=np.float32))
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    return query @ matrix.T
@@ -0,0 +1,78 @@
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    """Count the set bits of every uint64 word (SWAR, for NumPy < 2.0)"""
+    words = words - ((words >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    words = (words & np.uint64(0x3333333333333333)) + ((words >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    words = (words + (words >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (words * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+# NumPy 2.0 ships a native popcount ufunc
+popcount = getattr(np, 'bitwise_count', _popcount)
+
+
+@lru_cache(maxsize=None)
+def get_projection(dimension: int, bits: int, seed: int) -> np.ndarray:
+    """
+    Get the (bits, dimension) random rotation behind the sign sketches
+    
+    Built from orthonormal blocks (QR of a seeded Gaussian matrix), so every
+    process derives the same rotation from SIGN_SKETCH['SEED'].
+    """
+    rng = np.random.default_rng(seed)
+    blocks = []
+    for _ in range(-(-bits // dimension)):
+        q, _ = np.linalg.qr(rng.normal(size=(dimension, dimension)))
+        blocks.append(q.T)
+    return np.vstack(blocks)[:bits].astype(np.float32)
+
+
+def sketch_config():
+    """Get the (bits, seed) sketches are currently computed with"""
+    return settings.SIGN_SKETCH['BITS'], settings.SIGN_SKETCH['SEED']
+
+
+def compute_sketches(vectors: np.ndarray) -> np.ndarray:
+    """
+    Compute packed sign-bit sketches
+    
+    Args:
+        vectors: (n, d) or (d,) vectors
+        
+    Returns:
+        (n, bits / 64) uint64 array, one bit per rotated coordinate
+    """
+    bits, seed = sketch_config()
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    projected = vectors @ get_projection(vectors.shape[1], bits, seed).T
+    packed = np.packbits(projected > 0, axis=1, bitorder='little')
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+
+def hamming_distances(sketches: np.ndarray, query: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+    """Hamming distance between one packed query sketch and every stored sketch"""
+    distances = np.zeros(len(sketches), dtype=np.int32)
+    for start in range(0, len(sketches), chunk_size):
+        counts = popcount(np.bitwise_xor(sketches[start:start + chunk_size], query))
+        # Summing word columns is faster than a row-wise reduction over 8 words
+        block = distances[start:start + chunk_size]
+        for word in range(counts.shape[1]):
+            block += counts[:, word].astype(np.int32)
+    return distances
+
+
+def max_hamming_distance(threshold: float, bits: int, z_score: float) -> float:
+    """
+    Largest Hamming distance that may still hide a cosine similarity >= threshold
+    
+    For a random rotation each sign bit differs with probability angle / pi,
+    so the distance is roughly binomial; allow z_score standard deviations
+    of slack above the expected distance at the threshold angle.
+    """
+    p = np.arccos(np.clip(threshold, -1.0, 1.0)) / np.pi
+    return bits * p + z_score * np.sqrt(bits * p * (1 - p))
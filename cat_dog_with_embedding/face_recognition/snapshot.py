@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import itertools
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+
+from .models import EmbeddingChangeLog
+from .sketch import compute_sketches, sketch_config
+
+logger = logging.getLogger(__name__)
+
+
+SNAPSHOT_MAGIC = 'pet-face-id-embeddings'
+SNAPSHOT_FORMAT = 2
+HEADER_SIZE = 4096
+
+# Pet type codes stored in the snapshot's pet type array
+PET_TYPE_CODES = {'cat': 1, 'dog': 2}
+
+
+def get_snapshot_path(source: str) -> Path:
+    """Get the path of the current snapshot for a change log source"""
+    return Path(settings.EMBEDDING_SNAPSHOT_DIR) / f'{source}.snapshot'
+
+
+class EmbeddingSnapshot:
+    """
+    Read-only, memory-mapped view of an embedding snapshot file
+    
+    Layout: a fixed-size JSON header padded to HEADER_SIZE bytes, followed by
+    a (count, dimension) float32 matrix of L2-normalized vectors, a fixed-width
+    id array, a uint8 pet type array and a (count, bits / 64) uint64 array of
+    sign sketches. Rows are ordered by pet type code, so each pet type is a
+    contiguous slice. The arrays are np.memmap'd, so every worker on the node
+    shares the same page cache instead of holding a copy.
+    
+    `sketches` is None when the file was written with a different
+    SIGN_SKETCH configuration than the one currently in effect.
+    """
+    
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            header = json.loads(f.read(HEADER_SIZE).rstrip(b'\0'))
+        
+        if header.get('magic') != SNAPSHOT_MAGIC or header.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f"Not an embedding snapshot: {self.path}")
+        
+        self.identity = (stat.st_ino, stat.st_mtime_ns)
+        self.source = header['source']
+        self.version = header['version']
+        self.count = header['count']
+        self.dimension = header['dimension']
+        self.last_seq = header['last_seq']
+        self.created_at = header['created_at']
+        
+        sketch_bits, sketch_seed = header['sketch_bits'], header['sketch_seed']
+        sketch_words = sketch_bits // 64
+        
+        offset = HEADER_SIZE
+        if self.count:
+            self.vectors = np.memmap(self.path, dtype=np.float32, mode='r', offset=offset,
+                                     shape=(self.count, self.dimension))
+            offset += self.vectors.nbytes
+            self.ids = np.memmap(self.path, dtype=header['id_dtype'], mode='r', offset=offset, shape=(self.count,))
+            offset += self.ids.nbytes
+            self.pet_types = np.memmap(self.path, dtype=np.uint8, mode='r', offset=offset, shape=(self.count,))
+            offset += self.pet_types.nbytes
+            self.sketches = np.memmap(self.path, dtype=np.uint64, mode='r', offset=offset,
+                                      shape=(self.count, sketch_words))
+        else:
+            self.vectors = np.zeros((0, self.dimension), dtype=np.float32)
+            self.ids = np.zeros(0, dtype=header['id_dtype'])
+            self.pet_types = np.zeros(0, dtype=np.uint8)
+            self.sketches = np.zeros((0, sketch_words), dtype=np.uint64)
+        
+        if (sketch_bits, sketch_seed) != sketch_config():
+            self.sketches = None
+    
+    def __len__(self):
+        return self.count
+    
+    def unusable_reason(self, margin: float = 0.0) -> Optional[str]:
+        """
+        Get why an index cannot start from this snapshot, or None if it can
+        
+        Once the snapshot is older than CHANGELOG_RETENTION_HOURS the entries
+        needed to catch up may be compacted away, and a snapshot taken before
+        an embedding model swap holds vectors of the old model.
+        
+        Args:
+            margin: Seconds from now the snapshot has to remain usable for
+        """
+        retention = settings.EMBEDDING_INDEX['CHANGELOG_RETENTION_HOURS'] * 3600
+        if time.time() + margin - self.created_at > retention:
+            return 'older than the change log retention'
+        if EmbeddingChangeLog.objects.filter(source=self.source, seq__gt=self.last_seq, operation='reset').exists():
+            return 'taken before the last embedding model swap'
+        return None
+    
+    @classmethod
+    def open(cls, source: str) -> Optional['EmbeddingSnapshot']:
+        """Open the current snapshot for a source, or None if there is none"""
+        path = get_snapshot_path(source)
+        if not path.exists():
+            return None
+        
+        try:
+            return cls(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Could not open embedding snapshot {path}: {e}")
+            return None
+
+
+def file_identity(path: Path) -> Optional[Tuple[int, int]]:
+    """Get the (inode, mtime) of a file, which changes whenever it is replaced"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns)
+
+
+def get_snapshot_identity(source: str) -> Optional[Tuple[int, int]]:
+    """Get the identity of the current snapshot file of a source"""
+    return file_identity(get_snapshot_path(source))
+
+
+def write_snapshot(source: str, path: Optional[Path] = None) -> Path:
+    """
+    Write a new snapshot of a change log source and atomically replace the current one
+    
+    Args:
+        source: Change log source ('face_embedding', 'face_vector' or 'face_project')
+        path: Where to write it, defaults to the source's shared snapshot path
+        
+    Returns:
+        Path of the snapshot file
+    """
+    from .index import INDEX_SOURCES
+    
+    model_label, row_filter, pet_type_field, vector_field = INDEX_SOURCES[source]
+    path = Path(path) if path else get_snapshot_path(source)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    start_time = time.time()
+    
+    # Taken before reading the table: workers replay later changes on top
+    last_seq = EmbeddingChangeLog.settled_seq(source)
+    
+    fields = ['pk', vector_field, pet_type_field] if pet_type_field else ['pk', vector_field]
+    queryset = apps.get_model(model_label).objects.filter(**row_filter).values_list(*fields)
+    
+    # One query per pet type, in code order (unknown types first)
+    partitions = [queryset]
+    if pet_type_field:
+        partitions = [queryset.exclude(**{f'{pet_type_field}__in': list(PET_TYPE_CODES)})] + [
+            queryset.filter(**{pet_type_field: pet_type})
+            for pet_type in sorted(PET_TYPE_CODES, key=PET_TYPE_CODES.get)
+        ]
+    
+    ids = []
+    pet_types = []
+    sketches = []
+    chunk = []
+    dimension = None
+    
+    # Write into a temporary file next to the target so the rename is atomic
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{source}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.seek(HEADER_SIZE)
+            for row in itertools.chain.from_iterable(partition.iterator(chunk_size=1000) for partition in partitions):
+                vector = np.asarray(row[1] or [], dtype=np.float32)
+                if not vector.size:
+                    continue
+                if dimension is None:
+                    dimension = vector.shape[0]
+                elif vector.shape[0] != dimension:
+                    logger.warning(f"Skipping {source} {row[0]}: dimension {vector.shape[0]} != {dimension}")
+                    continue
+                
+                vector = (vector / (np.linalg.norm(vector) or 1.0)).astype(np.float32)
+                f.write(vector.tobytes())
+                ids.append(str(row[0]))
+                pet_types.append(PET_TYPE_CODES.get(row[2], 0) if pet_type_field else 0)
+                
+                # Sketches are computed a chunk at a time and written after the other arrays
+                chunk.append(vector)
+                if len(chunk) == 1000:
+                    sketches.append(compute_sketches(np.vstack(chunk)))
+                    chunk = []
+            if chunk:
+                sketches.append(compute_sketches(np.vstack(chunk)))
+            
+            id_array = np.array(ids, dtype=f'S{max([len(i) for i in ids] or [1])}')
+            f.write(id_array.tobytes())
+            f.write(np.array(pet_types, dtype=np.uint8).tobytes())
+            for sketch_chunk in sketches:
+                f.write(sketch_chunk.tobytes())
+            
+            sketch_bits, sketch_seed = sketch_config()
+            
+            header = json.dumps({
+                'magic': SNAPSHOT_MAGIC,
+                'format': SNAPSHOT_FORMAT,
+                'source': source,
+                'version': time.time_ns(),
+                'count': len(ids),
+                'dimension': dimension or 0,
+                'id_dtype': id_array.dtype.str,
+                'last_seq': last_seq,
+                'created_at': start_time,
+                'sketch_bits': sketch_bits,
+                'sketch_seed': sketch_seed,
+            }).encode()
+            f.seek(0)
+            f.write(header.ljust(HEADER_SIZE, b'\0'))
+            f.flush()
+            os.fsync(f.fileno())
+        
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    
+    logger.info(f"Wrote {source} snapshot: {len(ids)} vectors up to seq {last_seq} in {time.time() - start_time:.2f}s")
+    return path
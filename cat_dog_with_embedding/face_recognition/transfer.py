@@ -0,0 +1,324 @@
+import io
+import json
+import time
+import logging
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+from django.apps import apps
+from django.db import models, transaction
+
+from .index import INDEX_SOURCES
+from .models import EmbeddingChangeLog
+
+logger = logging.getLogger(__name__)
+
+
+EXPORT_MAGIC = 'pet-face-id-export'
+EXPORT_FORMAT = 1
+
+# source: (model, vector field, norm field, fields left out of the export).
+# In import order, parents first. Exemplars and running sums are not
+# exported; IVF assignments belong to the source environment's clustering run.
+EXPORT_SOURCES = {
+    'face_project': ('simple_face_id.FaceProject', 'centroid_vector', None, set()),
+    'face_embedding': ('face_recognition.FaceEmbedding', 'embedding_vector', 'embedding_norm', {'embedding_sum', 'failed_images'}),
+    'face_vector': ('simple_face_id.FaceVector', 'embedding_vector', 'embedding_norm', {'cluster_run', 'cluster_id'}),
+}
+
+# Columns stored as float64 with NaN for null; datetimes as microseconds since the epoch
+NUMBER_FIELDS = {
+    'FloatField', 'IntegerField', 'PositiveIntegerField', 'SmallIntegerField', 'PositiveSmallIntegerField',
+    'BigIntegerField', 'PositiveBigIntegerField', 'BooleanField',
+}
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def get_export_fields(source: str) -> List[models.Field]:
+    """Get the metadata fields of a source written next to its vectors"""
+    model_label, vector_field, norm_field, excluded = EXPORT_SOURCES[source]
+    return [
+        field for field in apps.get_model(model_label)._meta.concrete_fields
+        if not field.primary_key and field.name not in excluded and field.name not in (vector_field, norm_field)
+    ]
+
+
+def field_kind(field: models.Field) -> str:
+    """Get how a field's column is stored: 'number', 'datetime' or 'json'"""
+    internal_type = field.get_internal_type()
+    if internal_type in NUMBER_FIELDS:
+        return 'number'
+    if internal_type == 'DateTimeField':
+        return 'datetime'
+    return 'json'
+
+
+def encode_text(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Pack strings into one UTF-8 byte array and their (n + 1) offsets"""
+    encoded = [value.encode() for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def decode_text(data: np.ndarray, offsets: np.ndarray) -> List[str]:
+    """Unpack the strings of encode_text"""
+    data = data.tobytes()
+    offsets = offsets.tolist()
+    return [data[start:end].decode() for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def encode_column(kind: str, values: list) -> Dict[str, np.ndarray]:
+    """Encode one metadata column of a chunk as named arrays"""
+    if kind == 'number':
+        return {'': np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)}
+    if kind == 'datetime':
+        return {'': np.array([np.nan if value is None else (value - EPOCH) // MICROSECOND for value in values], dtype=np.float64)}
+    data, offsets = encode_text([json.dumps(value, default=str) for value in values])
+    return {'.data': data, '.offsets': offsets}
+
+
+def decode_column(field: models.Field, kind: str, arrays: Dict[str, np.ndarray]) -> list:
+    """Decode one metadata column of a chunk back to field values"""
+    if kind == 'number':
+        return [None if np.isnan(value) else field.to_python(value) for value in arrays[''].tolist()]
+    if kind == 'datetime':
+        return [
+            None if np.isnan(value) else EPOCH + int(value) * MICROSECOND
+            for value in arrays[''].tolist()
+        ]
+    values = (json.loads(value) for value in decode_text(arrays['.data'], arrays['.offsets']))
+    # Converts ids back to their type (UUIDs of foreign keys)
+    return [None if value is None else field.to_python(value) for value in values]
+
+
+def write_array(archive: zipfile.ZipFile, name: str, array: np.ndarray):
+    """Write one .npy member; members are stored uncompressed, so vectors can be read back at disk speed"""
+    with archive.open(f'{name}.npy', 'w', force_zip64=True) as f:
+        np.lib.format.write_array(f, np.ascontiguousarray(array), allow_pickle=False)
+
+
+def read_array(archive: zipfile.ZipFile, name: str) -> np.ndarray:
+    """Read one .npy member"""
+    with archive.open(f'{name}.npy') as f:
+        return np.lib.format.read_array(io.BufferedReader(f), allow_pickle=False)
+
+
+def iter_export_chunks(source: str, chunk_size: int) -> Iterator[list]:
+    """Yield the rows of a source in primary key order, chunk_size at a time, from one streaming query"""
+    model_label, vector_field, norm_field, _ = EXPORT_SOURCES[source]
+    columns = ['pk', vector_field, norm_field] if norm_field else ['pk', vector_field]
+    columns += [field.attname for field in get_export_fields(source)]
+    rows = apps.get_model(model_label).objects.order_by('pk').values_list(*columns).iterator(chunk_size=2000)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def export_embeddings(path: str, sources: List[str], embedding_model: str, chunk_size: int,
+                      progress=None) -> Dict[str, Any]:
+    """
+    Stream the rows of some sources into a chunked .npz archive
+    
+    Each chunk of a source is a group of .npy members: the (n, dimension)
+    float32 matrix of L2-normalized vectors, a mask of the rows that have
+    one, the norms, the ids and one column per metadata field. At most one
+    chunk is in memory at a time. A manifest.json member describes the
+    sources, chunks and columns.
+    
+    Args:
+        path: Archive to write
+        sources: EXPORT_SOURCES keys
+        embedding_model: Model the vectors were made with, checked on import
+        chunk_size: Rows per chunk
+        progress: Called with (source, rows written so far) after each chunk
+        
+    Returns:
+        The manifest
+    """
+    manifest = {
+        'magic': EXPORT_MAGIC,
+        'format': EXPORT_FORMAT,
+        'embedding_model': embedding_model,
+        'created_at': time.time(),
+        'sources': {},
+    }
+    
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for source in sources:
+            _, vector_field, norm_field, _ = EXPORT_SOURCES[source]
+            fields = get_export_fields(source)
+            offset = 3 if norm_field else 2
+            dimension = None
+            count = chunks = 0
+            
+            for rows in iter_export_chunks(source, chunk_size):
+                for row in rows:
+                    if row[1]:
+                        dimension = dimension or len(row[1])
+                        break
+                
+                has_vector = np.array([bool(row[1]) and len(row[1]) == dimension for row in rows], dtype=bool)
+                vectors = np.zeros((len(rows), dimension or 0), dtype=np.float32)
+                if has_vector.any():
+                    vectors[has_vector] = np.asarray([row[1] for row, present in zip(rows, has_vector) if present],
+                                                     dtype=np.float32)
+                skipped = sum(1 for row, present in zip(rows, has_vector) if row[1] and not present)
+                if skipped:
+                    logger.warning(f"Exported {skipped} {source} rows without their vector: dimension != {dimension}")
+                
+                prefix = f'{source}/{chunks:06d}'
+                write_array(archive, f'{prefix}/vectors', vectors)
+                write_array(archive, f'{prefix}/has_vector', has_vector)
+                for suffix, array in encode_column('json', [str(row[0]) for row in rows]).items():
+                    write_array(archive, f'{prefix}/ids{suffix}', array)
+                if norm_field:
+                    write_array(archive, f'{prefix}/norms', encode_column('number', [row[2] for row in rows])[''])
+                for i, field in enumerate(fields):
+                    for suffix, array in encode_column(field_kind(field), [row[offset + i] for row in rows]).items():
+                        write_array(archive, f'{prefix}/{field.attname}{suffix}', array)
+                
+                count += len(rows)
+                chunks += 1
+                if progress:
+                    progress(source, count)
+            
+            manifest['sources'][source] = {
+                'model': EXPORT_SOURCES[source][0],
+                'count': count,
+                'chunks': chunks,
+                'dimension': dimension or 0,
+                'fields': {field.attname: field_kind(field) for field in fields},
+            }
+        
+        archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+    
+    return manifest
+
+
+def read_manifest(archive: zipfile.ZipFile) -> Dict[str, Any]:
+    """
+    Read the manifest of an export archive
+    
+    Raises:
+        ValueError: Not an export archive of a supported format
+    """
+    try:
+        manifest = json.loads(archive.read('manifest.json'))
+    except (KeyError, ValueError):
+        raise ValueError('Not an embedding export: no manifest')
+    if manifest.get('magic') != EXPORT_MAGIC or manifest.get('format') != EXPORT_FORMAT:
+        raise ValueError('Not an embedding export of a supported format')
+    return manifest
+
+
+def iter_import_chunks(archive: zipfile.ZipFile, manifest: Dict[str, Any], source: str) -> Iterator[list]:
+    """Yield the rows of one source of an archive as model instances, a chunk at a time"""
+    model_label, vector_field, norm_field, _ = EXPORT_SOURCES[source]
+    model = apps.get_model(model_label)
+    fields = {field.attname: field for field in get_export_fields(source)}
+    columns = [(fields[attname], kind) for attname, kind in manifest['sources'][source]['fields'].items() if attname in fields]
+    
+    for chunk in range(manifest['sources'][source]['chunks']):
+        prefix = f'{source}/{chunk:06d}'
+        vectors = read_array(archive, f'{prefix}/vectors')
+        has_vector = read_array(archive, f'{prefix}/has_vector')
+        ids = decode_text(read_array(archive, f'{prefix}/ids.data'), read_array(archive, f'{prefix}/ids.offsets'))
+        norms = read_array(archive, f'{prefix}/norms').tolist() if norm_field else None
+        values = {}
+        for field, kind in columns:
+            suffixes = [''] if kind != 'json' else ['.data', '.offsets']
+            arrays = {suffix: read_array(archive, f'{prefix}/{field.attname}{suffix}') for suffix in suffixes}
+            values[field.attname] = decode_column(field, kind, arrays)
+        
+        objects = []
+        for i, object_id in enumerate(ids):
+            obj = model(pk=model._meta.pk.to_python(json.loads(object_id)))
+            for attname, column in values.items():
+                setattr(obj, attname, column[i])
+            # Vectors were normalized when written, so they are stored as they are
+            setattr(obj, vector_field, vectors[i].tolist() if has_vector[i] else None)
+            if norm_field:
+                setattr(obj, norm_field, None if np.isnan(norms[i]) else norms[i])
+            objects.append(obj)
+        yield objects
+
+
+@contextmanager
+def keep_timestamps(model):
+    """Let bulk_create store the exported created_at / updated_at instead of the import time"""
+    fields = [
+        (field, field.auto_now, field.auto_now_add) for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    for field, _, _ in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in fields:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def filter_import_chunk(source: str, objects: list, skip_existing: bool) -> Tuple[list, int, int]:
+    """
+    Drop the rows that already exist (with skip_existing) or whose parent row is missing
+    
+    Returns:
+        The rows to insert, the number of existing rows and the number of orphans dropped
+    """
+    model = apps.get_model(EXPORT_SOURCES[source][0])
+    existing = 0
+    if skip_existing:
+        present = set()
+        pks = [obj.pk for obj in objects]
+        for start in range(0, len(pks), 500):
+            present.update(model.objects.filter(pk__in=pks[start:start + 500]).values_list('pk', flat=True))
+        existing = sum(1 for obj in objects if obj.pk in present)
+        objects = [obj for obj in objects if obj.pk not in present]
+    
+    orphans = 0
+    for field in get_export_fields(source):
+        if not field.many_to_one:
+            continue
+        parent_ids = {getattr(obj, field.attname) for obj in objects} - {None}
+        parent_ids, found = list(parent_ids), set()
+        for start in range(0, len(parent_ids), 500):
+            found.update(
+                field.related_model.objects.filter(pk__in=parent_ids[start:start + 500]).values_list('pk', flat=True)
+            )
+        kept = [obj for obj in objects if getattr(obj, field.attname) is None or getattr(obj, field.attname) in found]
+        orphans += len(objects) - len(kept)
+        objects = kept
+    
+    return objects, existing, orphans
+
+
+def import_chunk(source: str, objects: list) -> int:
+    """
+    Insert one chunk in one transaction
+    
+    bulk_create sends no post_save signals, so the change log entries the
+    signals would write are recorded here for the searchable rows.
+    
+    Returns:
+        Number of rows inserted
+    """
+    model = apps.get_model(EXPORT_SOURCES[source][0])
+    _, row_filter, _, vector_field = INDEX_SOURCES[source]
+    searchable = [
+        obj.pk for obj in objects
+        if getattr(obj, vector_field) and all(getattr(obj, name) == value for name, value in row_filter.items())
+    ]
+    
+    with transaction.atomic(), keep_timestamps(model):
+        model.objects.bulk_create(objects, batch_size=1000)
+        EmbeddingChangeLog.record(source, searchable, 'upsert')
+    return len(objects)
@@ -12,6 +12,7 @@ router.register(r'results', views.FaceRecognitionResultViewSet, basename='result
 urlpatterns = [
     # Face search
     path('search/', views.FaceSearchView.as_view(), name='face_search'),
+    path('search/batch/', views.FaceBatchSearchView.as_view(), name='face_batch_search'),
     
     # Embedding management
     path('embeddings/generate/', views.generate_pet_embeddings, name='generate_embeddings'),
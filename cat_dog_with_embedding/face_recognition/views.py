@@ -1,9 +1,14 @@
 from django.shortcuts import render
 from django.db import models
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from rest_framework import status, permissions, viewsets
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
+import io
+import csv
+import json
 import time
 import numpy as np
 import logging
@@ -11,12 +16,13 @@ import logging
 from .models import FaceEmbedding, FaceRecognitionResult, EmbeddingProcessingJob
 from .serializers import (
     FaceEmbeddingSerializer, FaceRecognitionResultSerializer, 
-    FaceSearchSerializer, FaceSearchResultSerializer,
+    FaceSearchSerializer, FaceSearchResultSerializer, FaceBatchSearchSerializer,
     EmbeddingProcessingJobSerializer, EmbeddingStatusSerializer
 )
 from .services import (
-    FaceEmbeddingService, FaceMatchingService, process_search_image
+    FaceEmbeddingService, FaceMatchingService, process_search_faces, fuse_embeddings
 )
+from .model_pool import PoolTimeout
 from pets.models import Pet
 
 logger = logging.getLogger(__name__)
@@ -31,21 +37,27 @@ class FaceSearchView(APIView):
         
         if serializer.is_valid():
             start_time = time.time()
-            image_file = serializer.validated_data['image']
+            image_files = serializer.validated_data['images']
             top_k = serializer.validated_data['top_k']
             
             try:
-                # Process the search image and extract embedding
-                query_embedding = process_search_image(image_file)
+                # Detect and embed every photo of the animal in one batch
+                search_faces = [face for face in process_search_faces(image_files) if face is not None]
                 
-                if query_embedding is None:
+                if not search_faces:
                     return Response({
                         'error': 'No pet face detected in the uploaded image',
                         'message': 'Please ensure the image contains a clear view of your pet\'s face'
                     }, status=status.HTTP_400_BAD_REQUEST)
                 
-                # Find similar pets
-                matches = FaceMatchingService.find_similar_pets(query_embedding, top_k)
+                # Find similar pets of the species of the most confident detection
+                embeddings = [embedding for embedding, _ in search_faces]
+                detection = max((detection for _, detection in search_faces), key=lambda d: d['confidence'])
+                pet_type = FaceMatchingService.route_pet_type(detection)
+                matches = FaceMatchingService.find_similar_pets_fused(
+                    embeddings, top_k, pet_type, serializer.validated_data.get('fusion')
+                )
+                query_embedding = fuse_embeddings(embeddings)
                 
                 processing_time = time.time() - start_time
                 
@@ -84,6 +96,7 @@ class FaceSearchView(APIView):
                 response_data = {
                     'results': results,
                     'total_matches': len(matches),
+                    'faces_detected': len(search_faces),
                     'processing_time': processing_time,
                     'search_quality': search_quality,
                     'best_match': results[0] if results else None
@@ -92,6 +105,8 @@ class FaceSearchView(APIView):
                 serializer = FaceSearchResultSerializer(response_data)
                 return Response(serializer.data)
                 
+            except PoolTimeout:
+                raise
             except Exception as e:
                 logger.error(f"Error in face search: {e}")
                 return Response({
@@ -102,6 +117,122 @@ class FaceSearchView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class FaceBatchSearchView(APIView):
+    """
+    API view for searching many animals in one request (e.g. shelter intake)
+    
+    Images sharing a group label are fused into one query per animal. Results
+    stream back as JSON Lines (one object per group) or CSV (one row per
+    match) as each chunk of BATCH_SEARCH['BATCH_SIZE'] images finishes.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    CSV_FIELDS = ['group', 'rank', 'pet_id', 'pet_name', 'pet_type', 'similarity', 'confidence_level', 'error']
+    
+    def post(self, request):
+        serializer = FaceBatchSearchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        images = serializer.validated_data['images']
+        labels = serializer.validated_data.get('groups') or [str(i) for i in range(len(images))]
+        groups = {}
+        for label, image_file in zip(labels, images):
+            groups.setdefault(label, []).append(image_file)
+        
+        output_format = serializer.validated_data['output_format']
+        rows = stream_batch_search(list(groups.items()), serializer.validated_data['top_k'])
+        if output_format == 'csv':
+            response = StreamingHttpResponse(self.csv_lines(rows), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="batch_search.csv"'
+        else:
+            response = StreamingHttpResponse(
+                (json.dumps(row) + '\n' for row in rows), content_type='application/x-ndjson'
+            )
+        return response
+    
+    def csv_lines(self, rows):
+        """Yield CSV lines, one per match (or one per group without matches)"""
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            for match in row.get('matches') or [{}]:
+                writer.writerow({'group': row['group'], 'error': row.get('error', ''), **match})
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+
+def stream_batch_search(groups, top_k: int):
+    """
+    Search (group label, image files) pairs chunk by chunk
+    
+    Each chunk of up to BATCH_SEARCH['BATCH_SIZE'] images (a group is never
+    split) runs one batched detection and embedding pass and one batched
+    index search, and its groups are yielded before the next chunk starts.
+    
+    Yields:
+        One result dictionary per group, in request order
+    """
+    batch_size = settings.BATCH_SEARCH['BATCH_SIZE']
+    chunks, chunk, chunk_images = [], [], 0
+    for label, image_files in groups:
+        if chunk and chunk_images + len(image_files) > batch_size:
+            chunks.append(chunk)
+            chunk, chunk_images = [], 0
+        chunk.append((label, image_files))
+        chunk_images += len(image_files)
+    if chunk:
+        chunks.append(chunk)
+    
+    for chunk in chunks:
+        start_time = time.time()
+        try:
+            faces = process_search_faces([image_file for _, image_files in chunk for image_file in image_files])
+        except PoolTimeout as e:
+            logger.warning(f"Batch face search timed out waiting for a model: {e}")
+            for label, image_files in chunk:
+                yield {'group': label, 'images': len(image_files), 'error': 'Face search is busy'}
+            continue
+        
+        rows, queries, pet_types = [], [], []
+        offset = 0
+        for label, image_files in chunk:
+            group_faces = [face for face in faces[offset:offset + len(image_files)] if face is not None]
+            offset += len(image_files)
+            
+            row = {'group': label, 'images': len(image_files), 'faces': len(group_faces)}
+            rows.append(row)
+            if not group_faces:
+                row['error'] = 'No pet face detected'
+                continue
+            
+            # Route by the most confident detection of the animal
+            best_detection = max((detection for _, detection in group_faces), key=lambda d: d['confidence'])
+            row['pet_type'] = FaceMatchingService.route_pet_type(best_detection)
+            queries.append(fuse_embeddings([embedding for embedding, _ in group_faces]))
+            pet_types.append(row['pet_type'])
+        
+        all_matches = iter(FaceMatchingService.find_similar_pets_batch(queries, top_k, pet_types))
+        processing_time = (time.time() - start_time) / len(chunk)
+        for row in rows:
+            if 'error' not in row:
+                row['matches'] = [
+                    {
+                        'rank': rank,
+                        'pet_id': str(match['pet'].id),
+                        'pet_name': match['pet'].name,
+                        'pet_type': match['pet'].pet_type,
+                        'similarity': round(match['similarity'], 4),
+                        'confidence_level': match['confidence_level'],
+                    }
+                    for rank, match in enumerate(next(all_matches), 1)
+                ]
+            row['processing_time'] = processing_time
+            yield row
+
+
 class FaceEmbeddingViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for viewing face embeddings"""
     serializer_class = FaceEmbeddingSerializer
@@ -154,18 +285,23 @@ def generate_pet_embeddings(request):
             # Check if embedding already exists
             existing_embedding = pet.face_embeddings.filter(status='completed').first()
             
+            # Get pet images
+            pet_images = pet.images.filter(quality_status='good').order_by('sequence_number')
+            
             if existing_embedding and not force_regenerate:
+                # Only images added since the embedding was generated are embedded
+                version = existing_embedding.version
+                embedding_service.generate_pet_embeddings(list(pet_images), existing_embedding)
                 results.append({
                     'pet_id': pet.id,
                     'pet_name': pet.name,
-                    'status': 'already_exists',
-                    'embedding_id': existing_embedding.id
+                    'status': 'updated' if existing_embedding.version != version else 'already_exists',
+                    'embedding_id': existing_embedding.id,
+                    'images_used': existing_embedding.source_images_count,
+                    'version': existing_embedding.version
                 })
                 continue
             
-            # Get pet images
-            pet_images = pet.images.filter(quality_status='good').order_by('sequence_number')
-            
             if not pet_images.exists():
                 results.append({
                     'pet_id': pet.id,
@@ -175,8 +311,10 @@ def generate_pet_embeddings(request):
                 })
                 continue
             
-            # Generate embedding
-            face_embedding = embedding_service.generate_pet_embeddings(list(pet_images))
+            # Generate embedding (regenerated in place when forced)
+            face_embedding = embedding_service.generate_pet_embeddings(
+                list(pet_images), existing_embedding, rebuild=force_regenerate
+            )
             
             if face_embedding:
                 results.append({
@@ -184,7 +322,8 @@ def generate_pet_embeddings(request):
                     'pet_name': pet.name,
                     'status': 'success',
                     'embedding_id': face_embedding.id,
-                    'images_used': face_embedding.source_images_count
+                    'images_used': face_embedding.source_images_count,
+                    'version': face_embedding.version
                 })
             else:
                 results.append({
@@ -194,6 +333,8 @@ def generate_pet_embeddings(request):
                     'error': 'Failed to generate embedding'
                 })
         
+        except PoolTimeout:
+            raise
         except Exception as e:
             logger.error(f"Error generating embedding for pet {pet.id}: {e}")
             results.append({
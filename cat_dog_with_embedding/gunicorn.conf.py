@@ -0,0 +1,41 @@
+"""
+Gunicorn configuration for pet_face_id
+
+    gunicorn -c gunicorn.conf.py
+
+Set MODEL_PRELOAD=true to load the models once in the master process and
+share the weights copy-on-write across all workers.
+"""
+
+import os
+import multiprocessing
+
+wsgi_app = 'pet_face_id.wsgi:application'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', max(2, multiprocessing.cpu_count() // 4)))
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+# Import the application (and preload the models) before forking workers
+preload_app = os.getenv('MODEL_PRELOAD', 'False').lower() == 'true'
+
+
+def on_starting(server):
+    """Load the models in the master, once the app is imported and only when workers are forked from it"""
+    from django.conf import settings
+    
+    if server.cfg.preload_app and settings.MODEL_PRELOAD:
+        from face_recognition.preload import preload_models
+        preload_models()
+
+
+def post_fork(server, worker):
+    """Start torch thread pools only now that we are in the worker"""
+    from face_recognition.preload import after_fork
+    after_fork()
+
+
+def post_worker_init(worker):
+    """Startup check: report how much of the worker's memory is shared"""
+    from face_recognition.preload import log_memory_report
+    log_memory_report(f"worker {worker.pid}")
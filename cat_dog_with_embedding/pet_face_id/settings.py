@@ -177,6 +177,7 @@ REST_FRAMEWORK = {
     ],
     'PAGE_SIZE': 20,
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'EXCEPTION_HANDLER': 'face_recognition.exceptions.exception_handler',
 }
 
 # JWT Configuration
@@ -225,6 +226,121 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 YOLO_MODEL_PATH = os.getenv('YOLO_MODEL_PATH', str('/Users/manzoorhussain/Downloads/last (1).pt'))
 FACE_EMBEDDING_MODEL = 'sentence-transformers/clip-ViT-B-32'
 
+# Input size of the embedding model; face crops smaller than this at the
+# reduced detection scale are re-cut from a full-resolution decode
+FACE_EMBEDDING_INPUT_SIZE = 224
+
+# YOLO input size (long side, in pixels) per endpoint. Uploads are decoded
+# at the smallest JPEG scale (1/2, 1/4, 1/8) that still covers this size.
+YOLO_DETECTION_IMGSZ = {
+    'default': int(os.getenv('YOLO_IMGSZ', '640')),
+    'registration': int(os.getenv('YOLO_REGISTRATION_IMGSZ', '640')),
+    'search': int(os.getenv('YOLO_SEARCH_IMGSZ', '480')),
+}
+
+# Two-tier detector cascade: the small model runs first and its result is
+# kept when the best face confidence reaches ACCEPT_CONFIDENCE, otherwise the
+# image is re-run through YOLO_MODEL_PATH. Enabled per endpoint, e.g.
+# YOLO_CASCADE_ENDPOINTS=registration,search
+YOLO_CASCADE = {
+    'SMALL_MODEL_PATH': os.getenv('YOLO_SMALL_MODEL_PATH', ''),
+    'ACCEPT_CONFIDENCE': float(os.getenv('YOLO_CASCADE_ACCEPT_CONFIDENCE', '0.80')),
+    'ENDPOINTS': [e for e in os.getenv('YOLO_CASCADE_ENDPOINTS', '').split(',') if e],
+    'LOG_EVERY': 100,  # Log tier hit rates and latency every N detections
+}
+
+# CPU inference runtime, applied once per process when a model is loaded.
+# TORCH_THREADS=0 splits the cores evenly across WEB_CONCURRENCY workers so
+# torch, OpenCV and gunicorn do not oversubscribe the same cores.
+INFERENCE_RUNTIME = {
+    'TORCH_THREADS': int(os.getenv('TORCH_NUM_THREADS', '0')),
+    'TORCH_INTEROP_THREADS': int(os.getenv('TORCH_INTEROP_THREADS', '1')),
+    'CV2_THREADS': int(os.getenv('CV2_NUM_THREADS', '1')),
+    'CHANNELS_LAST': os.getenv('TORCH_CHANNELS_LAST', 'True').lower() == 'true',
+}
+
+# Model replica pools shared by all requests of a worker process. Each replica
+# serves one request thread at a time; size them to the threads per worker
+# (gthread/ASGI), independently of the number of worker processes.
+MODEL_POOL = {
+    'DETECTOR_REPLICAS': int(os.getenv('DETECTOR_REPLICAS', '1')),
+    'EMBEDDER_REPLICAS': int(os.getenv('EMBEDDER_REPLICAS', '1')),
+    'WAIT_TIMEOUT': float(os.getenv('MODEL_POOL_WAIT_TIMEOUT', '30')),  # Seconds
+    'RETRY_AFTER': int(os.getenv('MODEL_POOL_RETRY_AFTER', '5')),  # Seconds clients are told to wait on a 503
+    'LOG_EVERY': 100,  # Log wait time and utilization every N checkouts
+}
+
+# Load and freeze all model replicas in the gunicorn master before forking
+# (gunicorn.conf.py sets preload_app from the same variable and preloads in
+# its on_starting hook), so workers share the weights copy-on-write
+MODEL_PRELOAD = os.getenv('MODEL_PRELOAD', 'False').lower() == 'true'
+
+# In-memory embedding indexes, kept in sync across workers through the
+# EmbeddingChangeLog table
+EMBEDDING_INDEX = {
+    'POLL_INTERVAL': float(os.getenv('EMBEDDING_INDEX_POLL_INTERVAL', '2.0')),  # Max staleness in seconds
+    'MAX_CHANGES': 10000,  # Reload from scratch when further behind than this
+    'COMPACT_RATIO': 0.2,  # Compact when this fraction of rows is tombstoned
+    'SETTLE_SECONDS': 5,  # Re-read log entries until they are this old (late commits)
+    'CHANGELOG_RETENTION_HOURS': int(os.getenv('EMBEDDING_CHANGELOG_RETENTION_HOURS', '24')),
+    'BACKEND': os.getenv('EMBEDDING_INDEX_BACKEND', 'exact'),  # 'exact' or 'hnsw'
+    # Scan int8 ('sq8') or product-quantized ('pq') codes instead of float
+    # vectors; codebooks are trained by `manage.py train_quantizers`. Only with
+    # a snapshot are the codes memory-mapped (written next to the codebook)
+    # and the float vectors left on disk; loaded from the database both stay
+    # resident in every worker
+    'QUANTIZATION': os.getenv('EMBEDDING_INDEX_QUANTIZATION', 'none'),
+    'RERANK_FACTOR': 10,  # Candidates re-scored with float vectors per requested result
+    # Rows read per query by the streaming database scan used while an index is not loaded
+    'SCAN_CHUNK_SIZE': int(os.getenv('EMBEDDING_INDEX_SCAN_CHUNK_SIZE', '2000')),
+}
+
+# HNSW graph parameters for the 'hnsw' index backend (graphs are built by
+# `manage.py build_hnsw_index` into EMBEDDING_SNAPSHOT_DIR)
+HNSW_INDEX = {
+    'M': int(os.getenv('HNSW_M', '16')),  # Links per node (2 * M on the bottom layer)
+    'EF_CONSTRUCTION': int(os.getenv('HNSW_EF_CONSTRUCTION', '200')),
+    'EF_SEARCH': int(os.getenv('HNSW_EF_SEARCH', '64')),  # Higher is slower but more accurate
+}
+
+# Memory-mapped embedding snapshots shared by all workers on a node, written
+# by `manage.py build_embedding_snapshot`
+EMBEDDING_SNAPSHOT_DIR = os.getenv('EMBEDDING_SNAPSHOT_DIR', str(BASE_DIR / 'snapshots'))
+
+# IVF partitioning of simple-face-id vectors (centroids trained by
+# `manage.py train_ivf`), used by processes whose in-memory index is not
+# loaded yet
+IVF_INDEX = {
+    'NPROBE': int(os.getenv('IVF_NPROBE', '8')),  # Clusters scanned per query
+    'ACTIVE_RUN_TTL': 60,  # Seconds between checks for a newly activated run
+}
+
+# Project-level simple-face-id search: project centroids shortlist
+# SHORTLIST projects, then their face vectors are scored and reduced to one
+# score per project ('max', or 'top_m_mean' of the best TOP_M vectors)
+PROJECT_SEARCH = {
+    'SHORTLIST': int(os.getenv('PROJECT_SEARCH_SHORTLIST', '50')),
+    'AGGREGATION': os.getenv('PROJECT_SEARCH_AGGREGATION', 'top_m_mean'),
+    'TOP_M': 3,
+    'TOP_K': 5,  # Projects returned per search
+}
+
+# 1:1 verification of a photo against the project encoded in a QR code
+FACE_VERIFICATION = {
+    'THRESHOLD': float(os.getenv('FACE_VERIFICATION_THRESHOLD', '0.80')),  # Minimum similarity to pass
+    'CACHE_SIZE': 1024,  # Projects whose vectors are cached per worker
+}
+
+# Sign-bit sketches of every indexed embedding (random rotation, one bit per
+# rotated coordinate), used to shortlist threshold searches such as QR search
+# by Hamming distance before scoring the float vectors
+SIGN_SKETCH = {
+    'BITS': 512,  # Multiple of 64
+    'SEED': 0,  # Seed of the shared rotation; rebuild snapshots after changing it
+    'Z_SCORE': 3.0,  # Hamming slack in standard deviations; higher misses fewer matches
+    'MAX_SHORTLIST': 1000,  # Candidates exactly scored per query
+}
+
 # Face Recognition Settings
 FACE_SIMILARITY_THRESHOLD = {
     'EAGLE_TRAIL': 0.90,  # Above 90%
@@ -232,9 +348,82 @@ FACE_SIMILARITY_THRESHOLD = {
     'NO_MATCH': 0.80      # Below 80%
 }
 
+# Pet searches shortlist this many pets by their averaged embedding, then
+# re-rank them by their most similar per-image exemplar
+EXEMPLAR_SEARCH = {
+    'SHORTLIST': int(os.getenv('EXEMPLAR_SEARCH_SHORTLIST', '20')),
+}
+
+# Searches only compare against pets of the species YOLO detected (cat_face /
+# dog_face) when the detection is at least this confident, otherwise they
+# fall back to searching every species
+PET_TYPE_ROUTING = {
+    'MIN_CONFIDENCE': float(os.getenv('PET_TYPE_ROUTING_MIN_CONFIDENCE', '0.6')),
+}
+
+# Searches may upload up to MAX_IMAGES photos of one animal, detected and
+# embedded in one batch. 'mean' searches once with the mean of the normalized
+# embeddings; 'max' scores each pet by its most similar photo
+QUERY_FUSION = {
+    'MAX_IMAGES': int(os.getenv('QUERY_FUSION_MAX_IMAGES', '5')),
+    'METHOD': os.getenv('QUERY_FUSION_METHOD', 'mean'),
+}
+
+# Batch search (/api/face-recognition/search/batch/): groups are processed in
+# chunks of up to BATCH_SIZE images, one detector and one embedder forward
+# pass per chunk, and each chunk's results are streamed as soon as it is done
+BATCH_SEARCH = {
+    'MAX_IMAGES': int(os.getenv('BATCH_SEARCH_MAX_IMAGES', '100')),
+    'BATCH_SIZE': int(os.getenv('BATCH_SEARCH_BATCH_SIZE', '16')),
+}
+
+# Nightly all-pairs duplicate registration scan (manage.py find_duplicate_registrations):
+# the normalized embedding matrix is compared with itself in TILE_SIZE x
+# TILE_SIZE blocks by WORKERS processes (0 = one per CPU), keeping only the
+# pairs at or above THRESHOLD
+DUPLICATE_SCAN = {
+    'THRESHOLD': float(os.getenv('DUPLICATE_SCAN_THRESHOLD', '0.92')),
+    'TILE_SIZE': int(os.getenv('DUPLICATE_SCAN_TILE_SIZE', '4096')),
+    'WORKERS': int(os.getenv('DUPLICATE_SCAN_WORKERS', '0')),
+}
+
+# Embedding model upgrades (manage.py reembed_faces): every stored face is
+# re-embedded with the new model in batches of BATCH_SIZE by WORKERS processes
+# (0 = one per CPU) into shadow rows, then swapped in at once on activation.
+# Each process re-reads the active model at most every ACTIVE_MODEL_TTL seconds
+REEMBEDDING = {
+    'BATCH_SIZE': int(os.getenv('REEMBEDDING_BATCH_SIZE', '64')),
+    'WORKERS': int(os.getenv('REEMBEDDING_WORKERS', '0')),
+    'ACTIVE_MODEL_TTL': float(os.getenv('REEMBEDDING_ACTIVE_MODEL_TTL', '5')),
+}
+
+# Offline bulk registration (manage.py ingest_faces): WORKERS processes (0 =
+# one per CPU) each take CHUNK_SIZE animals at a time and run their images
+# through the detector and embedder BATCH_SIZE at a time; results are written
+# COMMIT_SIZE animals per transaction
+INGEST = {
+    'WORKERS': int(os.getenv('INGEST_WORKERS', '0')),
+    'CHUNK_SIZE': int(os.getenv('INGEST_CHUNK_SIZE', '8')),
+    'BATCH_SIZE': int(os.getenv('INGEST_BATCH_SIZE', '32')),
+    'COMMIT_SIZE': int(os.getenv('INGEST_COMMIT_SIZE', '500')),
+}
+
+# Bulk export / import of the embeddings (manage.py export_embeddings /
+# import_embeddings): rows are streamed CHUNK_SIZE at a time into a chunked
+# .npz archive, and imported one chunk per transaction
+EMBEDDING_TRANSFER = {
+    'CHUNK_SIZE': int(os.getenv('EMBEDDING_TRANSFER_CHUNK_SIZE', '50000')),
+}
+
 # QR Code Settings
 QR_CODE_EXPIRE_MINUTES = 30
 
+# QR searches without a match keep their query embedding this long; every
+# pet embedding or face vector registered meanwhile is scored against them
+STANDING_QUERIES = {
+    'TTL_DAYS': int(os.getenv('STANDING_QUERY_TTL_DAYS', '90')),
+}
+
 # Celery Configuration (for background tasks)
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
@@ -14,6 +14,7 @@ from .serializers import (
     StartFaceIDSerializer, CompleteFaceIDSerializer
 )
 from face_recognition.services import YOLODetectionService, FaceEmbeddingService
+from face_recognition.model_pool import PoolTimeout
 
 logger = logging.getLogger(__name__)
 
@@ -181,8 +182,9 @@ class PetImageUploadView(APIView):
                     }, status=status.HTTP_400_BAD_REQUEST)
                 
                 # Process each image
-                yolo_service = YOLODetectionService()
+                yolo_service = YOLODetectionService(endpoint='registration')
                 processed_images = []
+                pet_images = []
                 
                 for i, image in enumerate(images):
                     pet_image = PetImage.objects.create(
@@ -191,6 +193,7 @@ class PetImageUploadView(APIView):
                         image=image,
                         sequence_number=session.actual_images_count + i + 1
                     )
+                    pet_images.append(pet_image)
                     
                     # Process image with YOLO
                     try:
@@ -220,6 +223,12 @@ class PetImageUploadView(APIView):
                         
                         pet_image.save()
                         
+                    except PoolTimeout:
+                        # Drop this upload's images so the client can simply retry it
+                        for uploaded_image in pet_images:
+                            uploaded_image.image.delete(save=False)
+                            uploaded_image.delete()
+                        raise
                     except Exception as e:
                         logger.error(f"Error processing image {pet_image.id}: {e}")
                         pet_image.quality_status = 'rejected'
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class QrSearchConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'qr_search'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
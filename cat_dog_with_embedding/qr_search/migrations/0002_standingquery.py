@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pets', '0001_initial'),
+        ('qr_search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StandingQuery',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('pet_type', models.CharField(blank=True, max_length=10, null=True)),
+                ('vector', models.BinaryField()),
+                ('vector_dimension', models.IntegerField()),
+                ('status', models.CharField(choices=[('active', 'Active'), ('closed', 'Closed')], default='active', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standing_queries', to='qr_search.qrsearchsession')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StandingQueryMatch',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('source', models.CharField(choices=[('face_embedding', 'Face Embedding'), ('face_vector', 'Face Vector')], max_length=20)),
+                ('object_id', models.CharField(max_length=64)),
+                ('similarity_score', models.FloatField()),
+                ('confidence_level', models.CharField(max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('matched_pet', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='standing_query_matches', to='pets.pet')),
+                ('standing_query', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='qr_search.standingquery')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'unique_together': {('standing_query', 'source', 'object_id')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='standingquery',
+            index=models.Index(fields=['status', 'expires_at'], name='qr_search_s_status_0a9d0c_idx'),
+        ),
+    ]
@@ -1,10 +1,13 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+import numpy as np
 import uuid
 import secrets
 import string
 
+from face_recognition.similarity import normalize
+
 User = get_user_model()
 
 
@@ -178,6 +181,75 @@ class QRSearchImage(models.Model):
         return f"QR Search Image for session {self.session.session_token}"
 
 
+class StandingQuery(models.Model):
+    """
+    Query embedding of a QR search that found no match
+    
+    Kept until it expires and scored against every face embedding or face
+    vector registered afterwards (see standing_queries.py).
+    """
+    QUERY_STATUS = [
+        ('active', 'Active'),
+        ('closed', 'Closed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    session = models.ForeignKey(QRSearchSession, on_delete=models.CASCADE, related_name='standing_queries')
+    pet_type = models.CharField(max_length=10, blank=True, null=True)  # Routed pet type, None matches any
+    vector = models.BinaryField()  # L2-normalized float32
+    vector_dimension = models.IntegerField()
+    status = models.CharField(max_length=20, choices=QUERY_STATUS, default='active')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'expires_at'])]
+    
+    def __str__(self):
+        return f"Standing query for session {self.session_id} - {self.status}"
+    
+    def set_vector(self, vector):
+        """Store a query embedding, L2-normalized"""
+        vector, _ = normalize(vector)
+        self.vector = vector.tobytes()
+        self.vector_dimension = len(vector)
+    
+    def get_vector(self):
+        """Get the query embedding as a float32 numpy array"""
+        return np.frombuffer(bytes(self.vector), dtype=np.float32)
+
+
+class StandingQueryMatch(models.Model):
+    """A registration that reached the match threshold of a standing query"""
+    SOURCES = [
+        ('face_embedding', 'Face Embedding'),
+        ('face_vector', 'Face Vector'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    standing_query = models.ForeignKey(StandingQuery, on_delete=models.CASCADE, related_name='matches')
+    source = models.CharField(max_length=20, choices=SOURCES)
+    object_id = models.CharField(max_length=64)  # FaceEmbedding or FaceVector pk
+    matched_pet = models.ForeignKey(
+        'pets.Pet',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='standing_query_matches'
+    )
+    similarity_score = models.FloatField()
+    confidence_level = models.CharField(max_length=20)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        unique_together = ['standing_query', 'source', 'object_id']
+    
+    def __str__(self):
+        return f"{self.source} {self.object_id} matched standing query {self.standing_query_id} ({self.similarity_score:.3f})"
+
+
 class ClinicInfo(models.Model):
     """Store information about clinics that use the QR system"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
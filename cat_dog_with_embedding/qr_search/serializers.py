@@ -1,8 +1,8 @@
 from rest_framework import serializers
 from django.utils import timezone
 from datetime import timedelta
-from .models import QRCode, QRSearchSession, QRSearchImage, ClinicInfo, SearchAnalytics
-from face_recognition.serializers import FaceRecognitionResultSerializer
+from .models import QRCode, QRSearchSession, QRSearchImage, ClinicInfo, SearchAnalytics, StandingQueryMatch
+from face_recognition.serializers import FaceRecognitionResultSerializer, MultiImageSearchSerializer
 
 
 class QRCodeSerializer(serializers.ModelSerializer):
@@ -71,6 +71,21 @@ class QRSearchSessionSerializer(serializers.ModelSerializer):
         ]
 
 
+class StandingQueryMatchSerializer(serializers.ModelSerializer):
+    """Serializer for registrations that matched an unresolved search"""
+    session_id = serializers.UUIDField(source='standing_query.session_id', read_only=True)
+    pet_name = serializers.CharField(source='matched_pet.name', read_only=True, default=None)
+    pet_type = serializers.CharField(source='matched_pet.pet_type', read_only=True, default=None)
+    
+    class Meta:
+        model = StandingQueryMatch
+        fields = [
+            'id', 'session_id', 'source', 'object_id', 'matched_pet', 'pet_name',
+            'pet_type', 'similarity_score', 'confidence_level', 'created_at'
+        ]
+        read_only_fields = fields
+
+
 class QRSearchImageSerializer(serializers.ModelSerializer):
     """Serializer for QR search images"""
     class Meta:
@@ -146,10 +161,9 @@ class ScanQRCodeSerializer(serializers.Serializer):
             raise serializers.ValidationError("Invalid QR code")
 
 
-class QRSearchRequestSerializer(serializers.Serializer):
+class QRSearchRequestSerializer(MultiImageSearchSerializer):
     """Serializer for QR search image upload"""
     session_token = serializers.CharField(max_length=100)
-    image = serializers.ImageField()
     
     def validate_session_token(self, value):
         try:
@@ -164,19 +178,6 @@ class QRSearchRequestSerializer(serializers.Serializer):
             return value
         except QRSearchSession.DoesNotExist:
             raise serializers.ValidationError("Invalid session token")
-    
-    def validate_image(self, value):
-        """Validate uploaded image"""
-        # Check file size (max 10MB)
-        if value.size > 10 * 1024 * 1024:
-            raise serializers.ValidationError("Image file too large. Maximum size is 10MB.")
-        
-        # Check file format
-        allowed_formats = ['jpeg', 'jpg', 'png']
-        if not any(value.name.lower().endswith(f'.{fmt}') for fmt in allowed_formats):
-            raise serializers.ValidationError("Invalid image format. Use JPEG or PNG.")
-        
-        return value
 
 
 class QRSearchResultSerializer(serializers.Serializer):
@@ -0,0 +1,43 @@
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from face_recognition.models import FaceEmbedding, ReembeddingJob
+from face_recognition.signals import embedding_model_activated
+from .models import StandingQuery
+from .standing_queries import match_registrations
+
+logger = logging.getLogger(__name__)
+
+
+def schedule_match(source: str, object_id):
+    """Score a registration against the standing queries once its transaction commits"""
+    def run():
+        try:
+            match_registrations(source, [object_id])
+        except Exception as e:
+            logger.error(f"Error matching {source} {object_id} against standing queries: {e}")
+    
+    transaction.on_commit(run)
+
+
+@receiver(post_save, sender=FaceEmbedding)
+def match_face_embedding(sender, instance, **kwargs):
+    """Check a completed pet embedding against unresolved searches"""
+    if instance.status == 'completed' and instance.pet_id is not None:
+        schedule_match('face_embedding', instance.pk)
+
+
+@receiver(post_save, sender='simple_face_id.FaceVector')
+def match_face_vector(sender, instance, created, **kwargs):
+    """Check a new face vector against unresolved searches"""
+    if created:
+        schedule_match('face_vector', instance.pk)
+
+
+@receiver(embedding_model_activated, sender=ReembeddingJob)
+def close_standing_queries(sender, job, **kwargs):
+    """Standing query vectors come from the old model and cannot match new registrations"""
+    StandingQuery.objects.filter(status='active').update(status='closed')
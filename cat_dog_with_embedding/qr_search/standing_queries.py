@@ -0,0 +1,149 @@
+import logging
+import threading
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from face_recognition.index import INDEX_SOURCES
+from face_recognition.similarity import similarities
+from face_recognition.models import FaceRecognitionResult
+from face_recognition.snapshot import PET_TYPE_CODES
+from .models import QRSearchSession, StandingQuery, StandingQueryMatch
+
+logger = logging.getLogger(__name__)
+
+
+# Field holding the matched pet of each registration source, if it has one
+MATCHED_PET_FIELDS = {
+    'face_embedding': 'pet_id',
+    'face_vector': None,
+}
+
+
+def create_standing_query(session: QRSearchSession, query_embedding: np.ndarray,
+                          pet_type: Optional[str] = None) -> StandingQuery:
+    """
+    Keep the query embedding of an unresolved search for STANDING_QUERIES['TTL_DAYS']
+    
+    Args:
+        session: QR search session that found no match
+        query_embedding: Query face embedding vector
+        pet_type: Pet type the search was routed to, None for any
+        
+    Returns:
+        The created StandingQuery
+    """
+    standing_query = StandingQuery(
+        session=session,
+        pet_type=pet_type,
+        expires_at=timezone.now() + timedelta(days=settings.STANDING_QUERIES['TTL_DAYS'])
+    )
+    standing_query.set_vector(query_embedding)
+    standing_query.save()
+    return standing_query
+
+
+_standing_queries = None
+_standing_queries_lock = threading.Lock()
+
+
+def get_standing_queries() -> Dict[int, Tuple[List[str], np.ndarray, np.ndarray]]:
+    """
+    Get the active standing queries as one matrix per vector dimension
+    
+    Cached until a query is added, closed or expires, so scoring a
+    registration does not re-read every query.
+    
+    Returns:
+        {dimension: (StandingQuery pks, (n, dimension) vectors, (n,) pet type codes)}
+    """
+    global _standing_queries
+    
+    active = StandingQuery.objects.filter(status='active', expires_at__gt=timezone.now())
+    version = active.aggregate(count=Count('pk'), latest=Max('created_at'))
+    version = (version['count'], version['latest'])
+    
+    with _standing_queries_lock:
+        if _standing_queries is not None and _standing_queries[0] == version:
+            return _standing_queries[1]
+    
+    rows: Dict[int, list] = {}
+    for query_id, vector, dimension, pet_type in active.values_list('pk', 'vector', 'vector_dimension', 'pet_type'):
+        rows.setdefault(dimension, []).append((str(query_id), vector, PET_TYPE_CODES.get(pet_type, 0)))
+    
+    queries = {
+        dimension: (
+            [query_id for query_id, _, _ in group],
+            np.vstack([np.frombuffer(bytes(vector), dtype=np.float32) for _, vector, _ in group]),
+            np.array([code for _, _, code in group], dtype=np.uint8),
+        )
+        for dimension, group in rows.items()
+    }
+    
+    with _standing_queries_lock:
+        _standing_queries = (version, queries)
+    return queries
+
+
+def match_registrations(source: str, object_ids: List[str]) -> List[StandingQueryMatch]:
+    """
+    Score newly completed registrations against every active standing query
+    
+    All queries of a dimension are scored against all the registrations in
+    one matrix product, so the cost grows with the number of new
+    registrations rather than with the search history. Pairs reaching the
+    lobo_trail threshold are recorded as StandingQueryMatch rows.
+    
+    Args:
+        source: 'face_embedding' or 'face_vector'
+        object_ids: Primary keys of the registered rows
+        
+    Returns:
+        The new matches
+    """
+    queries = get_standing_queries()
+    if not queries:
+        return []
+    
+    model_label, row_filter, pet_type_field, vector_field = INDEX_SOURCES[source]
+    pet_field = MATCHED_PET_FIELDS[source]
+    fields = ['pk', vector_field, pet_type_field] + ([pet_field] if pet_field else [])
+    registrations = [
+        (str(row[0]), row[1], PET_TYPE_CODES.get(row[2], 0), row[3] if pet_field else None)
+        for row in apps.get_model(model_label).objects.filter(pk__in=object_ids, **row_filter).values_list(*fields)
+        if row[1]
+    ]
+    
+    threshold = settings.FACE_SIMILARITY_THRESHOLD['LOBO_TRAIL']
+    matches = []
+    for dimension, (query_ids, vectors, query_codes) in queries.items():
+        selected = [registration for registration in registrations if len(registration[1]) == dimension]
+        if not selected:
+            continue
+        
+        scores = similarities(vectors, [vector for _, vector, _, _ in selected])
+        codes = np.array([code for _, _, code, _ in selected], dtype=np.uint8)
+        # Queries and registrations of unknown pet type are compatible with every type
+        compatible = (query_codes[:, None] == 0) | (codes[None, :] == 0) | (query_codes[:, None] == codes[None, :])
+        
+        for query_row, registration_row in np.argwhere((scores >= threshold) & compatible):
+            object_id, _, _, pet_id = selected[registration_row]
+            similarity = min(1.0, float(scores[query_row, registration_row]))
+            matches.append(StandingQueryMatch(
+                standing_query_id=query_ids[query_row],
+                source=source,
+                object_id=object_id,
+                matched_pet_id=pet_id,
+                similarity_score=similarity,
+                confidence_level=FaceRecognitionResult.determine_confidence_level(similarity)
+            ))
+    
+    if matches:
+        StandingQueryMatch.objects.bulk_create(matches, ignore_conflicts=True)
+        logger.info(f"{len(matches)} standing queries matched new {source} registrations")
+    return matches
@@ -17,6 +17,7 @@ urlpatterns = [
     path('scan/', views.QRScanView.as_view(), name='qr_scan'),
     path('search/', views.QRSearchView.as_view(), name='qr_search'),
     path('session/<str:session_token>/', views.qr_session_status, name='session_status'),
+    path('standing-matches/', views.standing_query_matches, name='standing_matches'),
     
     # Clinic management
     path('', include(router.urls)),
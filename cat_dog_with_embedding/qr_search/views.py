@@ -10,14 +10,16 @@ import base64
 import time
 import logging
 
-from .models import QRCode, QRSearchSession, QRSearchImage, ClinicInfo
+from .models import QRCode, QRSearchSession, QRSearchImage, ClinicInfo, StandingQueryMatch
 from .serializers import (
     QRCodeSerializer, CreateQRCodeSerializer, QRSearchSessionSerializer,
     QRSearchImageSerializer, ScanQRCodeSerializer, QRSearchRequestSerializer,
-    QRSearchResultSerializer, ClinicInfoSerializer
+    QRSearchResultSerializer, ClinicInfoSerializer, StandingQueryMatchSerializer
 )
-from face_recognition.services import process_search_image, FaceMatchingService
+from .standing_queries import create_standing_query
+from face_recognition.services import process_search_faces, fuse_embeddings, FaceMatchingService
 from face_recognition.models import FaceEmbedding, FaceRecognitionResult
+from face_recognition.model_pool import PoolTimeout
 
 logger = logging.getLogger(__name__)
 
@@ -158,7 +160,7 @@ class QRSearchView(APIView):
         
         if serializer.is_valid():
             session_token = serializer.validated_data['session_token']
-            image_file = serializer.validated_data['image']
+            image_files = serializer.validated_data['images']
             
             try:
                 session = QRSearchSession.objects.get(session_token=session_token)
@@ -171,26 +173,38 @@ class QRSearchView(APIView):
                     }, status=status.HTTP_400_BAD_REQUEST)
                 
                 # Update session status
+                previous_status = session.status
                 session.status = 'processing'
                 session.save()
                 
                 start_time = time.time()
                 
-                # Create search image record
-                search_image = QRSearchImage.objects.create(
-                    session=session,
-                    image=image_file
-                )
+                # Create search image records
+                search_images = [
+                    QRSearchImage.objects.create(session=session, image=image_file)
+                    for image_file in image_files
+                ]
                 
                 try:
-                    # Process the search image
-                    query_embedding = process_search_image(image_file)
+                    # Detect and embed every photo of the animal in one batch
+                    search_faces = process_search_faces(image_files)
+                    processing_time = time.time() - start_time
                     
-                    if query_embedding is None:
-                        search_image.status = 'failed'
-                        search_image.error_message = 'No pet face detected'
+                    for search_image, search_face in zip(search_images, search_faces):
+                        if search_face is None:
+                            search_image.status = 'failed'
+                            search_image.error_message = 'No pet face detected'
+                        else:
+                            search_image.status = 'completed'
+                            search_image.face_detected = True
+                            search_image.detected_pet_type = search_face[1]['class'].replace('_face', '')
+                            search_image.detection_confidence = search_face[1]['confidence']
+                            search_image.face_bounding_box = search_face[1]['bounding_box']
+                        search_image.processing_time = processing_time
                         search_image.save()
-                        
+                    
+                    search_faces = [search_face for search_face in search_faces if search_face is not None]
+                    if not search_faces:
                         session.status = 'failed'
                         session.save()
                         
@@ -200,16 +214,16 @@ class QRSearchView(APIView):
                             'session_id': session.id
                         }, status=status.HTTP_400_BAD_REQUEST)
                     
-                    # Find similar pets
-                    matches = FaceMatchingService.find_similar_pets(query_embedding, top_k=5)
+                    # Only pets of the detected species reaching the lobo_trail threshold count as a match
+                    embeddings = [embedding for embedding, _ in search_faces]
+                    detection = max((detection for _, detection in search_faces), key=lambda d: d['confidence'])
+                    pet_type = FaceMatchingService.route_pet_type(detection)
+                    matches = FaceMatchingService.find_matching_pets_fused(
+                        embeddings, top_k=5, pet_type=pet_type, fusion=serializer.validated_data.get('fusion')
+                    )
+                    query_embedding = fuse_embeddings(embeddings)
                     processing_time = time.time() - start_time
                     
-                    # Update search image
-                    search_image.status = 'completed'
-                    search_image.face_detected = True
-                    search_image.processing_time = processing_time
-                    search_image.save()
-                    
                     # Create recognition result if match found
                     search_result = None
                     if matches:
@@ -237,6 +251,9 @@ class QRSearchView(APIView):
                         
                         # Link to session
                         session.search_result = search_result
+                    else:
+                        # Keep the query so pets registered later are checked against it
+                        create_standing_query(session, query_embedding, pet_type)
                     
                     # Mark QR code as used
                     session.qr_code.mark_as_used()
@@ -265,12 +282,22 @@ class QRSearchView(APIView):
                     serializer = QRSearchResultSerializer(response_data)
                     return Response(serializer.data)
                     
+                except PoolTimeout:
+                    # Leave the session as it was so the same upload can be retried
+                    for search_image in search_images:
+                        search_image.image.delete(save=False)
+                        search_image.delete()
+                    session.status = previous_status
+                    session.save()
+                    raise
                 except Exception as e:
                     logger.error(f"Error in QR search processing: {e}")
                     
-                    search_image.status = 'failed'
-                    search_image.error_message = str(e)
-                    search_image.save()
+                    for search_image in search_images:
+                        if search_image.status != 'completed':
+                            search_image.status = 'failed'
+                            search_image.error_message = str(e)
+                            search_image.save()
                     
                     session.status = 'failed'
                     session.save()
@@ -354,9 +381,27 @@ def qr_session_status(request, session_token):
         response_data = serializer.data
         response_data['is_expired'] = session.is_expired()
         
+        # Pets registered after an unresolved search that match it
+        late_matches = StandingQueryMatch.objects.filter(
+            standing_query__session=session
+        ).select_related('standing_query', 'matched_pet')
+        response_data['late_matches'] = StandingQueryMatchSerializer(late_matches, many=True).data
+        
         return Response(response_data)
         
     except QRSearchSession.DoesNotExist:
         return Response({
             'error': 'Session not found'
         }, status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def standing_query_matches(request):
+    """Get pets registered after an unresolved search through one of the user's QR codes that match it"""
+    matches = StandingQueryMatch.objects.filter(
+        standing_query__session__qr_code__created_by=request.user
+    ).select_related('standing_query', 'matched_pet')[:100]
+    
+    serializer = StandingQueryMatchSerializer(matches, many=True)
+    return Response(serializer.data)
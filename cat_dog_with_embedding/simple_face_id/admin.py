@@ -1,12 +1,12 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import FaceProject, FaceVector, SimilaritySearch
+from .models import FaceProject, FaceVector, SimilaritySearch, ClusteringRun
 
 
 @admin.register(FaceProject)
 class FaceProjectAdmin(admin.ModelAdmin):
-    list_display = ['project_id', 'name', 'input_id', 'status', 'faces_detected', 'created_at']
-    list_filter = ['status', 'created_at']
+    list_display = ['project_id', 'name', 'input_id', 'species', 'status', 'faces_detected', 'created_at']
+    list_filter = ['status', 'species', 'created_at']
     search_fields = ['project_id', 'name', 'input_id']
     readonly_fields = ['project_id', 'created_at', 'updated_at', 'qr_code_image']
     
@@ -22,10 +22,10 @@ class FaceProjectAdmin(admin.ModelAdmin):
 
 @admin.register(FaceVector)
 class FaceVectorAdmin(admin.ModelAdmin):
-    list_display = ['project', 'original_image_name', 'confidence_score', 'vector_dimension', 'created_at']
+    list_display = ['project', 'original_image_name', 'confidence_score', 'vector_dimension', 'cluster_id', 'created_at']
     list_filter = ['created_at', 'confidence_score']
     search_fields = ['project__project_id', 'project__name', 'original_image_name']
-    readonly_fields = ['id', 'created_at', 'embedding_vector', 'vector_dimension']
+    readonly_fields = ['id', 'created_at', 'embedding_vector', 'vector_dimension', 'cluster_run', 'cluster_id']
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('project')
@@ -39,4 +39,13 @@ class SimilaritySearchAdmin(admin.ModelAdmin):
     readonly_fields = ['id', 'search_timestamp']
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('best_match_project', 'best_match_vector') 
\ No newline at end of file
+        return super().get_queryset(request).select_related('best_match_project', 'best_match_vector')
+
+
+@admin.register(ClusteringRun)
+class ClusteringRunAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'n_clusters', 'training_vectors', 'assigned_vectors', 'created_at', 'completed_at']
+    list_filter = ['status', 'created_at']
+    readonly_fields = ['n_clusters', 'vector_dimension', 'training_vectors', 'assigned_vectors', 'cursor',
+                       'created_at', 'completed_at']
+    exclude = ['centroids']
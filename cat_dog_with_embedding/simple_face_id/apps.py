@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class SimpleFaceIdConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'simple_face_id' 
\ No newline at end of file
+    name = 'simple_face_id'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,210 @@
+import csv
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from face_recognition.models import EmbeddingChangeLog
+from face_recognition.runtime import apply_runtime_profile
+from face_recognition.services import YOLODetectionService, FaceEmbeddingService, FaceMatchingService
+from qr_search.standing_queries import match_registrations
+from .ivf import assign_clusters, get_active_run
+from .models import FaceProject, FaceVector
+from .services import SimpleFaceIdService
+
+logger = logging.getLogger(__name__)
+
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+
+def read_manifest(source: str) -> List[Dict[str, Any]]:
+    """
+    Read the animals to register from a directory or a CSV manifest
+    
+    A directory holds one subdirectory of images per animal, named
+    `<id>_<name>` (or just `<id>`). A manifest has the columns name, id and
+    one or more image paths (relative to the manifest); rows with the same
+    id are merged.
+    
+    Args:
+        source: Directory or CSV file
+        
+    Returns:
+        List of {'name', 'input_id', 'images'} in source order
+    """
+    source = Path(source)
+    
+    if source.is_dir():
+        records = []
+        for folder in sorted(path for path in source.iterdir() if path.is_dir()):
+            input_id, _, name = folder.name.partition('_')
+            images = sorted(str(path) for path in folder.iterdir() if path.suffix.lower() in IMAGE_SUFFIXES)
+            if images:
+                records.append({'name': name or input_id, 'input_id': input_id, 'images': images})
+        return records
+    
+    records: Dict[str, Dict[str, Any]] = {}
+    with open(source, newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 3 or row[0].strip().lower() == 'name':
+                continue
+            name, input_id = row[0].strip(), row[1].strip()
+            record = records.setdefault(input_id, {'name': name, 'input_id': input_id, 'images': []})
+            record['images'].extend(str(source.parent / path.strip()) for path in row[2:] if path.strip())
+    return list(records.values())
+
+
+_services = None
+
+
+def init_ingest_worker(torch_threads: Optional[int] = None):
+    """Load the detector and the embedding model once per worker process"""
+    global _services
+    apply_runtime_profile(force=True, torch_threads=torch_threads)
+    _services = (YOLODetectionService(endpoint='registration'), FaceEmbeddingService())
+
+
+def process_projects(records: List[Dict[str, Any]], batch_size: int) -> List[Dict[str, Any]]:
+    """
+    Detect, crop and embed the images of several animals
+    
+    The images of all the animals go through the detector and the
+    embedding model in batches of batch_size, instead of one forward pass
+    of each model per image as in a registration request. The crops are
+    written where registration writes them; nothing touches the database.
+    
+    Args:
+        records: Animals from read_manifest, each with its 'project_id'
+        batch_size: Images per forward pass
+        
+    Returns:
+        Per animal, the record with its 'faces' (image name, crop path,
+        confidence, bounding box, embedding), 'species' and 'qr_code'
+    """
+    yolo_service, embedding_service = _services
+    images = [(record, image_path) for record in records for image_path in record['images']]
+    faces = {record['project_id']: [] for record in records}
+    
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size]
+        decoded = [yolo_service.load_detection_image(image_path) for _, image_path in batch]
+        usable = [i for i, (image, _) in enumerate(decoded) if image is not None]
+        
+        crops = []
+        for i, detections in zip(usable, yolo_service.detect_pet_faces_batch([decoded[i] for i in usable])):
+            face_detections = [d for d in detections if d['class'].endswith('_face')]
+            if not face_detections:
+                continue
+            image, scale = decoded[i]
+            face_crop = yolo_service.crop_face(batch[i][1], image, scale, face_detections[0]['bounding_box'])
+            if face_crop is not None and face_crop.size:
+                crops.append((batch[i], face_crop, face_detections[0]))
+        
+        embeddings = embedding_service.generate_embeddings([face_crop for _, face_crop, _ in crops])
+        for ((record, image_path), face_crop, detection), embedding in zip(crops, embeddings):
+            if embedding is None:
+                continue
+            project_faces = faces[record['project_id']]
+            project_folder = Path(settings.MEDIA_ROOT) / 'face_crops' / record['project_id']
+            project_folder.mkdir(parents=True, exist_ok=True)
+            face_crop_path = project_folder / f'face_{len(project_faces)}.jpg'
+            cv2.imwrite(str(face_crop_path), face_crop)
+            project_faces.append({
+                'image_name': Path(image_path).name,
+                'face_crop_path': str(face_crop_path.relative_to(settings.MEDIA_ROOT)),
+                'confidence': detection['confidence'],
+                'bounding_box': detection['bounding_box'],
+                'embedding': embedding,
+                'species': FaceMatchingService.route_pet_type(detection),
+            })
+    
+    results = []
+    for record in records:
+        species_votes = {}
+        for face in faces[record['project_id']]:
+            if face['species']:
+                species_votes[face['species']] = species_votes.get(face['species'], 0) + 1
+        results.append(dict(
+            record,
+            faces=faces[record['project_id']],
+            species=max(species_votes, key=species_votes.get) if species_votes else None,
+            qr_code=SimpleFaceIdService.generate_qr_code(record['project_id'])
+        ))
+    return results
+
+
+def process_projects_task(args) -> List[Dict[str, Any]]:
+    """Pool.imap entry point for process_projects"""
+    return process_projects(*args)
+
+
+def store_projects(results: List[Dict[str, Any]]) -> int:
+    """
+    Write processed animals as FaceProjects and FaceVectors in one transaction
+    
+    bulk_create sends no post_save signals, so the change log entries the
+    signals would write are recorded here, and the new vectors are scored
+    against the standing QR queries once the transaction commits.
+    
+    Returns:
+        Number of face vectors written
+    """
+    projects, vectors = [], []
+    for result in results:
+        embeddings = [face['embedding'] for face in result['faces']]
+        project = FaceProject(
+            project_id=result['project_id'],
+            name=result['name'],
+            input_id=result['input_id'],
+            species=result['species'],
+            total_images=len(result['images']),
+            faces_detected=len(embeddings),
+            qr_code=result['qr_code'],
+            status='completed' if embeddings else 'failed'
+        )
+        project.set_centroid_vector(embeddings)
+        projects.append(project)
+        
+        for face in result['faces']:
+            face_vector = FaceVector(
+                project=project,
+                original_image_name=face['image_name'],
+                face_crop_path=face['face_crop_path'],
+                confidence_score=face['confidence'],
+                bounding_box=face['bounding_box']
+            )
+            face_vector.set_embedding_vector(face['embedding'])
+            vectors.append(face_vector)
+    
+    # Cluster assignment for the whole batch at once
+    run = get_active_run()
+    if run is not None and vectors:
+        matrix = np.asarray([face_vector.embedding_vector for face_vector in vectors], dtype=np.float32)
+        if matrix.shape[1] == run.vector_dimension:
+            for face_vector, cluster_id in zip(vectors, assign_clusters(matrix, run.centroid_matrix).tolist()):
+                face_vector.cluster_run, face_vector.cluster_id = run, cluster_id
+    
+    vector_ids = [str(face_vector.pk) for face_vector in vectors]
+    with transaction.atomic():
+        FaceProject.objects.bulk_create(projects)
+        FaceVector.objects.bulk_create(vectors, batch_size=1000)
+        EmbeddingChangeLog.record('face_vector', vector_ids, 'upsert')
+        EmbeddingChangeLog.record(
+            'face_project', [project.pk for project in projects if project.status == 'completed'], 'upsert'
+        )
+        
+        def match():
+            try:
+                match_registrations('face_vector', vector_ids)
+            except Exception as e:
+                logger.error(f"Error matching ingested face vectors against standing queries: {e}")
+        
+        if vector_ids:
+            transaction.on_commit(match)
+    
+    return len(vectors)
@@ -0,0 +1,148 @@
+import time
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+
+from face_recognition.similarity import normalize_rows, similarities
+from .models import FaceVector, ClusteringRun
+
+logger = logging.getLogger(__name__)
+
+
+def train_centroids(vectors: np.ndarray, n_clusters: int, iterations: int = 100,
+                    batch_size: int = 1024, seed: int = 0) -> np.ndarray:
+    """
+    Train spherical k-means centroids with mini-batch updates
+    
+    Args:
+        vectors: (n, d) training vectors
+        n_clusters: Number of centroids
+        iterations: Number of mini-batches
+        batch_size: Vectors per mini-batch
+        seed: Random seed
+        
+    Returns:
+        (n_clusters, d) float32 array of L2-normalized centroids
+    """
+    rng = np.random.default_rng(seed)
+    vectors = normalize_rows(np.asarray(vectors, dtype=np.float32))
+    n_clusters = min(n_clusters, len(vectors))
+    
+    centroids = vectors[rng.choice(len(vectors), size=n_clusters, replace=False)].copy()
+    counts = np.zeros(n_clusters, dtype=np.float64)
+    
+    for _ in range(iterations):
+        batch = vectors[rng.choice(len(vectors), size=min(batch_size, len(vectors)), replace=False)]
+        assignments = np.argmax(batch @ centroids.T, axis=1)
+        
+        # Per-centroid learning rate 1 / (points seen so far), as in Sculley's mini-batch k-means
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, batch)
+        batch_counts = np.bincount(assignments, minlength=n_clusters)
+        counts += batch_counts
+        
+        updated = batch_counts > 0
+        rate = (batch_counts[updated] / counts[updated])[:, None]
+        means = sums[updated] / batch_counts[updated][:, None]
+        centroids[updated] = (1 - rate) * centroids[updated] + rate * means
+        centroids = normalize_rows(centroids)
+    
+    return centroids.astype(np.float32)
+
+
+def assign_clusters(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Get the nearest centroid of each vector"""
+    return np.argmax(normalize_rows(np.asarray(vectors, dtype=np.float32)) @ centroids.T, axis=1)
+
+
+_active_run = None
+_active_run_checked = 0.0
+_active_run_lock = threading.Lock()
+
+
+def get_active_run() -> Optional[ClusteringRun]:
+    """Get the active clustering run, re-checking the database at most every ACTIVE_RUN_TTL seconds"""
+    global _active_run, _active_run_checked
+    
+    with _active_run_lock:
+        if time.monotonic() - _active_run_checked > settings.IVF_INDEX['ACTIVE_RUN_TTL']:
+            run = ClusteringRun.objects.filter(status='active').order_by('-created_at').only('id').first()
+            if run is None:
+                _active_run = None
+            elif _active_run is None or _active_run.id != run.id:
+                # Only load the centroid blob when the active run changed
+                _active_run = ClusteringRun.objects.get(id=run.id)
+                _active_run.centroid_matrix = _active_run.get_centroids()
+            _active_run_checked = time.monotonic()
+        return _active_run
+
+
+def assign_cluster(vector: np.ndarray) -> Tuple[Optional[ClusteringRun], Optional[int]]:
+    """Get the (run, cluster_id) a newly registered vector belongs to"""
+    run = get_active_run()
+    if run is None or len(vector) != run.vector_dimension:
+        return None, None
+    return run, int(assign_clusters(np.asarray(vector).reshape(1, -1), run.centroid_matrix)[0])
+
+
+def search_ivf(query: np.ndarray, top_k: int = 1, nprobe: Optional[int] = None,
+               species: Optional[str] = None) -> Optional[List[Tuple[str, float]]]:
+    """
+    Find the most similar face vectors by scoring only the nprobe nearest clusters
+    
+    Vectors not assigned by the active run (new, or still being reassigned
+    by a retraining job) are always scored, so results never miss them.
+    
+    Args:
+        query: Query embedding
+        top_k: Number of results
+        nprobe: Clusters to scan, defaults to IVF_INDEX['NPROBE']
+        species: Only score projects of this species (or of no recorded species)
+        
+    Returns:
+        List of (FaceVector pk, cosine similarity) pairs, most similar first,
+        or None when there is no active clustering run
+    """
+    run = get_active_run()
+    query = np.asarray(query, dtype=np.float32).reshape(-1)
+    if run is None or query.shape[0] != run.vector_dimension:
+        return None
+    
+    query = query / (np.linalg.norm(query) or 1.0)
+    nprobe = min(nprobe or settings.IVF_INDEX['NPROBE'], run.n_clusters)
+    probe = np.argsort(-(run.centroid_matrix @ query))[:nprobe].tolist()
+    
+    queryset = FaceVector.objects.filter(
+        Q(cluster_run=run, cluster_id__in=probe) | ~Q(cluster_run=run)
+    )
+    if species:
+        queryset = queryset.filter(Q(project__species=species) | Q(project__species__isnull=True))
+    queryset = queryset.values_list('pk', 'embedding_vector')
+    
+    ids = []
+    scores = []
+    chunk_ids = []
+    chunk = []
+    for object_id, vector in queryset.iterator(chunk_size=1000):
+        if not vector or len(vector) != run.vector_dimension:
+            continue
+        chunk_ids.append(str(object_id))
+        chunk.append(vector)
+        if len(chunk) == 1000:
+            ids.extend(chunk_ids)
+            scores.append(similarities(query, chunk)[0])
+            chunk_ids, chunk = [], []
+    if chunk:
+        ids.extend(chunk_ids)
+        scores.append(similarities(query, chunk)[0])
+    
+    if not ids:
+        return []
+    
+    scores = np.concatenate(scores)
+    top = np.argsort(-scores)[:top_k]
+    return [(ids[i], float(scores[i])) for i in top]
@@ -0,0 +1,116 @@
+import os
+import time
+import multiprocessing
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from simple_face_id.ingest import (
+    init_ingest_worker, process_projects, process_projects_task, read_manifest, store_projects
+)
+from simple_face_id.models import FaceProject
+from simple_face_id.services import SimpleFaceIdService
+
+
+class Command(BaseCommand):
+    help = 'Register many animals at once from a directory of images or a CSV manifest (resumable)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('source',
+                            help='Directory with one <id>_<name> subdirectory per animal, or CSV of name,id,image paths')
+        parser.add_argument('--workers', type=int,
+                            help='Worker processes (default: INGEST_WORKERS, 0 for one per CPU)')
+        parser.add_argument('--chunk-size', type=int,
+                            help='Animals per worker task (default: INGEST_CHUNK_SIZE)')
+        parser.add_argument('--batch-size', type=int,
+                            help='Images per detector and embedder forward pass (default: INGEST_BATCH_SIZE)')
+        parser.add_argument('--commit-size', type=int,
+                            help='Animals written per transaction (default: INGEST_COMMIT_SIZE)')
+    
+    def handle(self, *args, **options):
+        config = settings.INGEST
+        if not Path(options['source']).exists():
+            raise CommandError(f"{options['source']} does not exist")
+        
+        records = self.get_pending(read_manifest(options['source']))
+        if not records:
+            self.stdout.write('Nothing to ingest')
+            return
+        
+        chunk_size = options['chunk_size'] or config['CHUNK_SIZE']
+        batch_size = options['batch_size'] or config['BATCH_SIZE']
+        commit_size = options['commit_size'] or config['COMMIT_SIZE']
+        workers = options['workers'] if options['workers'] is not None else config['WORKERS']
+        workers = workers or os.cpu_count() or 1
+        
+        tasks = [(records[i:i + chunk_size], batch_size) for i in range(0, len(records), chunk_size)]
+        self.stdout.write(
+            f"Ingesting {len(records)} animals ({sum(len(record['images']) for record in records)} images) "
+            f"with {workers} workers"
+        )
+        
+        if workers == 1:
+            init_ingest_worker()
+            self.collect((process_projects(*task) for task in tasks), len(records), commit_size)
+        else:
+            # Forked workers never use the parent's database connections
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            torch_threads = max(1, (os.cpu_count() or 1) // workers)
+            with context.Pool(workers, initializer=init_ingest_worker, initargs=(torch_threads,)) as pool:
+                self.collect(pool.imap_unordered(process_projects_task, tasks), len(records), commit_size)
+    
+    def get_pending(self, records):
+        """Give each animal its project id and drop those already registered, so an interrupted run resumes"""
+        pending, seen = [], set()
+        for record in records:
+            record['project_id'] = SimpleFaceIdService.generate_project_id(record['name'], record['input_id'])
+            if record['project_id'] in seen:
+                self.stderr.write(f"Skipping {record['name']} ({record['input_id']}): project id {record['project_id']} is taken")
+                continue
+            seen.add(record['project_id'])
+            pending.append(record)
+        
+        project_ids = [record['project_id'] for record in pending]
+        existing = set()
+        for start in range(0, len(project_ids), 500):
+            existing.update(
+                FaceProject.objects.filter(project_id__in=project_ids[start:start + 500]).values_list('project_id', flat=True)
+            )
+        if existing:
+            self.stdout.write(f"Skipping {len(existing)} animals already registered")
+        return [record for record in pending if record['project_id'] not in existing]
+    
+    def collect(self, results, total, commit_size):
+        """Write the processed animals commit_size at a time and report throughput"""
+        start_time = time.time()
+        buffer = []
+        done = images = faces = failed = 0
+        
+        def flush():
+            nonlocal done, images, faces, failed, buffer
+            faces += store_projects(buffer)
+            done += len(buffer)
+            images += sum(len(result['images']) for result in buffer)
+            failed += sum(1 for result in buffer if not result['faces'])
+            buffer = []
+            elapsed = time.time() - start_time
+            self.stdout.write(
+                f"  {done}/{total} animals, {faces} faces, {done / elapsed:.1f} animals/s, "
+                f"{images / elapsed:.1f} images/s"
+            )
+        
+        for chunk in results:
+            buffer.extend(chunk)
+            if len(buffer) >= commit_size:
+                flush()
+        if buffer:
+            flush()
+        
+        elapsed = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(
+            f"Registered {done - failed} animals ({failed} without a usable face) with {faces} faces "
+            f"from {images} images in {elapsed:.1f}s ({images / elapsed:.1f} images/s)"
+        ))
@@ -0,0 +1,118 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from simple_face_id.ivf import train_centroids, assign_clusters
+from simple_face_id.models import FaceVector, ClusteringRun
+
+
+class Command(BaseCommand):
+    help = 'Train IVF centroids over the stored face vectors and assign every vector to its cluster'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--clusters', type=int,
+                            help='Number of clusters (default: about sqrt of the vector count)')
+        parser.add_argument('--sample', type=int, default=100000,
+                            help='Maximum number of vectors to train on')
+        parser.add_argument('--iterations', type=int, default=200,
+                            help='Mini-batch k-means iterations')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Vectors per training mini-batch and per reassignment batch')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue the reassignment of an interrupted run instead of retraining')
+    
+    def handle(self, *args, **options):
+        if options['resume']:
+            run = ClusteringRun.objects.filter(status='assigning').order_by('-created_at').first()
+            if run is None:
+                raise CommandError('No interrupted clustering run to resume')
+            self.stdout.write(f"Resuming run {run.id} after {run.assigned_vectors} vectors")
+        else:
+            run = self.train(options)
+        
+        self.reassign(run, options['batch_size'])
+    
+    def train(self, options):
+        """Train centroids on a random sample of the stored vectors"""
+        total = FaceVector.objects.count()
+        if not total:
+            raise CommandError('No face vectors to train on')
+        
+        start_time = time.time()
+        rng = np.random.default_rng(0)
+        
+        # Reservoir sample while streaming, so the table is read only once
+        sample = []
+        dimension = None
+        for seen, vector in enumerate(FaceVector.objects.values_list('embedding_vector', flat=True).iterator(chunk_size=1000)):
+            if not vector or (dimension is not None and len(vector) != dimension):
+                continue
+            dimension = dimension or len(vector)
+            if len(sample) < options['sample']:
+                sample.append(vector)
+            else:
+                slot = rng.integers(0, seen + 1)
+                if slot < options['sample']:
+                    sample[slot] = vector
+        
+        n_clusters = options['clusters'] or max(1, int(np.sqrt(total)))
+        centroids = train_centroids(np.asarray(sample, dtype=np.float32), n_clusters,
+                                    options['iterations'], options['batch_size'])
+        
+        run = ClusteringRun(training_vectors=len(sample))
+        run.set_centroids(centroids)
+        run.save()
+        
+        self.stdout.write(
+            f"Trained {run.n_clusters} centroids on {len(sample)} of {total} vectors "
+            f"in {time.time() - start_time:.1f}s (run {run.id})"
+        )
+        return run
+    
+    def reassign(self, run, batch_size):
+        """Assign every vector to its nearest centroid, checkpointing after each batch"""
+        centroids = run.get_centroids()
+        start_time = time.time()
+        
+        while True:
+            queryset = FaceVector.objects.order_by('pk').only('id', 'embedding_vector')
+            if run.cursor:
+                queryset = queryset.filter(pk__gt=run.cursor)
+            batch = list(queryset[:batch_size])
+            if not batch:
+                break
+            
+            vectors = [v for v in batch if v.embedding_vector and len(v.embedding_vector) == run.vector_dimension]
+            if vectors:
+                assignments = assign_clusters(np.asarray([v.embedding_vector for v in vectors]), centroids)
+                for face_vector, cluster_id in zip(vectors, assignments.tolist()):
+                    face_vector.cluster_run = run
+                    face_vector.cluster_id = cluster_id
+            
+            with transaction.atomic():
+                FaceVector.objects.bulk_update(vectors, ['cluster_run', 'cluster_id'])
+                run.assigned_vectors += len(vectors)
+                run.cursor = str(batch[-1].pk)
+                run.save(update_fields=['assigned_vectors', 'cursor'])
+            
+            self.stdout.write(f"  assigned {run.assigned_vectors} vectors")
+        
+        with transaction.atomic():
+            ClusteringRun.objects.filter(status='active').update(status='retired')
+            run.status = 'active'
+            run.completed_at = timezone.now()
+            run.save(update_fields=['status', 'completed_at'])
+        
+        sizes = np.bincount(
+            np.asarray(FaceVector.objects.filter(cluster_run=run).values_list('cluster_id', flat=True), dtype=int),
+            minlength=run.n_clusters
+        )
+        self.stdout.write(
+            f"Run {run.id} active: {run.assigned_vectors} vectors in {run.n_clusters} clusters "
+            f"(sizes min {sizes.min()}, median {int(np.median(sizes))}, max {sizes.max()}), "
+            f"{time.time() - start_time:.1f}s; searches scan ~{min(1, settings.IVF_INDEX['NPROBE'] / run.n_clusters):.1%} of the table"
+        )
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_face_id', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClusteringRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('n_clusters', models.IntegerField()),
+                ('vector_dimension', models.IntegerField()),
+                ('centroids', models.BinaryField()),
+                ('status', models.CharField(choices=[('assigning', 'Assigning'), ('active', 'Active'), ('retired', 'Retired'), ('failed', 'Failed')], default='assigning', max_length=20)),
+                ('training_vectors', models.IntegerField(default=0)),
+                ('assigned_vectors', models.IntegerField(default=0)),
+                ('cursor', models.CharField(blank=True, default='', max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='facevector',
+            name='cluster_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='facevector',
+            name='cluster_run',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='face_vectors', to='simple_face_id.clusteringrun'),
+        ),
+        migrations.AddIndex(
+            model_name='facevector',
+            index=models.Index(fields=['cluster_run', 'cluster_id'], name='simple_face_cluster_f34553_idx'),
+        ),
+    ]
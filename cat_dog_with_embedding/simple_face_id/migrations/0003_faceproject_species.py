@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_face_id', '0002_clusteringrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceproject',
+            name='species',
+            field=models.CharField(blank=True, choices=[('cat', 'Cat'), ('dog', 'Dog')], max_length=10, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:59
+
+from django.db import migrations, models
+import numpy as np
+
+
+def compute_centroids(apps, schema_editor):
+    """Backfill the centroid of every existing project from its face vectors"""
+    FaceProject = apps.get_model('simple_face_id', 'FaceProject')
+    FaceVector = apps.get_model('simple_face_id', 'FaceVector')
+
+    for project in FaceProject.objects.all().iterator():
+        vectors = [
+            vector for vector in FaceVector.objects.filter(project=project).values_list('embedding_vector', flat=True)
+            if vector
+        ]
+        if not vectors or len({len(vector) for vector in vectors}) != 1:
+            continue
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        centroid = vectors.mean(axis=0)
+        project.centroid_vector = (centroid / (np.linalg.norm(centroid) or 1.0)).tolist()
+        project.save(update_fields=['centroid_vector'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_face_id', '0003_faceproject_species'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faceproject',
+            name='centroid_vector',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(compute_centroids, migrations.RunPython.noop),
+    ]
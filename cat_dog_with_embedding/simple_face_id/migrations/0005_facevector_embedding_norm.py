@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:21
+
+from django.db import migrations, models
+import numpy as np
+
+
+def normalize_vectors(apps, schema_editor):
+    """L2-normalize the stored face vectors, keeping their norms"""
+    FaceVector = apps.get_model('simple_face_id', 'FaceVector')
+
+    batch = []
+    for face_vector in FaceVector.objects.filter(embedding_norm__isnull=True).only('pk', 'embedding_vector').iterator(chunk_size=1000):
+        vector = np.asarray(face_vector.embedding_vector or [], dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        face_vector.embedding_vector = (vector / (norm or 1.0)).tolist()
+        face_vector.embedding_norm = norm
+        batch.append(face_vector)
+        if len(batch) == 1000:
+            FaceVector.objects.bulk_update(batch, ['embedding_vector', 'embedding_norm'])
+            batch = []
+    FaceVector.objects.bulk_update(batch, ['embedding_vector', 'embedding_norm'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_face_id', '0004_faceproject_centroid_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facevector',
+            name='embedding_norm',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(normalize_vectors, migrations.RunPython.noop),
+    ]
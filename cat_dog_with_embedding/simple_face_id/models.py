@@ -1,8 +1,11 @@
 from django.db import models
 import uuid
 import json
+import numpy as np
 from django.utils import timezone
 
+from face_recognition.similarity import normalize
+
 
 class FaceProject(models.Model):
     """Simple model to store face recognition projects"""
@@ -14,6 +17,12 @@ class FaceProject(models.Model):
     name = models.CharField(max_length=100)
     input_id = models.CharField(max_length=50)  # The ID provided by user
     
+    # Species detected at registration; searches are routed to its partition
+    species = models.CharField(max_length=10, choices=[
+        ('cat', 'Cat'),
+        ('dog', 'Dog'),
+    ], blank=True, null=True)
+    
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -32,11 +41,25 @@ class FaceProject(models.Model):
     # QR code (base64 encoded)
     qr_code = models.TextField(blank=True, null=True)
     
+    # L2-normalized mean of the project's face vectors (stored as JSON array),
+    # used to shortlist projects before scoring their individual vectors
+    centroid_vector = models.JSONField(blank=True, null=True)
+    
     class Meta:
         ordering = ['-created_at']
     
     def __str__(self):
         return f"Project {self.project_id} - {self.name}"
+    
+    def set_centroid_vector(self, vectors):
+        """Set the centroid from the project's face embeddings"""
+        if not len(vectors):
+            self.centroid_vector = None
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        centroid = vectors.mean(axis=0)
+        self.centroid_vector = (centroid / (np.linalg.norm(centroid) or 1.0)).tolist()
 
 
 class FaceVector(models.Model):
@@ -45,9 +68,10 @@ class FaceVector(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     project = models.ForeignKey(FaceProject, on_delete=models.CASCADE, related_name='face_vectors')
     
-    # Face embedding vector (stored as JSON array)
+    # Face embedding vector (stored as L2-normalized JSON array)
     embedding_vector = models.JSONField()
     vector_dimension = models.IntegerField()
+    embedding_norm = models.FloatField(blank=True, null=True)  # L2 norm before normalization
     
     # Face image info
     original_image_name = models.CharField(max_length=255)
@@ -57,22 +81,28 @@ class FaceVector(models.Model):
     confidence_score = models.FloatField()
     bounding_box = models.JSONField()  # [x1, y1, x2, y2]
     
+    # IVF partition: nearest centroid of the clustering run that assigned it
+    cluster_run = models.ForeignKey('ClusteringRun', on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='face_vectors')
+    cluster_id = models.IntegerField(null=True, blank=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['cluster_run', 'cluster_id']),
+        ]
     
     def __str__(self):
         return f"Face vector for {self.project.name}"
     
     def set_embedding_vector(self, vector):
-        """Set embedding vector from numpy array or list"""
-        if hasattr(vector, 'tolist'):  # numpy array
-            self.embedding_vector = vector.tolist()
-            self.vector_dimension = len(vector)
-        else:  # list
-            self.embedding_vector = vector
-            self.vector_dimension = len(vector)
+        """Set embedding vector from numpy array or list, L2-normalized so similarity is a dot product"""
+        vector, norm = normalize(vector)
+        self.embedding_vector = vector.tolist()
+        self.vector_dimension = len(vector)
+        self.embedding_norm = norm
 
 
 class SimilaritySearch(models.Model):
@@ -95,4 +125,44 @@ class SimilaritySearch(models.Model):
     def __str__(self):
         if self.best_match_project:
             return f"Search result: {self.best_match_project.name} (score: {self.similarity_score:.3f})"
-        return f"Search result: No match found" 
\ No newline at end of file
+        return f"Search result: No match found"
+
+
+class ClusteringRun(models.Model):
+    """k-means centroids for the IVF (inverted file) partitioning of face vectors"""
+    
+    RUN_STATUS = [
+        ('assigning', 'Assigning'),  # Centroids trained, vectors being reassigned
+        ('active', 'Active'),        # Used for searches and new registrations
+        ('retired', 'Retired'),
+        ('failed', 'Failed'),
+    ]
+    
+    n_clusters = models.IntegerField()
+    vector_dimension = models.IntegerField()
+    centroids = models.BinaryField()  # float32 (n_clusters, vector_dimension), L2-normalized
+    status = models.CharField(max_length=20, choices=RUN_STATUS, default='assigning')
+    
+    # Training and reassignment progress
+    training_vectors = models.IntegerField(default=0)
+    assigned_vectors = models.IntegerField(default=0)
+    cursor = models.CharField(max_length=64, blank=True, default='')  # Last reassigned FaceVector pk
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Clustering run {self.id} ({self.n_clusters} clusters) - {self.status}"
+    
+    def set_centroids(self, centroids):
+        """Set centroids from a numpy array"""
+        centroids = np.asarray(centroids, dtype=np.float32)
+        self.n_clusters, self.vector_dimension = centroids.shape
+        self.centroids = centroids.tobytes()
+    
+    def get_centroids(self):
+        """Get centroids as a numpy array"""
+        return np.frombuffer(bytes(self.centroids), dtype=np.float32).reshape(self.n_clusters, self.vector_dimension)
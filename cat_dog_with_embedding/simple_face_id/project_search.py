@@ -0,0 +1,234 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from face_recognition.index import get_index, search_embeddings
+from face_recognition.models import EmbeddingChangeLog
+from face_recognition.similarity import similarities
+from .models import FaceProject, FaceVector
+
+logger = logging.getLogger(__name__)
+
+
+def aggregate_segments(scores: np.ndarray, segments: np.ndarray, method: str = 'max',
+                       top_m: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reduce per-vector scores to one score per segment (project)
+    
+    Args:
+        scores: (n,) vector scores
+        segments: (n,) segment number of each score, 0..n_segments-1
+        method: 'max', or 'top_m_mean' for the mean of the best top_m scores
+            (one outlier crop cannot carry a project on its own)
+        top_m: Scores averaged per segment by 'top_m_mean'
+        
+    Returns:
+        (n_segments,) aggregated scores and the index into `scores` of each
+        segment's best vector
+    """
+    # Group by segment, best score first within each segment
+    order = np.lexsort((-scores, segments))
+    sorted_scores = scores[order]
+    sorted_segments = segments[order]
+    starts = np.flatnonzero(np.r_[True, sorted_segments[1:] != sorted_segments[:-1]])
+    best = order[starts]
+    
+    if method == 'max':
+        return sorted_scores[starts], best
+    
+    counts = np.diff(np.r_[starts, len(scores)])
+    rank = np.arange(len(scores)) - np.repeat(starts, counts)
+    sums = np.add.reduceat(np.where(rank < top_m, sorted_scores, 0.0), starts)
+    return sums / np.minimum(counts, top_m), best
+
+
+def search_projects(query: np.ndarray, top_k: Optional[int] = None,
+                    species: Optional[str] = None) -> Optional[List[Tuple[str, float, str]]]:
+    """
+    Find the most similar projects
+    
+    The project centroids shortlist PROJECT_SEARCH['SHORTLIST'] projects,
+    then every face vector of the shortlisted projects is scored exactly
+    and reduced to one score per project.
+    
+    Args:
+        query: Query embedding
+        top_k: Number of projects, defaults to PROJECT_SEARCH['TOP_K']
+        species: Only search projects of this species (or of no recorded species)
+        
+    Returns:
+        List of (project_id, score, best FaceVector pk), best first, or None
+        when no project has a centroid yet
+    """
+    config = settings.PROJECT_SEARCH
+    query = np.asarray(query, dtype=np.float32).reshape(-1)
+    query = query / (np.linalg.norm(query) or 1.0)
+    
+    shortlist = search_embeddings('face_project', query, config['SHORTLIST'], pet_type=species)
+    if not shortlist:
+        return None
+    
+    pairs = list(
+        FaceVector.objects.filter(project_id__in=[project_id for project_id, _ in shortlist])
+        .values_list('pk', 'project_id')
+    )
+    if not pairs:
+        return []
+    projects = {str(object_id): project_id for object_id, project_id in pairs}
+    
+    # Vectors come from the face vector index; rows it has not picked up yet are read from the database
+    vector_index = get_index('face_vector')
+    if vector_index.loaded:
+        ids, vectors = vector_index.vectors_for(list(projects))
+    else:
+        vector_index.warm_up()
+        ids, vectors = [], np.zeros((0, len(query)), dtype=np.float32)
+    missing = set(projects) - set(ids)
+    if missing:
+        rows = [
+            (str(object_id), vector)
+            for object_id, vector in FaceVector.objects.filter(pk__in=missing).values_list('pk', 'embedding_vector')
+            if vector and len(vector) == len(query)
+        ]
+        if rows:
+            ids = ids + [object_id for object_id, _ in rows]
+            extra = np.asarray([vector for _, vector in rows], dtype=np.float32)
+            vectors = np.concatenate([vectors, extra]) if len(vectors) else extra
+    if not ids:
+        return []
+    
+    project_ids, segments = np.unique([projects[object_id] for object_id in ids], return_inverse=True)
+    scores, best = aggregate_segments(similarities(query, vectors)[0], segments, config['AGGREGATION'], config['TOP_M'])
+    
+    top = np.argsort(-scores)[:top_k or config['TOP_K']]
+    return [(str(project_ids[i]), float(scores[i]), ids[best[i]]) for i in top]
+
+
+_project_vectors: 'OrderedDict[str, tuple]' = OrderedDict()
+_project_vectors_lock = threading.Lock()
+_project_vectors_seq = None  # face_vector change log position the cache reflects
+_project_vectors_poll = 0.0
+
+
+def forget_project_vectors(project_pk=None):
+    """Drop the cached vectors of a project, or of every project"""
+    with _project_vectors_lock:
+        if project_pk is None:
+            _project_vectors.clear()
+        else:
+            _project_vectors.pop(project_pk, None)
+
+
+def refresh_project_vectors():
+    """
+    Evict the cached projects whose vectors changed in another worker
+    
+    Reads the face_vector change log entries written since the last poll, at
+    most every EMBEDDING_INDEX['POLL_INTERVAL'] seconds like the indexes do,
+    so cache hits in between cost no query. A 'reset' (embedding model swap)
+    or a backlog longer than MAX_CHANGES clears the whole cache. Writes made
+    by this worker are evicted at once by the FaceVector signals.
+    """
+    global _project_vectors_seq, _project_vectors_poll
+    config = settings.EMBEDDING_INDEX
+    
+    with _project_vectors_lock:
+        now = time.monotonic()
+        if _project_vectors_seq is not None and now - _project_vectors_poll < config['POLL_INTERVAL']:
+            return
+        _project_vectors_poll = now
+        
+        # Read before the entries, so nothing newer than what we read is skipped
+        settled_seq = EmbeddingChangeLog.settled_seq('face_vector')
+        if _project_vectors_seq is None:
+            _project_vectors.clear()
+            _project_vectors_seq = settled_seq
+            return
+        
+        entries = list(
+            EmbeddingChangeLog.objects.filter(source='face_vector', seq__gt=_project_vectors_seq)
+            .order_by('seq')
+            .values_list('seq', 'object_id', 'operation')[:config['MAX_CHANGES'] + 1]
+        )
+        if not entries:
+            return
+        
+        if len(entries) > config['MAX_CHANGES'] or any(operation == 'reset' for _, _, operation in entries):
+            _project_vectors.clear()
+        elif _project_vectors:
+            changed = {object_id for _, object_id, _ in entries}
+            # New vectors are not cached yet, so their project comes from the table
+            projects = set(FaceVector.objects.filter(pk__in=changed).values_list('project_id', flat=True))
+            for project_pk, (ids, _) in list(_project_vectors.items()):
+                if project_pk in projects or not changed.isdisjoint(ids):
+                    del _project_vectors[project_pk]
+        
+        # Entries past the settled sequence number are re-read on the next
+        # poll in case an earlier one commits late; evicting twice is harmless
+        _project_vectors_seq = max(_project_vectors_seq, min(entries[-1][0], settled_seq))
+
+
+def get_project_vectors(project: FaceProject) -> Tuple[List[str], np.ndarray]:
+    """
+    Get the (write-time L2-normalized) face vectors of one project, through an LRU cache
+    
+    Entries are evicted from the face_vector change log (refresh_project_vectors),
+    so added, deleted and re-embedded vectors are picked up within the index
+    staleness window without re-querying the project on every hit.
+    
+    Returns:
+        FaceVector pks and their (n, dimension) vectors
+    """
+    refresh_project_vectors()
+    
+    with _project_vectors_lock:
+        cached = _project_vectors.get(project.pk)
+        if cached is not None:
+            _project_vectors.move_to_end(project.pk)
+            return cached
+    
+    rows = [
+        (str(object_id), vector)
+        for object_id, vector in FaceVector.objects.filter(project=project).values_list('pk', 'embedding_vector')
+        if vector
+    ]
+    if rows and len({len(vector) for _, vector in rows}) == 1:
+        ids = [object_id for object_id, _ in rows]
+        vectors = np.asarray([vector for _, vector in rows], dtype=np.float32)
+    else:
+        ids, vectors = [], np.zeros((0, 0), dtype=np.float32)
+    
+    with _project_vectors_lock:
+        _project_vectors[project.pk] = (ids, vectors)
+        _project_vectors.move_to_end(project.pk)
+        while len(_project_vectors) > settings.FACE_VERIFICATION['CACHE_SIZE']:
+            _project_vectors.popitem(last=False)
+    return ids, vectors
+
+
+def verify_project(query: np.ndarray, project: FaceProject) -> Optional[Tuple[float, str]]:
+    """
+    Compare a query embedding against the face vectors of one project only
+    
+    The vectors are reduced to one score the same way project search ranks
+    projects (PROJECT_SEARCH['AGGREGATION']).
+    
+    Returns:
+        (similarity, pk of the most similar FaceVector), or None when the
+        project has no usable vectors
+    """
+    ids, vectors = get_project_vectors(project)
+    query = np.asarray(query, dtype=np.float32).reshape(-1)
+    if not ids or vectors.shape[1] != len(query):
+        return None
+    
+    query = query / (np.linalg.norm(query) or 1.0)
+    config = settings.PROJECT_SEARCH
+    scores, best = aggregate_segments(similarities(query, vectors)[0], np.zeros(len(ids), dtype=np.int64),
+                                      config['AGGREGATION'], config['TOP_M'])
+    return float(scores[0]), ids[best[0]]
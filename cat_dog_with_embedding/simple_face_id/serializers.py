@@ -53,10 +53,32 @@ class FaceSimilaritySearchResponseSerializer(serializers.Serializer):
     name = serializers.CharField(required=False)
     similarity_score = serializers.FloatField()
     face_image_path = serializers.CharField(required=False)
+    matches = serializers.ListField(child=serializers.DictField(), required=False,
+                                    help_text="Top matching projects, best first")
     processing_time = serializers.FloatField()
     error = serializers.CharField(required=False)
 
 
+class FaceVerificationSerializer(serializers.Serializer):
+    """Serializer for 1:1 face verification API"""
+    
+    project_id = serializers.CharField(max_length=20, help_text="Project ID encoded in the QR code")
+    image = serializers.ImageField(help_text="Image of the animal to verify")
+
+
+class FaceVerificationResponseSerializer(serializers.Serializer):
+    """Serializer for face verification response"""
+    
+    project_id = serializers.CharField(required=False)
+    name = serializers.CharField(required=False)
+    similarity_score = serializers.FloatField()
+    threshold = serializers.FloatField(required=False)
+    verified = serializers.BooleanField(required=False)
+    face_image_path = serializers.CharField(required=False, allow_null=True)
+    processing_time = serializers.FloatField(required=False)
+    error = serializers.CharField(required=False)
+
+
 class FaceProjectSerializer(serializers.ModelSerializer):
     """Serializer for FaceProject model"""
     
@@ -7,16 +7,21 @@ import io
 from PIL import Image
 from pathlib import Path
 from django.conf import settings
+from django.db import transaction
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 import time
 import logging
 from typing import List, Dict, Any, Optional, Tuple
-from sklearn.metrics.pairwise import cosine_similarity
 import json
+import uuid
 
 # Import existing services
-from face_recognition.services import YOLODetectionService, FaceEmbeddingService
+from face_recognition.services import YOLODetectionService, FaceEmbeddingService, FaceMatchingService
+from face_recognition.index import get_index
+from face_recognition.model_pool import PoolTimeout
+from .ivf import assign_cluster, search_ivf
+from .project_search import search_projects, verify_project
 from .models import FaceProject, FaceVector, SimilaritySearch
 
 logger = logging.getLogger(__name__)
@@ -26,12 +31,13 @@ class SimpleFaceIdService:
     """Main service for the simplified face ID system"""
     
     def __init__(self):
-        self.yolo_service = YOLODetectionService()
+        self.yolo_service = YOLODetectionService(endpoint='registration')
         self.embedding_service = FaceEmbeddingService()
         self.base_storage_path = Path(settings.MEDIA_ROOT) / 'face_crops'
         self.base_storage_path.mkdir(parents=True, exist_ok=True)
     
-    def generate_project_id(self, name: str, input_id: str) -> str:
+    @staticmethod
+    def generate_project_id(name: str, input_id: str) -> str:
         """Generate project ID: first 6 digits of input_id + first 3 letters of name"""
         # Extract first 6 digits from input_id
         digits = ''.join(filter(str.isdigit, input_id))[:6]
@@ -45,7 +51,8 @@ class SimpleFaceIdService:
         
         return digits + letters
     
-    def generate_qr_code(self, project_id: str) -> str:
+    @staticmethod
+    def generate_qr_code(project_id: str) -> str:
         """Generate QR code for project ID and return as base64 string"""
         try:
             # Create QR code
@@ -106,6 +113,8 @@ class SimpleFaceIdService:
                 logger.error("Embedding service returned None")
                 return None
                 
+        except PoolTimeout:
+            raise
         except Exception as e:
             logger.error(f"Error generating embedding from face crop: {e}")
             import traceback
@@ -153,6 +162,8 @@ class SimpleFaceIdService:
             # Process each image
             processed_count = 0
             face_count = 0
+            species_votes = {}
+            embeddings = []
             
             for idx, image_file in enumerate(image_files):
                 try:
@@ -204,12 +215,19 @@ class SimpleFaceIdService:
                                 
                                 # Set embedding vector BEFORE saving
                                 face_vector.set_embedding_vector(embedding)
+                                face_vector.cluster_run, face_vector.cluster_id = assign_cluster(embedding)
                                 
                                 # Now save the object with complete data
-                                face_vector.save()
+                                with transaction.atomic():
+                                    face_vector.save()
                                 
                                 logger.info(f"Face vector saved successfully for face {face_count}")
                                 face_count += 1
+                                embeddings.append(embedding)
+                                
+                                species = FaceMatchingService.route_pet_type(best_detection)
+                                if species:
+                                    species_votes[species] = species_votes.get(species, 0) + 1
                             else:
                                 logger.error(f"Failed to generate embedding for image {idx}")
                         else:
@@ -223,6 +241,8 @@ class SimpleFaceIdService:
                     if temp_path.exists():
                         temp_path.unlink()
                         
+                except PoolTimeout:
+                    raise
                 except Exception as e:
                     logger.error(f"Error processing image {idx}: {e}")
                     import traceback
@@ -234,6 +254,8 @@ class SimpleFaceIdService:
             
             # Update project
             project.faces_detected = face_count
+            project.species = max(species_votes, key=species_votes.get) if species_votes else None
+            project.set_centroid_vector(embeddings)
             project.qr_code = qr_code
             project.status = 'completed' if face_count > 0 else 'failed'
             project.save()
@@ -252,6 +274,11 @@ class SimpleFaceIdService:
                 'status': project.status
             }
             
+        except PoolTimeout:
+            # Drop the half-registered project so the client can simply retry
+            if 'project' in locals():
+                project.delete()
+            raise
         except Exception as e:
             logger.error(f"Error in face registration: {e}")
             import traceback
@@ -261,33 +288,24 @@ class SimpleFaceIdService:
                 'project_id': project_id if 'project_id' in locals() else None
             }
     
-    def find_similar_face(self, search_image_file) -> Dict[str, Any]:
+    def embed_search_image(self, image_file) -> Dict[str, Any]:
         """
-        Find similar face from search image
+        Detect the face in a search image and embed it
         
-        Args:
-            search_image_file: Uploaded image file for search
-            
         Returns:
-            Dict with similarity results
+            Dict with the 'embedding' and its 'detection', or an 'error'
         """
-        start_time = time.time()
-        
+        temp_path = self.base_storage_path / f'search_temp_{uuid.uuid4().hex}.jpg'
         try:
-            # Save temporary search image
-            temp_path = self.base_storage_path / f'search_temp_{int(time.time())}.jpg'
             with open(temp_path, 'wb') as f:
-                for chunk in search_image_file.chunks():
+                for chunk in image_file.chunks():
                     f.write(chunk)
             
             # Detect face in search image
-            detections = self.yolo_service.detect_pet_faces(str(temp_path))
+            detections = self.yolo_service.detect_pet_faces(str(temp_path), endpoint='search')
             
             if not detections:
-                return {
-                    'error': 'No face detected in search image',
-                    'similarity_score': 0.0
-                }
+                return {'error': 'No face detected in search image'}
             
             # Extract face crop from best detection
             best_detection = detections[0]
@@ -297,22 +315,111 @@ class SimpleFaceIdService:
             )
             
             if face_crop is None:
+                return {'error': 'Could not extract face from search image'}
+            
+            # Generate embedding for search image
+            embedding = self.generate_embedding_from_face_crop(face_crop)
+            
+            if embedding is None:
+                return {'error': 'Could not generate embedding for search image'}
+            
+            return {'embedding': embedding, 'detection': best_detection}
+        finally:
+            # Clean up temp file
+            if temp_path.exists():
+                temp_path.unlink()
+    
+    def verify_face(self, project_id: str, image_file) -> Dict[str, Any]:
+        """
+        Verify a photo against one project (1:1), e.g. the one in a scanned QR code
+        
+        Only the project's own face vectors are compared, so the cost does
+        not depend on the size of the registry.
+        
+        Args:
+            project_id: Project to verify against
+            image_file: Uploaded image file of the animal
+            
+        Returns:
+            Dict with the similarity, the threshold and whether it passed
+        """
+        start_time = time.time()
+        
+        try:
+            project = FaceProject.objects.filter(project_id=project_id).first()
+            if project is None:
                 return {
-                    'error': 'Could not extract face from search image',
+                    'error': f'Project {project_id} not found',
                     'similarity_score': 0.0
                 }
             
-            # Generate embedding for search image
-            search_embedding = self.generate_embedding_from_face_crop(face_crop)
+            search_face = self.embed_search_image(image_file)
+            if 'error' in search_face:
+                return {
+                    'error': search_face['error'],
+                    'similarity_score': 0.0
+                }
             
-            if search_embedding is None:
+            result = verify_project(search_face['embedding'], project)
+            if result is None:
                 return {
-                    'error': 'Could not generate embedding for search image',
+                    'error': f'Project {project_id} has no face vectors to compare',
                     'similarity_score': 0.0
                 }
             
-            # Find most similar face
-            best_match = self.find_most_similar_vector(search_embedding)
+            similarity, vector_id = result
+            threshold = settings.FACE_VERIFICATION['THRESHOLD']
+            best_vector = FaceVector.objects.filter(pk=vector_id).first()
+            
+            return {
+                'project_id': project.project_id,
+                'name': project.name,
+                'similarity_score': similarity,
+                'threshold': threshold,
+                'verified': similarity >= threshold,
+                'face_image_path': best_vector.face_crop_path if best_vector else None,
+                'processing_time': time.time() - start_time
+            }
+        
+        except PoolTimeout:
+            raise
+        except Exception as e:
+            logger.error(f"Error in face verification: {e}")
+            return {
+                'error': str(e),
+                'similarity_score': 0.0
+            }
+    
+    def find_similar_face(self, search_image_file) -> Dict[str, Any]:
+        """
+        Find similar face from search image
+        
+        Args:
+            search_image_file: Uploaded image file for search
+            
+        Returns:
+            Dict with similarity results
+        """
+        start_time = time.time()
+        
+        try:
+            search_face = self.embed_search_image(search_image_file)
+            if 'error' in search_face:
+                return {
+                    'error': search_face['error'],
+                    'similarity_score': 0.0
+                }
+            search_embedding = search_face['embedding']
+            best_detection = search_face['detection']
+            
+            # Find the most similar projects of the detected species
+            species = FaceMatchingService.route_pet_type(best_detection)
+            matches = self.find_similar_projects(search_embedding, species)
+            if matches is None:
+                # No project centroids yet: fall back to the best single vector
+                best_match = self.find_most_similar_vector(search_embedding, species)
+                matches = [best_match] if best_match else []
+            best_match = matches[0] if matches else None
             
             processing_time = time.time() - start_time
             
@@ -325,16 +432,21 @@ class SimpleFaceIdService:
                 processing_time=processing_time
             )
             
-            # Clean up temp file
-            if temp_path.exists():
-                temp_path.unlink()
-            
             if best_match:
                 return {
                     'project_id': best_match['project'].project_id,
                     'name': best_match['project'].name,
                     'similarity_score': best_match['similarity'],
                     'face_image_path': best_match['vector'].face_crop_path,
+                    'matches': [
+                        {
+                            'project_id': match['project'].project_id,
+                            'name': match['project'].name,
+                            'similarity_score': match['similarity'],
+                            'face_image_path': match['vector'].face_crop_path,
+                        }
+                        for match in matches
+                    ],
                     'processing_time': processing_time
                 }
             else:
@@ -344,6 +456,8 @@ class SimpleFaceIdService:
                     'processing_time': processing_time
                 }
                 
+        except PoolTimeout:
+            raise
         except Exception as e:
             logger.error(f"Error in similarity search: {e}")
             return {
@@ -351,36 +465,96 @@ class SimpleFaceIdService:
                 'similarity_score': 0.0
             }
     
-    def find_most_similar_vector(self, search_embedding: np.ndarray) -> Optional[Dict[str, Any]]:
-        """Find the most similar face vector"""
+    def find_similar_projects(self, search_embedding: np.ndarray,
+                              species: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Find the most similar projects, scored over all of their face vectors
+        
+        Returns:
+            List of {'project', 'vector', 'similarity'} dicts, best first, with
+            each project's best matching vector; None when project search is
+            unavailable
+        """
         try:
-            # Get all face vectors
-            face_vectors = FaceVector.objects.all()
-            
-            if not face_vectors.exists():
-                return None
-            
-            best_similarity = -1
-            best_match = None
-            
-            search_embedding = search_embedding.reshape(1, -1)
-            
-            for face_vector in face_vectors:
-                # Convert stored embedding back to numpy array
-                stored_embedding = np.array(face_vector.embedding_vector).reshape(1, -1)
-                
-                # Calculate cosine similarity
-                similarity = cosine_similarity(search_embedding, stored_embedding)[0][0]
-                
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    best_match = {
+            hits = search_projects(search_embedding, species=species)
+        except Exception as e:
+            logger.error(f"Project search failed, falling back to vector search: {e}")
+            return None
+        if hits is None:
+            return None
+        
+        vectors = {
+            str(face_vector.pk): face_vector
+            for face_vector in FaceVector.objects.select_related('project').filter(
+                pk__in=[vector_id for _, _, vector_id in hits]
+            )
+        }
+        
+        matches = []
+        for project_id, similarity, vector_id in hits:
+            face_vector = vectors.get(vector_id)
+            if face_vector is not None:
+                matches.append({
+                    'project': face_vector.project,
+                    'vector': face_vector,
+                    'similarity': similarity
+                })
+        return matches
+    
+    def search_index(self, search_embedding: np.ndarray, species: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find the most similar face vector using this worker's in-memory index
+        
+        Until the index is loaded, answers from the IVF clusters in the
+        database while the index loads in the background, or returns None
+        without IVF clusters. With a species only projects of that species
+        (or of no recorded species) are searched.
+        """
+        try:
+            index = get_index('face_vector')
+            if index.loaded:
+                hits = index.search(search_embedding, top_k=5, pet_type=species)
+            else:
+                index.warm_up()
+                hits = search_ivf(search_embedding, top_k=5, species=species)
+                if hits is None:
+                    return None
+        except Exception as e:
+            logger.error(f"Embedding index search failed, falling back to a full scan: {e}")
+            return None
+        
+        for object_id, similarity in hits:
+            # Skip vectors deleted since the last index refresh
+            face_vector = FaceVector.objects.select_related('project').filter(pk=object_id).first()
+            if face_vector is not None:
+                return {
+                    'project': face_vector.project,
+                    'vector': face_vector,
+                    'similarity': similarity
+                }
+        
+        return None
+    
+    def find_most_similar_vector(self, search_embedding: np.ndarray,
+                                 species: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Find the most similar face vector, optionally among projects of one species"""
+        try:
+            match = self.search_index(search_embedding, species)
+            if match is not None:
+                return match
+            
+            # No index yet: stream (id, vector) rows instead of loading the table
+            hits = get_index('face_vector').scan_database(search_embedding, top_k=5, pet_type=species)
+            for object_id, similarity in hits:
+                face_vector = FaceVector.objects.select_related('project').filter(pk=object_id).first()
+                if face_vector is not None:
+                    return {
                         'project': face_vector.project,
                         'vector': face_vector,
-                        'similarity': float(similarity)
+                        'similarity': similarity
                     }
             
-            return best_match
+            return None
             
         except Exception as e:
             logger.error(f"Error finding similar vector: {e}")
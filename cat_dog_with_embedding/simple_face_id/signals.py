@@ -0,0 +1,87 @@
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from face_recognition.models import EmbeddingChangeLog, ReembeddingJob
+from face_recognition.signals import embedding_model_activated
+from .models import ClusteringRun, FaceProject, FaceVector
+from .project_search import forget_project_vectors
+
+
+@receiver(post_save, sender=FaceVector)
+def log_face_vector_save(sender, instance, **kwargs):
+    """Record the write so other workers' indexes pick it up"""
+    EmbeddingChangeLog.record('face_vector', [instance.pk], 'upsert')
+    forget_project_vectors(instance.project_id)
+
+
+@receiver(post_delete, sender=FaceVector)
+def log_face_vector_delete(sender, instance, **kwargs):
+    """Record a tombstone for a deleted face vector"""
+    EmbeddingChangeLog.record('face_vector', [instance.pk], 'delete')
+    forget_project_vectors(instance.project_id)
+
+
+def is_searchable(project: FaceProject) -> bool:
+    """Only completed projects with a centroid are in the face_project index"""
+    return project.status == 'completed' and bool(project.centroid_vector)
+
+
+@receiver(post_init, sender=FaceProject)
+def remember_project_state(sender, instance, **kwargs):
+    """Keep the loaded species and searchability so saves need not re-read them"""
+    fields = instance.__dict__
+    if 'species' in fields:
+        instance._stored_species = fields['species']
+    if 'status' in fields and 'centroid_vector' in fields:
+        instance._stored_searchable = is_searchable(instance)
+
+
+@receiver(post_save, sender=FaceProject)
+def log_project_save(sender, instance, created, update_fields=None, **kwargs):
+    """Record the project centroid write; only completed projects are searchable"""
+    if update_fields is not None and not {'status', 'centroid_vector'} & set(update_fields):
+        return
+    
+    searchable = is_searchable(instance)
+    # A project that was never searchable has nothing to tombstone (e.g. every
+    # save of a registration while it is processing)
+    if searchable or (not created and getattr(instance, '_stored_searchable', True)):
+        EmbeddingChangeLog.record('face_project', [instance.pk], 'upsert' if searchable else 'delete')
+    instance._stored_searchable = searchable
+
+
+@receiver(post_delete, sender=FaceProject)
+def log_project_delete(sender, instance, **kwargs):
+    """Record a tombstone for a deleted project"""
+    EmbeddingChangeLog.record('face_project', [instance.pk], 'delete')
+
+
+@receiver(pre_save, sender=FaceProject)
+def remember_project_species(sender, instance, update_fields=None, **kwargs):
+    """Read the stored species when the loaded one is unknown or may be stale, so post_save can tell whether it changed"""
+    if update_fields is not None and 'species' not in update_fields:
+        return
+    
+    if instance._state.adding:
+        instance._stored_species = None
+    elif update_fields is not None or not hasattr(instance, '_stored_species'):
+        instance._stored_species = FaceProject.objects.filter(pk=instance.pk).values_list('species', flat=True).first()
+
+
+@receiver(post_save, sender=FaceProject)
+def log_project_species_change(sender, instance, created, update_fields=None, **kwargs):
+    """Move the project's vectors to their new pet type partition"""
+    if created or (update_fields is not None and 'species' not in update_fields):
+        return
+    
+    if instance.species != getattr(instance, '_stored_species', None):
+        object_ids = list(instance.face_vectors.values_list('pk', flat=True))
+        if object_ids:
+            EmbeddingChangeLog.record('face_vector', object_ids, 'upsert')
+    instance._stored_species = instance.species
+
+
+@receiver(embedding_model_activated, sender=ReembeddingJob)
+def retire_clustering_runs(sender, job, **kwargs):
+    """IVF centroids trained on the old model's vectors no longer partition the new ones"""
+    ClusteringRun.objects.filter(status__in=['assigning', 'active']).update(status='retired')
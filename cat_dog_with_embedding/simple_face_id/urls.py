@@ -7,6 +7,7 @@ urlpatterns = [
     # Main API endpoints
     path('register/', views.FaceRegistrationView.as_view(), name='register'),
     path('search/', views.FaceSimilaritySearchView.as_view(), name='search'),
+    path('verify/', views.FaceVerificationView.as_view(), name='verify'),
     
     # Utility endpoints
     path('face-image/<path:image_path>', views.FaceImageView.as_view(), name='face-image'),
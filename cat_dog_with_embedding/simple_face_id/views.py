@@ -13,9 +13,11 @@ from .serializers import (
     FaceRegistrationSerializer, 
     FaceRegistrationResponseSerializer,
     FaceSimilaritySearchSerializer,
-    FaceSimilaritySearchResponseSerializer
+    FaceSimilaritySearchResponseSerializer,
+    FaceVerificationSerializer
 )
 from .models import FaceProject, FaceVector, SimilaritySearch
+from face_recognition.model_pool import PoolTimeout, get_pool_stats
 
 logger = logging.getLogger(__name__)
 
@@ -76,6 +78,8 @@ class FaceRegistrationView(APIView):
                 'status': result['status']
             }, status=status.HTTP_201_CREATED)
             
+        except PoolTimeout:
+            raise
         except Exception as e:
             logger.error(f"Error in face registration: {e}")
             return Response({
@@ -98,6 +102,8 @@ class FaceSimilaritySearchView(APIView):
     - name: Name of the most similar match
     - similarity_score: Similarity score (0.0 to 1.0)
     - face_image_path: Path to the matching face image
+    - matches: Top matching projects (project_id, name, similarity_score,
+      face_image_path), best first
     """
     
     permission_classes = [AllowAny]
@@ -133,9 +139,12 @@ class FaceSimilaritySearchView(APIView):
                 'name': result['name'],
                 'similarity_score': result['similarity_score'],
                 'face_image_path': result['face_image_path'],
+                'matches': result['matches'],
                 'processing_time': result['processing_time']
             }, status=status.HTTP_200_OK)
             
+        except PoolTimeout:
+            raise
         except Exception as e:
             logger.error(f"Error in similarity search: {e}")
             return Response({
@@ -144,6 +153,65 @@ class FaceSimilaritySearchView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class FaceVerificationView(APIView):
+    """
+    API endpoint for 1:1 face verification against one project
+    
+    POST /api/simple-face-id/verify/
+    
+    Request body:
+    - project_id: Project ID, as encoded in the project's QR code
+    - image: Image of the animal
+    
+    Response:
+    - similarity_score: Similarity to the project's face vectors (0.0 to 1.0)
+    - threshold: Minimum similarity to pass (FACE_VERIFICATION_THRESHOLD)
+    - verified: Whether the similarity reaches the threshold
+    - face_image_path: Path to the most similar registered face image
+    """
+    
+    permission_classes = [AllowAny]
+    
+    def post(self, request):
+        serializer = FaceVerificationSerializer(data=request.data)
+        
+        if not serializer.is_valid():
+            return Response({
+                'error': 'Invalid input data',
+                'details': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            project_id = serializer.validated_data['project_id']
+            if not FaceProject.objects.filter(project_id=project_id).exists():
+                return Response({
+                    'error': 'Project not found'
+                }, status=status.HTTP_404_NOT_FOUND)
+            
+            service = SimpleFaceIdService()
+            result = service.verify_face(project_id, serializer.validated_data['image'])
+            
+            if 'error' in result:
+                return Response({
+                    'error': result['error'],
+                    'similarity_score': result['similarity_score']
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            return Response({
+                'success': True,
+                **result
+            }, status=status.HTTP_200_OK)
+        
+        except PoolTimeout:
+            raise
+        except Exception as e:
+            logger.error(f"Error in face verification: {e}")
+            return Response({
+                'error': 'Internal server error during face verification',
+                'details': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class FaceImageView(APIView):
     """
     API endpoint to serve cropped face images
@@ -299,7 +367,8 @@ class StatsView(APIView):
                         'search_timestamp': s.search_timestamp
                     }
                     for s in recent_searches
-                ]
+                ],
+                'model_pools': get_pool_stats()
             }, status=status.HTTP_200_OK)
             
         except Exception as e: